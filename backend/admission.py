@@ -0,0 +1,167 @@
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+
+import telemetry
+from openai_dispatcher import TokenBucket
+
+# Weight of the newest request in a route's average service time
+SERVICE_TIME_WEIGHT = 0.2
+
+# How often (seconds) a waiting async request checks for a free slot
+ASYNC_POLL_INTERVAL = 0.005
+
+# Clients whose quota buckets are kept (least recently seen ones are dropped)
+MAX_TRACKED_CLIENTS = 10000
+
+requests_shed = telemetry.register(telemetry.Counter(
+    'requests_shed_total', 'Requests turned away by admission control', ('route', 'reason')))
+
+class AdmissionRejected(Exception):
+    """Raised when a request is turned away: 429 for a client over its quota,
+    503 when the route is too busy to start it within its latency budget"""
+
+    def __init__(self, message, status, retry_after):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+class ConcurrencyLimiter:
+    """At most `limit` requests of a route run at once; the rest wait for a slot.
+
+    A request is shed with AdmissionRejected (503) as soon as it arrives if the
+    queue is full or its expected wait (queue position times the route's average
+    service time) is over the latency `budget`, and otherwise once it has waited
+    that long. Waiting threads block; async requests poll, so both can share one
+    limiter.
+    """
+
+    def __init__(self, name, limit, budget, max_queue=None):
+        self.name = name
+        self.limit = limit
+        self.budget = budget
+        self.max_queue = limit * 4 if max_queue is None else max_queue
+        self.active = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.shed = 0
+        self.service_time = 0.0
+        self._cond = threading.Condition()
+
+    def _reject(self, reason, retry_after):
+        self.shed += 1
+        requests_shed.inc(route=self.name, reason=reason)
+        raise AdmissionRejected(f"'{self.name}' is overloaded ({reason})", 503, max(retry_after, self.service_time))
+
+    def _enter(self):
+        """Take a free slot (True), or check the request may queue for one (False)"""
+        if self.active < self.limit and self.waiting == 0:
+            self.active += 1
+            self.admitted += 1
+            return True
+        if self.waiting >= self.max_queue:
+            self._reject('queue_full', self.budget)
+        expected_wait = (self.waiting + 1) / self.limit * self.service_time
+        if expected_wait > self.budget:
+            self._reject('expected_wait', expected_wait)
+        return False
+
+    def acquire(self):
+        """Wait for a slot; returns the admission time to pass to release()"""
+        with self._cond:
+            if self._enter():
+                return time.monotonic()
+            self.waiting += 1
+            deadline = time.monotonic() + self.budget
+            try:
+                while self.active >= self.limit:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._reject('wait_timeout', self.budget)
+                    self._cond.wait(remaining)
+                self.active += 1
+                self.admitted += 1
+            finally:
+                self.waiting -= 1
+        return time.monotonic()
+
+    async def async_acquire(self):
+        """Async version of acquire()"""
+        with self._cond:
+            if self._enter():
+                return time.monotonic()
+            self.waiting += 1
+        deadline = time.monotonic() + self.budget
+        try:
+            while True:
+                await asyncio.sleep(ASYNC_POLL_INTERVAL)
+                with self._cond:
+                    if self.active < self.limit:
+                        self.active += 1
+                        self.admitted += 1
+                        return time.monotonic()
+                    if time.monotonic() >= deadline:
+                        self._reject('wait_timeout', self.budget)
+        finally:
+            with self._cond:
+                self.waiting -= 1
+
+    def release(self, admitted_at):
+        """Free a slot, folding the request's duration into the average service time"""
+        duration = time.monotonic() - admitted_at
+        with self._cond:
+            self.active -= 1
+            self.service_time += SERVICE_TIME_WEIGHT * (duration - self.service_time)
+            self._cond.notify()
+
+    def stats(self):
+        with self._cond:
+            return {
+                'active': self.active,
+                'waiting': self.waiting,
+                'limit': self.limit,
+                'admitted': self.admitted,
+                'shed': self.shed,
+                'service_time': self.service_time,
+            }
+
+class ClientQuotas:
+    """Per-client token buckets: `per_minute` units a minute, up to `burst` at once"""
+
+    def __init__(self, per_minute, burst, max_clients=MAX_TRACKED_CLIENTS):
+        self.per_minute = per_minute
+        self.burst = burst
+        self.max_clients = max_clients
+        self.buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, client, cost, route=''):
+        """Charge a client `cost` units, or raise AdmissionRejected (429) without
+        charging anything if it has to wait for them"""
+        with self._lock:
+            bucket = self.buckets.get(client)
+            if bucket is None:
+                bucket = self.buckets[client] = TokenBucket(self.burst, self.per_minute)
+                if len(self.buckets) > self.max_clients:
+                    self.buckets.popitem(last=False)
+            else:
+                self.buckets.move_to_end(client)
+            now = time.monotonic()
+            start = bucket.start_time(cost, now)
+            if start <= now:
+                bucket.reserve(cost, now)
+                return
+        requests_shed.inc(route=route, reason='client_quota')
+        raise AdmissionRejected("Client request quota exceeded", 429, start - now)
+
+    def refund(self, client, cost):
+        """Give back units charged for a request that was then shed"""
+        with self._lock:
+            bucket = self.buckets.get(client)
+            if bucket is not None:
+                bucket.adjust(-min(cost, bucket.capacity))
+
+    def stats(self):
+        with self._lock:
+            return {'clients': len(self.buckets)}
@@ -0,0 +1,102 @@
+import hashlib
+import json
+import random
+import re
+import time
+
+from sqlite_cache import SQLiteCache
+
+# Default lifetime (seconds) and size bound of the answer cache
+ANSWER_TTL = 6 * 3600
+ANSWER_MAX_ENTRIES = 2000
+
+# MinHash signature length used for near-duplicate lookups
+SIGNATURE_SIZE = 64
+
+MERSENNE_PRIME = (1 << 61) - 1
+_rng = random.Random(1337)
+HASH_PARAMS = [
+    (_rng.randrange(1, MERSENNE_PRIME), _rng.randrange(0, MERSENNE_PRIME))
+    for _ in range(SIGNATURE_SIZE)
+]
+
+def normalize_question(question):
+    """Lowercase a question and strip punctuation and extra whitespace"""
+    question = re.sub(r'[^\w\s]', ' ', question.lower())
+    return ' '.join(question.split())
+
+def make_answer_key(question, context):
+    """Key of a question about a daily image set, the same for every wording that normalizes alike"""
+    return hashlib.sha256(f"{context}\0{normalize_question(question)}".encode('utf-8')).hexdigest()
+
+def get_shingles(text):
+    """Character 3-grams of normalized text (padded so short questions still shingle)"""
+    text = f" {text} "
+    return {text[i:i + 3] for i in range(max(1, len(text) - 2))}
+
+def make_signature(text):
+    """MinHash signature of a normalized question"""
+    hashes = [
+        int.from_bytes(hashlib.blake2b(shingle.encode('utf-8'), digest_size=8).digest(), 'big')
+        for shingle in get_shingles(text)
+    ]
+    return [min((a * h + b) % MERSENNE_PRIME for h in hashes) for a, b in HASH_PARAMS]
+
+def estimate_similarity(signature, other):
+    """Estimated Jaccard similarity of two questions from their signatures"""
+    return sum(1 for x, y in zip(signature, other) if x == y) / len(signature)
+
+class AnswerCache(SQLiteCache):
+    """Answers to /api/ask stored in SQLite per daily image set, with TTL and LRU eviction.
+
+    Exact lookups use the normalized question. With a `similarity` threshold,
+    questions whose MinHash signatures are close enough also hit.
+    """
+
+    table = 'answers'
+    columns = (
+        ('context', 'TEXT NOT NULL'), ('question', 'TEXT NOT NULL'),
+        ('signature', 'TEXT NOT NULL'), ('answer', 'TEXT NOT NULL'),
+    )
+    indexes = (('context', 'context, created_at'),)
+
+    def __init__(self, path, ttl=ANSWER_TTL, max_entries=ANSWER_MAX_ENTRIES, similarity=None):
+        super().__init__(path, ttl, max_entries)
+        self.similarity = similarity
+
+    def get(self, question, context):
+        """Return a cached answer for a question about a daily image set, or None"""
+        normalized = normalize_question(question)
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            row = conn.execute(
+                'SELECT key, answer FROM answers WHERE key = ? AND created_at > ?',
+                (make_answer_key(question, context), now - self.ttl)
+            ).fetchone()
+
+            if row is None and self.similarity:
+                signature = make_signature(normalized)
+                best = 0
+                for key, answer, stored in conn.execute(
+                    'SELECT key, answer, signature FROM answers WHERE context = ? AND created_at > ?',
+                    (context, now - self.ttl)
+                ):
+                    score = estimate_similarity(signature, json.loads(stored))
+                    if score >= self.similarity and score > best:
+                        best, row = score, (key, answer)
+
+            if row is None:
+                return None
+            self._touch(conn, row[0], now)
+            return row[1]
+
+    def put(self, question, context, answer):
+        """Store an answer, evicting expired and least recently used entries"""
+        normalized = normalize_question(question)
+        self.put_row(make_answer_key(question, context), {
+            'context': context,
+            'question': normalized,
+            'signature': json.dumps(make_signature(normalized)),
+            'answer': answer,
+        })
@@ -1,25 +1,273 @@
-from flask import Flask, request, jsonify, send_file
+from flask import Blueprint, Flask, request, jsonify, make_response, url_for, Response, stream_with_context, g
+from werkzeug.exceptions import RequestedRangeNotSatisfiable
+from werkzeug.http import is_resource_modified
+from werkzeug.wsgi import wrap_file
+from werkzeug.middleware.proxy_fix import ProxyFix
 from flask_cors import CORS
-import openai
 import os
-import requests
 import random
 from dotenv import load_dotenv
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
+from concurrent.futures import Future, ThreadPoolExecutor, wait, FIRST_COMPLETED
+import threading
 import json
+import hashlib
+import time
+import re
+import math
+import logging
+import functools
+
+import http_client
+import telemetry
+from admission import AdmissionRejected, ClientQuotas, ConcurrencyLimiter
+from http_client import CircuitOpenError
+from file_utils import atomic_write, FileLock
+from answer_cache import AnswerCache, make_answer_key, ANSWER_TTL
+from daily_archive import DailyArchive, ARCHIVE_PAGE_SIZE
+from daily_sources import DailySourceCache
+from description_cache import DescriptionCache, make_description_key, DESCRIPTION_TTL
+from generation_cache import GenerationCache, make_generation_key, GENERATION_TTL
+from image_store import ImageStore
+from image_pool import ImagePool
+from met_index import MetIndex, MET_API_BASE, MET_SEARCH_TERMS
+from openai_dispatcher import OpenAIDispatcher, OpenAIOverloadedError, estimate_chat_tokens
+from tiered_cache import make_cache
+from image_variants import sniff_image_mimetype, schedule_variants, forget_variants, get_variant_manifest, choose_variant
 
 # Load environment variables
 load_dotenv()
 
-app = Flask(__name__)
-CORS(app)
+# Log records are written by a background thread, never on the request thread
+telemetry.setup_logging()
+logger = logging.getLogger(__name__)
+
+# Every route, hook and CLI command; create_app() builds the Flask app around them
+api = Blueprint('api', __name__, cli_group=None)
+
+# The OpenAI library (and aiohttp under it) is most of this module's import time,
+# so it is imported and configured on first use, see get_openai()
+openai = None
+openai_lock = threading.Lock()
+
+# All OpenAI calls go through one dispatcher that enforces our request and token rate
+# limits and turns away calls it can't start within OPENAI_QUEUE_DEADLINE seconds
+openai_dispatcher = OpenAIDispatcher(
+    rpm=int(os.getenv('OPENAI_RPM', '500')),
+    tpm=int(os.getenv('OPENAI_TPM', '90000')),
+    max_queue=int(os.getenv('OPENAI_MAX_QUEUE', '50')),
+    deadline=float(os.getenv('OPENAI_QUEUE_DEADLINE', '10'))
+)
 
-# Configure OpenAI
-openai.api_key = os.getenv('OPENAI_API_KEY')
+# Admission control for the expensive routes, so they can't take every worker from
+# the cheap cached ones. Each route runs at most its concurrency at once per process;
+# a request that would wait longer than ADMISSION_LATENCY_BUDGET seconds for a slot
+# is shed with a 503. Each client also gets a per-minute quota of cost units across
+# these routes and a 429 once it is used up.
+ADMISSION_LATENCY_BUDGET = float(os.getenv('ADMISSION_LATENCY_BUDGET', '1'))
+route_limiters = {
+    'ask': ConcurrencyLimiter('ask', int(os.getenv('ASK_CONCURRENCY', '4')), ADMISSION_LATENCY_BUDGET),
+    'search-image': ConcurrencyLimiter('search-image', int(os.getenv('SEARCH_CONCURRENCY', '4')), ADMISSION_LATENCY_BUDGET),
+    'generate-image': ConcurrencyLimiter('generate-image', int(os.getenv('GENERATE_CONCURRENCY', '2')), ADMISSION_LATENCY_BUDGET),
+}
+# The async app's routes hold no thread while they wait on upstreams, so they get
+# their own, much larger pools (see async_app)
+async_route_limiters = {
+    'ask': ConcurrencyLimiter('ask-async', int(os.getenv('ASYNC_ASK_CONCURRENCY', '200')), ADMISSION_LATENCY_BUDGET),
+    'search-image': ConcurrencyLimiter('search-image-async', int(os.getenv('ASYNC_SEARCH_CONCURRENCY', '200')), ADMISSION_LATENCY_BUDGET),
+    'generate-image': ConcurrencyLimiter('generate-image-async', int(os.getenv('ASYNC_GENERATE_CONCURRENCY', '50')), ADMISSION_LATENCY_BUDGET),
+}
+client_quotas = ClientQuotas(
+    per_minute=int(os.getenv('CLIENT_QUOTA_PER_MINUTE', '60')),
+    burst=int(os.getenv('CLIENT_QUOTA_BURST', '20'))
+)
+# Quota cost of a request per route (a batch search costs one per item)
+ROUTE_COSTS = {'ask': 1, 'search-image': 1, 'generate-image': 5}
+
+# Behind one reverse proxy, take the client address (and scheme and host, for external
+# URLs) from the X-Forwarded-* values that proxy appended. Earlier X-Forwarded-For
+# entries come from the client and are ignored, so they can't dodge client quotas.
+TRUST_FORWARDED_FOR = os.getenv('TRUST_FORWARDED_FOR') == '1'
 
 # Daily images directory
 DAILY_IMAGES_DIR = 'backend/daily_images'
 
+# Content-addressed store for every downloaded image. Images returned by
+# /api/search-image live only here; the per-day files in DAILY_IMAGES_DIR are hard
+# links into it. Old and least recently used images are evicted past the quota.
+IMAGE_STORE_DIR = 'backend/image_store'
+image_store = ImageStore(
+    IMAGE_STORE_DIR,
+    max_bytes=int(os.getenv('IMAGE_STORE_MAX_MB', '1024')) * 1024 * 1024,
+    max_age=int(os.getenv('IMAGE_STORE_MAX_AGE_DAYS', '30')) * 24 * 3600,
+    daily_dir=DAILY_IMAGES_DIR,
+    daily_retention_days=int(os.getenv('DAILY_IMAGES_RETENTION_DAYS', '30'))
+)
+
+# Upstream API endpoints; overridable so tests and benchmarks can point them at a local server
+NASA_API_BASE = os.getenv('NASA_API_BASE', 'https://api.nasa.gov')
+NATGEO_API_URL = os.getenv('NATGEO_API_URL', 'https://natgeoapi.herokuapp.com/api/dailyphoto')
+ARTIC_API_BASE = os.getenv('ARTIC_API_BASE', 'https://api.artic.edu/api/v1')
+ARTIC_IIIF_BASE = os.getenv('ARTIC_IIIF_BASE', 'https://www.artic.edu/iiif/2')
+JWST_API_BASE = os.getenv('JWST_API_BASE', 'https://api.jwstapi.com')
+UNSPLASH_API_BASE = os.getenv('UNSPLASH_API_BASE', 'https://api.unsplash.com')
+UNSPLASH_IMAGES_BASE = os.getenv('UNSPLASH_IMAGES_BASE', 'https://images.unsplash.com')
+
+UNSPLASH_SEARCH_URL = f"{UNSPLASH_API_BASE}/search/photos"
+
+# Unsplash queries used for the 'earth' category
+NATURE_SEARCH_TERMS = [
+    "pristine nature landscape", 
+    "mountain wilderness", 
+    "forest waterfall", 
+    "dramatic landscape", 
+    "natural scenery",
+    "wildlife nature",
+    "scenic landscape",
+    "nature photography"
+]
+
+# Cache the routes share with every other replica: an in-process LRU tier in front
+# of a Redis-compatible server at CACHE_URL (e.g. redis://cache:6379/0), so one
+# replica's upstream fetches and OpenAI results serve them all. Without CACHE_URL
+# only the in-process tier is used.
+CACHE_URL = os.getenv('CACHE_URL')
+shared_cache = make_cache(CACHE_URL)
+
+# Lifetime (seconds) of image bytes shared between replicas; a replica copies them
+# into its own image store on first use
+SHARED_IMAGE_TTL = 2 * 24 * 3600
+
+# Vision-model descriptions cached by image content, so repeated images skip the model
+DESCRIPTION_CACHE_PATH = 'backend/cache/descriptions.sqlite3'
+description_cache = DescriptionCache(DESCRIPTION_CACHE_PATH)
+
+# Local index of Met Museum artworks, refreshed in the background
+MET_INDEX_PATH = 'backend/cache/met_index.json'
+met_index = MetIndex(MET_INDEX_PATH, cache=shared_cache)
+
+# Answers to /api/ask cached per question and daily image set. Set ANSWER_CACHE_SIMILARITY
+# (e.g. 0.8) to also reuse answers for near-duplicate questions.
+ANSWER_CACHE_PATH = 'backend/cache/answers.sqlite3'
+ANSWER_CACHE_SIMILARITY = float(os.getenv('ANSWER_CACHE_SIMILARITY', '0')) or None
+answer_cache = AnswerCache(ANSWER_CACHE_PATH, similarity=ANSWER_CACHE_SIMILARITY)
+
+# Images from /api/generate-image, keyed by normalized prompt and size and kept in the
+# image store, so a repeated prompt is served without generating it again
+GENERATION_CACHE_PATH = 'backend/cache/generations.sqlite3'
+generation_cache = GenerationCache(GENERATION_CACHE_PATH)
+
+IMAGE_MODEL = "dall-e-2"
+IMAGE_SIZES = ('256x256', '512x512', '1024x1024')
+DEFAULT_IMAGE_SIZE = '1024x1024'
+
+# Running generation per prompt key, so concurrent identical prompts share one, and
+# how long (seconds) a request waits for a generation another request started
+image_generations = {}
+image_generations_lock = threading.Lock()
+IMAGE_GENERATION_WAIT = 120
+
+# Generated images are content-addressed, so their URLs can be cached like dated ones
+CONTENT_HASH = re.compile(r'[0-9a-f]{64}')
+
+ASK_MODEL = "gpt-3.5-turbo"
+ASK_SYSTEM_PROMPT = "You are an image retrieval assistant and a college level professor that explains the interesting or important facts of the image that you retrieve. you only explain images that you've retrieved."
+
+VISION_MODEL = "gpt-4-vision-preview"
+VISION_SYSTEM_PROMPT = "You are a precise image analyzer. Describe exactly what you see in the image, focusing on the main subject and key details. Do not make assumptions or add details that aren't visible. If you see a specific subject (like a cat, person, or landscape), start by identifying it clearly."
+VISION_USER_PROMPT = "What do you see in this image? Provide a clear, accurate description of what is actually visible in the image."
+
+# Prefetched images kept ready per /api/search-image category
+IMAGE_POOL_CATEGORIES = ('space', 'art', 'earth')
+IMAGE_POOL_SIZE = int(os.getenv('IMAGE_POOL_SIZE', '3'))
+image_pool = None
+image_pool_lock = threading.Lock()
+
+# /api/search-images batches: most items per request, the time budget (seconds) for
+# the whole batch, and the shared pool that runs their items concurrently
+SEARCH_BATCH_MAX_ITEMS = 6
+SEARCH_BATCH_DEADLINE = float(os.getenv('SEARCH_BATCH_DEADLINE', '25'))
+search_batch_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv('SEARCH_BATCH_WORKERS', '12')), thread_name_prefix='search-batch')
+
+# Time budget (seconds) a request waits for the daily sources when nothing at all
+# is cached yet. Sources that miss it keep running and show up on later requests.
+DAILY_FETCH_DEADLINE = float(os.getenv('DAILY_FETCH_DEADLINE', '20'))
+
+# Shared pool for the daily source fetches (metadata call + download per source)
+daily_fetch_executor = ThreadPoolExecutor(max_workers=6, thread_name_prefix='daily-fetch')
+
+# Serializes read-modify-write of the daily data file between source refreshes
+daily_data_lock = threading.Lock()
+
+# Last good result of each daily source. A source is refetched in the background
+# once it is stale (from a previous day or older than its TTL); until then, and
+# while a failed source is held off for its negative TTL, the last good value is served.
+DAILY_SOURCES_PATH = 'backend/cache/daily_sources.json'
+DAILY_SOURCE_TTLS = {
+    'space': 6 * 3600,    # APOD turns over on US Eastern time, so recheck during the day
+    'earth': 12 * 3600,
+    'art': 24 * 3600,
+}
+DAILY_SOURCE_NEGATIVE_TTLS = {
+    'space': 300,
+    'earth': 900,
+    'art': 300,
+}
+daily_sources = DailySourceCache(DAILY_SOURCES_PATH, DAILY_SOURCE_TTLS, DAILY_SOURCE_NEGATIVE_TTLS)
+
+# Running refetch per source, so concurrent requests start at most one each
+daily_refreshes = {}
+daily_refreshes_lock = threading.Lock()
+
+# Every day's daily set, indexed by date for /api/daily-images?date= and range queries
+DAILY_ARCHIVE_PATH = 'backend/archive/daily_images.sqlite3'
+daily_archive = DailyArchive(DAILY_ARCHIVE_PATH)
+
+# Browser cache lifetime (seconds) of a past day's set
+ARCHIVE_MAX_AGE = 24 * 3600
+
+# Image route names of the daily categories
+DAILY_IMAGE_TYPES = {'nasa': 'space', 'natgeo': 'earth', 'art': 'art'}
+
+# Pre-serialized daily payload per date, so cache hits skip rebuilding and JSON encoding
+daily_payload_cache = {}
+daily_payload_cache_lock = threading.Lock()
+
+# How often (seconds) a payload with stale sources is rebuilt, to pick up sources
+# refetched in the background or by another worker
+PARTIAL_PAYLOAD_RECHECK = 30
+
+# Scheduled pre-warm of the daily set: seconds after midnight it runs, backoff
+# (seconds) between retries of failed sources, and how long it keeps retrying
+DAILY_PREWARM_ENABLED = os.getenv('DAILY_PREWARM', '1') != '0'
+DAILY_PREWARM_OFFSET = int(os.getenv('DAILY_PREWARM_OFFSET', '60'))
+DAILY_PREWARM_RETRY_BASE = 30
+DAILY_PREWARM_RETRY_MAX = 600
+DAILY_PREWARM_MAX_DURATION = int(os.getenv('DAILY_PREWARM_MAX_DURATION', '1800'))
+daily_prewarm_thread = None
+
+# Size, mtime and content hash of served image files, so serving needs no stat or hashing
+image_file_index = {}
+image_file_index_lock = threading.Lock()
+
+# Browser cache lifetime for image URLs whose content never changes: generated
+# images by hash, and dated daily images whose ?v= names their content. A day's
+# file can be refetched during that day, so without a matching ?v= it is revalidated.
+DATED_IMAGE_MAX_AGE = 365 * 24 * 3600
+IMAGE_VERSION_LENGTH = 16
+
+def get_openai():
+    """The OpenAI library, imported and given our API key on first use"""
+    global openai
+    if openai is None:
+        with openai_lock:
+            if openai is None:
+                import openai as library
+                library.api_key = os.getenv('OPENAI_API_KEY')
+                openai = library
+    return openai
+
 def create_daily_images_directory():
     """Create the daily images directory if it doesn't exist"""
     if not os.path.exists(DAILY_IMAGES_DIR):
@@ -29,20 +277,25 @@ def get_today_date():
     """Get today's date in YYYY-MM-DD format"""
     return datetime.now().strftime('%Y-%m-%d')
 
+def get_yesterday_date():
+    """Get yesterday's date in YYYY-MM-DD format"""
+    return (datetime.now() - timedelta(days=1)).strftime('%Y-%m-%d')
+
 def download_image(url, filename):
     """Download an image from URL and save it locally"""
     try:
-        response = requests.get(url, stream=True, timeout=30)
+        response = http_client.get(url, stream=True)
         response.raise_for_status()
         
         filepath = os.path.join(DAILY_IMAGES_DIR, filename)
-        with open(filepath, 'wb') as f:
-            for chunk in response.iter_content(chunk_size=8192):
-                f.write(chunk)
+        
+        # Validated, hashed and atomically moved into place, so readers never see a partial image
+        stored = image_store.ingest(response, filepath)
+        index_image_file(filepath, stored['sha256'])
         
         return filepath
     except Exception as e:
-        print(f"Error downloading image: {e}")
+        logger.warning("Error downloading image: %s", e)
         return None
 
 def fetch_nasa_image():
@@ -50,11 +303,11 @@ def fetch_nasa_image():
     try:
         nasa_api_key = os.getenv('NASA_API')
         if not nasa_api_key:
-            print("NASA API key not found")
+            logger.warning("NASA API key not found")
             return None
         
-        url = f"https://api.nasa.gov/planetary/apod?api_key={nasa_api_key}"
-        response = requests.get(url, timeout=30)
+        url = f"{NASA_API_BASE}/planetary/apod?api_key={nasa_api_key}"
+        response = http_client.get(url)
         response.raise_for_status()
         
         data = response.json()
@@ -71,6 +324,7 @@ def fetch_nasa_image():
                     return {
                         'type': 'space',
                         'image_path': filepath,
+                        'image_url': f"/api/daily-images/nasa/{today}",
                         'description': data.get('explanation', ''),
                         'title': data.get('title', ''),
                         'date': today
@@ -78,14 +332,14 @@ def fetch_nasa_image():
         
         return None
     except Exception as e:
-        print(f"Error fetching NASA image: {e}")
+        logger.warning("Error fetching NASA image: %s", e)
         return None
 
 def fetch_natgeo_image():
     """Fetch National Geographic daily photo"""
     try:
-        url = "https://natgeoapi.herokuapp.com/api/dailyphoto"
-        response = requests.get(url, timeout=30)
+        url = NATGEO_API_URL
+        response = http_client.get(url)
         response.raise_for_status()
         
         data = response.json()
@@ -106,6 +360,7 @@ def fetch_natgeo_image():
                 return {
                     'type': 'earth',
                     'image_path': filepath,
+                    'image_url': f"/api/daily-images/natgeo/{today}",
                     'description': data.get('description', ''),
                     'title': data.get('alt', ''),
                     'credit': data.get('credit', ''),
@@ -114,7 +369,7 @@ def fetch_natgeo_image():
         
         return None
     except Exception as e:
-        print(f"Error fetching National Geographic image: {e}")
+        logger.warning("Error fetching National Geographic image: %s", e)
         return None
 
 def fetch_art_image():
@@ -125,8 +380,8 @@ def fetch_art_image():
         random_page = random.randint(1, 100)
         
         # Get artworks with images only
-        url = f"https://api.artic.edu/api/v1/artworks?limit=10&page={random_page}&fields=id,title,image_id,artist_display,date_display,thumbnail,artist_title"
-        response = requests.get(url, timeout=30)
+        url = f"{ARTIC_API_BASE}/artworks?limit=10&page={random_page}&fields=id,title,image_id,artist_display,date_display,thumbnail,artist_title"
+        response = http_client.get(url)
         response.raise_for_status()
         
         data = response.json()
@@ -142,7 +397,7 @@ def fetch_art_image():
                 
                 if image_id:
                     # Construct image URL
-                    image_url = f"https://www.artic.edu/iiif/2/{image_id}/full/843,/0/default.jpg"
+                    image_url = f"{ARTIC_IIIF_BASE}/{image_id}/full/843,/0/default.jpg"
                     
                     today = get_today_date()
                     filename = f"art_{today}.jpg"
@@ -152,6 +407,7 @@ def fetch_art_image():
                         return {
                             'type': 'art',
                             'image_path': filepath,
+                            'image_url': f"/api/daily-images/art/{today}",
                             'description': f"Artist: {artwork.get('artist_display', 'Unknown')}, Date: {artwork.get('date_display', 'Unknown')}",
                             'title': artwork.get('title', 'Untitled'),
                             'artist': artwork.get('artist_title', 'Unknown'),
@@ -160,28 +416,27 @@ def fetch_art_image():
         
         return None
     except Exception as e:
-        print(f"Error fetching Art Institute image: {e}")
+        logger.warning("Error fetching Art Institute image: %s", e)
         return None
 
-def save_daily_data(data):
-    """Save daily image data to JSON file"""
+def save_daily_data(data, date=None):
+    """Save a day's daily image data to JSON file"""
     try:
-        today = get_today_date()
-        data_file = os.path.join(DAILY_IMAGES_DIR, f"daily_data_{today}.json")
+        date = date or get_today_date()
+        data_file = os.path.join(DAILY_IMAGES_DIR, f"daily_data_{date}.json")
         
-        with open(data_file, 'w') as f:
-            json.dump(data, f, indent=2)
+        atomic_write(data_file, json.dumps(data, indent=2), mode='w')
         
         return True
     except Exception as e:
-        print(f"Error saving daily data: {e}")
+        logger.error("Error saving daily data: %s", e)
         return False
 
-def load_daily_data():
-    """Load today's daily data if it exists"""
+def load_daily_data(date=None):
+    """Load a day's daily data (today by default) if it exists"""
     try:
-        today = get_today_date()
-        data_file = os.path.join(DAILY_IMAGES_DIR, f"daily_data_{today}.json")
+        date = date or get_today_date()
+        data_file = os.path.join(DAILY_IMAGES_DIR, f"daily_data_{date}.json")
         
         if os.path.exists(data_file):
             with open(data_file, 'r') as f:
@@ -189,104 +444,941 @@ def load_daily_data():
         
         return None
     except Exception as e:
-        print(f"Error loading daily data: {e}")
+        logger.error("Error loading daily data: %s", e)
         return None
 
-@app.route('/api/daily-images', methods=['GET'])
-def get_daily_images():
-    """Get today's daily images, fetching them if not already cached"""
+def get_daily_sources():
+    """Map each daily category to the function that fetches it"""
+    return {
+        'space': fetch_nasa_image,
+        'earth': fetch_natgeo_image,
+        'art': fetch_art_image,
+    }
+
+def fetch_versioned_source(fetch):
+    """Run a daily source fetch and version its image URL by the image's content"""
+    result = fetch()
+    if result:
+        info = get_image_file_info(result['image_path'])
+        if info:
+            # Version the URL by content, since the day's file is replaced if refetched
+            result['image_url'] += '?v=' + info['etag'][:IMAGE_VERSION_LENGTH]
+    return result
+
+def share_image(content_hash, path):
+    """Put an image's bytes in the shared cache, so other replicas needn't download it"""
+    if not shared_cache.shared:
+        return
+    with open(path, 'rb') as f:
+        shared_cache.set(f"image:{content_hash}", f.read(), SHARED_IMAGE_TTL, local=False)
+
+def fetch_shared_image(content_hash, filepath=None):
+    """Copy an image another replica shared into the image store (linked at `filepath`
+    if given); returns its path, or None if it isn't shared"""
+    data = shared_cache.get(f"image:{content_hash}", local=False) if shared_cache.shared else None
+    if data is None:
+        return None
+    stored = image_store.add(data, filepath)
+    if filepath:
+        index_image_file(filepath, stored['sha256'])
+    return stored['path']
+
+def ensure_stored_image(content_hash):
+    """Path of an image in the image store, copied from the shared cache if need be, or None"""
+    path = image_store.get_path(content_hash)
+    if path and os.path.exists(path):
+        return path
+    path = fetch_shared_image(content_hash)
+    if path:
+        schedule_image_variants(path)
+    return path
+
+def fetch_shared_daily_source(category):
+    """Fetch a daily source once across replicas; returns (result, when it was fetched).
+    
+    The replica that fetches it shares the result and its image through the shared
+    cache. The others copy both, and fall back to fetching themselves only if the
+    image is gone.
+    """
+    fetch = get_daily_sources()[category]
+    if not shared_cache.shared:
+        return fetch_versioned_source(fetch), None
+    
+    def fetch_and_share():
+        result = fetch_versioned_source(fetch)
+        if not result:
+            return None
+        content_hash = get_image_file_info(result['image_path'])['etag']
+        share_image(content_hash, result['image_path'])
+        return {'result': result, 'content_hash': content_hash, 'fetched_at': time.time()}
+    
+    key = f"daily_source:{category}:{get_today_date()}"
+    shared = shared_cache.get_or_set(key, fetch_and_share, DAILY_SOURCE_TTLS[category], wait=DAILY_FETCH_DEADLINE)
+    if not shared:
+        return None, None
+    
+    result = shared['result']
+    info = get_image_file_info(result['image_path'])
+    if not info or info['etag'] != shared['content_hash']:
+        # Fetched by another replica: copy its image
+        if fetch_shared_image(shared['content_hash'], result['image_path']) is None:
+            return fetch_versioned_source(fetch), None
+    return result, shared['fetched_at']
+
+def refresh_daily_source(category):
+    """Fetch one daily source and record the result, or the failure, in the source cache.
+    
+    If another worker process is fetching it, or has just fetched it, use that
+    fetch's result instead (waiting for it up to the deadline).
+    """
+    file_lock = FileLock(os.path.join(DAILY_IMAGES_DIR, f".source_{category}.lock"))
+    acquired = file_lock.acquire(timeout=DAILY_FETCH_DEADLINE)
+    daily_sources.reload()
+    if not acquired or daily_sources.fresh_for(category, get_today_date()):
+        if acquired:
+            file_lock.release()
+        result = daily_sources.get_value(category)
+        if result:
+            # Its image file was replaced by that fetch
+            forget_image_file(result['image_path'])
+        update_daily_payload(get_today_date())
+        return result
     try:
-        create_daily_images_directory()
+        try:
+            result, fetched_at = fetch_shared_daily_source(category)
+        except Exception as e:
+            logger.warning("Error fetching daily source '%s': %s", category, e)
+            result = None
         
-        # Check if we already have today's data
-        existing_data = load_daily_data()
-        if existing_data:
-            return jsonify(existing_data)
+        if not result:
+            daily_sources.record_failure(category)
+            return None
         
-        # Fetch new images for today
-        daily_data = {}
+        daily_sources.record_success(category, result, fetched_at)
+        save_daily_source(category, result)
+    finally:
+        file_lock.release()
+    
+    update_daily_payload(get_today_date())
+    # Served as the original until its variants are in
+    schedule_source_variants(category, result)
+    return result
+
+def save_daily_source(category, result):
+    """Keep a source's result in the day's file, as the record of what was served that day, and in the archive"""
+    with daily_data_lock:
+        daily_data = load_daily_data(result['date']) or {}
+        daily_data[category] = result
+        save_daily_data(daily_data, result['date'])
+    try:
+        daily_archive.put(result['date'], category, result)
+    except Exception as e:
+        logger.error("Error archiving daily source '%s': %s", category, e)
+
+def add_variant_details(category, result, manifest):
+    """Add an image's variant widths and blur placeholder to its source, unless it was refetched since"""
+    details = {
+        'placeholder': manifest['placeholder'],
+        'widths': sorted({v['width'] for v in manifest['variants']}),
+    }
+    
+    def add_details(value):
+        if value.get('image_url') != result['image_url']:
+            return None
+        return {**value, **details}
+    
+    value = daily_sources.update_value(category, add_details)
+    if value:
+        save_daily_source(category, value)
+        update_daily_payload(get_today_date())
+
+def schedule_source_variants(category, result):
+    """Build a fetched source's variants in the background, then add their details to the source"""
+    # The old variants are of the image this one replaced
+    forget_variants(result['image_path'])
+    future = schedule_image_variants(result['image_path'])
+    if future is None:
+        return None
+    
+    def add_details(done):
+        if done.exception():
+            logger.warning("Error generating image variants: %s", done.exception())
+        else:
+            # Off the process pool's result thread, as it writes files
+            daily_fetch_executor.submit(add_variant_details, category, result, done.result())
+    
+    future.add_done_callback(add_details)
+    return future
+
+def start_source_refresh(category):
+    """Start a background refetch of a source, or return the one already running"""
+    with daily_refreshes_lock:
+        future = daily_refreshes.get(category)
+        if future is None or future.done():
+            future = daily_fetch_executor.submit(refresh_daily_source, category)
+            daily_refreshes[category] = future
+        return future
+
+def refresh_stale_sources(today):
+    """Refetch the stale sources that aren't held off by a recent failure; returns their futures"""
+    return [
+        start_source_refresh(category)
+        for category in get_daily_sources() if daily_sources.needs_refresh(category, today)
+    ]
+
+def prewarm_daily_data(max_duration=None):
+    """Refetch every stale daily source ahead of requests, retrying failures with backoff.
+    
+    Each source is swapped into the served payload as soon as it arrives; requests
+    keep getting the previous value of the others meanwhile. Returns the sources
+    still not fresh when it gave up.
+    """
+    if max_duration is None:
+        max_duration = DAILY_PREWARM_MAX_DURATION
+    create_daily_images_directory()
+    give_up_at = time.monotonic() + max_duration
+    delay = DAILY_PREWARM_RETRY_BASE
+    
+    while True:
+        today = get_today_date()
+        stale = [category for category in get_daily_sources() if not daily_sources.fresh_for(category, today)]
+        if stale:
+            # Ignores the negative TTL: this loop has its own backoff
+            wait([start_source_refresh(category) for category in stale])
+            stale = [category for category in stale if not daily_sources.fresh_for(category, today)]
+        if not stale:
+            logger.info("Daily pre-warm: all sources fresh for %s", today)
+            return []
+        if time.monotonic() + delay > give_up_at:
+            logger.warning("Daily pre-warm: giving up on %s", ', '.join(stale))
+            return stale
+        logger.info("Daily pre-warm: retrying %s in %ss", ', '.join(stale), delay)
+        time.sleep(delay)
+        delay = min(delay * 2, DAILY_PREWARM_RETRY_MAX)
+
+def get_seconds_until_prewarm():
+    """Seconds until the next scheduled pre-warm, just after local midnight"""
+    now = datetime.now()
+    next_run = datetime.combine(now.date() + timedelta(days=1), datetime.min.time())
+    return (next_run - now).total_seconds() + DAILY_PREWARM_OFFSET
+
+def run_daily_prewarm():
+    """Pre-warm now, then every day just after the date rollover"""
+    while True:
+        try:
+            prewarm_daily_data()
+        except Exception as e:
+            logger.error("Daily pre-warm error: %s", e)
+        time.sleep(get_seconds_until_prewarm())
+
+def start_daily_prewarm():
+    """Start the daily pre-warm scheduler thread (once per process)"""
+    global daily_prewarm_thread
+    if not DAILY_PREWARM_ENABLED or daily_prewarm_thread is not None:
+        return
+    daily_prewarm_thread = threading.Thread(target=run_daily_prewarm, name='daily-prewarm', daemon=True)
+    daily_prewarm_thread.start()
+
+@api.cli.command('prewarm-daily')
+def prewarm_daily_command():
+    """Refresh today's daily images now (e.g. from cron): flask --app backend/app.py prewarm-daily"""
+    prewarm_daily_data()
+
+@api.cli.command('import-archive')
+def import_archive_command():
+    """Backfill the daily archive from saved daily_data JSON files: flask --app backend/app.py import-archive"""
+    added = daily_archive.import_json_files(DAILY_IMAGES_DIR)
+    print(f"Imported {added} daily image entries into {DAILY_ARCHIVE_PATH}")
+
+def cache_daily_payload(date, data, fresh_for=0):
+    """Serialize a day's payload once and keep it in memory, dropping other days.
+    
+    A payload whose sources are all fresh is kept until the first of them goes
+    stale; one with stale sources is rebuilt every PARTIAL_PAYLOAD_RECHECK seconds.
+    """
+    global daily_payload_cache
+    body = json.dumps(data, separators=(',', ':')).encode('utf-8')
+    etag = hashlib.sha1(body).hexdigest()
+    previous = daily_payload_cache.get(date)
+    entry = {
+        'date': date,
+        'body': body,
+        'etag': etag,
+        'last_modified': previous['last_modified'] if previous and previous['etag'] == etag else datetime.now(timezone.utc),
+        'expires_at': time.monotonic() + (fresh_for or PARTIAL_PAYLOAD_RECHECK),
+    }
+    with daily_payload_cache_lock:
+        # Replacing the dict invalidates every other date at the rollover
+        daily_payload_cache = {date: entry}
+    return entry
+
+def get_cached_daily_payload(date):
+    """Return the cached payload entry for a date, or None if it must be rebuilt"""
+    entry = daily_payload_cache.get(date)
+    if entry is None or time.monotonic() > entry['expires_at']:
+        return None
+    return entry
+
+def update_daily_payload(today):
+    """Rebuild the cached payload from each source's last good value"""
+    data = daily_sources.get_values()
+    if not data:
+        return None
+    fresh_for = min(daily_sources.fresh_for(category, today) for category in get_daily_sources())
+    return cache_daily_payload(today, data, fresh_for)
+
+def build_daily_payload(today):
+    """Rebuild the payload and start refetching its stale sources in the background"""
+    if not daily_sources.get_values():
+        # Carry over a set saved before the per-source cache existed
+        saved_data = load_daily_data(today) or load_daily_data(get_yesterday_date())
+        if saved_data:
+            daily_sources.seed(saved_data)
+    refresh_stale_sources(today)
+    return update_daily_payload(today)
+
+def daily_payload_response(entry):
+    """Build a JSON response for a cached payload, answering 304 when the client is current"""
+    response = Response(entry['body'], mimetype='application/json')
+    response.set_etag(entry['etag'])
+    response.last_modified = entry['last_modified']
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+def is_valid_date(value):
+    return bool(re.fullmatch(r'\d{4}-\d{2}-\d{2}', value))
+
+def archive_response(data):
+    """JSON response for archived data, with an ETag and a browser cache lifetime"""
+    response = jsonify(data)
+    response.add_etag()
+    response.cache_control.public = True
+    response.cache_control.max_age = ARCHIVE_MAX_AGE
+    return response.make_conditional(request)
+
+def expire_archived_images(date, images):
+    """A past day's {category: entry} with the image URLs removed (and 'image_expired' set)
+    once its image files were deleted after the retention period"""
+    if date >= image_store.get_daily_cutoff():
+        return images
+    return {category: {**entry, 'image_url': None, 'image_expired': True} for category, entry in images.items()}
+
+def get_archived_day(date):
+    """One past day's set from the archive"""
+    if not is_valid_date(date):
+        return jsonify({'error': 'Invalid date'}), 400
+    data = daily_archive.get_day(date)
+    if data is None:
+        return jsonify({'error': f"No daily images archived for {date}"}), 404
+    return archive_response(expire_archived_images(date, data))
+
+def get_archived_days():
+    """A page of archived days between ?from= and ?to=, newest first.
+    
+    The response's 'next_before' is passed back as ?before= to get the next page.
+    """
+    start = request.args.get('from')
+    end = request.args.get('to')
+    before = request.args.get('before')
+    if any(value and not is_valid_date(value) for value in (start, end, before)):
+        return jsonify({'error': 'Invalid date'}), 400
+    limit = request.args.get('limit', ARCHIVE_PAGE_SIZE, type=int)
+    
+    days, next_before = daily_archive.get_days(start, end, before, limit)
+    for day in days:
+        day['images'] = expire_archived_images(day['date'], day['images'])
+    return archive_response({'days': days, 'next_before': next_before})
+
+@api.route('/api/daily-images', methods=['GET'])
+def get_daily_images():
+    """Get the daily images: today's by default, serving each source's last good value
+    while stale ones refresh. ?date= gets a past day's set from the archive, and
+    ?from=/?to=/?before=/?limit= page through archived days."""
+    try:
+        today = get_today_date()
         
-        # Fetch NASA image
-        nasa_data = fetch_nasa_image()
-        if nasa_data:
-            daily_data['space'] = nasa_data
+        # Past days come from the archive
+        if any(name in request.args for name in ('from', 'to', 'before', 'limit')):
+            return get_archived_days()
+        date = request.args.get('date')
+        if date and date != today:
+            return get_archived_day(date)
         
-        # Fetch National Geographic image
-        natgeo_data = fetch_natgeo_image()
-        if natgeo_data:
-            daily_data['earth'] = natgeo_data
+        # Hot path: the payload is already in memory
+        entry = get_cached_daily_payload(today)
+        telemetry.record_cache('daily_payload', entry is not None)
+        if entry:
+            return daily_payload_response(entry)
         
-        # Fetch Art Institute image
-        art_data = fetch_art_image()
-        if art_data:
-            daily_data['art'] = art_data
+        create_daily_images_directory()
         
-        # Save the data
-        if daily_data:
-            save_daily_data(daily_data)
+        entry = build_daily_payload(today)
+        if entry:
+            return daily_payload_response(entry)
         
-        return jsonify(daily_data)
+        # Nothing fetched yet at all: wait for the first fetches, up to the deadline
+        wait(refresh_stale_sources(today), timeout=DAILY_FETCH_DEADLINE)
+        # Pick up sources another worker fetched meanwhile
+        daily_sources.reload()
+        entry = update_daily_payload(today)
+        if entry:
+            return daily_payload_response(entry)
+        return jsonify({})
         
     except Exception as e:
-        print(f"Error getting daily images: {e}")
+        logger.exception("Error getting daily images: %s", e)
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/daily-images/<image_type>', methods=['GET'])
-def serve_daily_image(image_type):
-    """Serve a daily image file"""
+def get_file_id(stat):
+    """What changes when a file is replaced or rewritten: device, inode, mtime and size"""
+    return (stat.st_dev, stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+def index_open_image_file(filepath, f, content_hash=None):
+    """Index an image file from an open file object (left at offset 0)"""
+    stat = os.fstat(f.fileno())
+    if content_hash is None:
+        sha = hashlib.sha256()
+        for chunk in iter(lambda: f.read(65536), b''):
+            sha.update(chunk)
+        content_hash = sha.hexdigest()
+        f.seek(0)
+    mimetype = sniff_image_mimetype(f.read(16))
+    f.seek(0)
+    info = {
+        'mimetype': mimetype or 'application/octet-stream',
+        'size': stat.st_size,
+        'last_modified': datetime.fromtimestamp(stat.st_mtime, timezone.utc),
+        'etag': content_hash,
+        'file_id': get_file_id(stat),
+    }
+    with image_file_index_lock:
+        image_file_index[filepath] = info
+    return info
+
+def index_image_file(filepath, content_hash=None):
+    """Record an image file's size, mtime and content hash in the in-memory index"""
+    with open(filepath, 'rb') as f:
+        return index_open_image_file(filepath, f, content_hash)
+
+def get_image_file_info(filepath):
+    """Get indexed metadata for an image file, indexing it on first use.
+    
+    A file replaced since (by another worker) is caught when it's opened to be
+    served, see image_file_response().
+    """
+    info = image_file_index.get(filepath)
+    telemetry.record_cache('image_file_index', info is not None)
+    if info is None:
+        try:
+            info = index_image_file(filepath)
+        except FileNotFoundError:
+            return None
+    return info
+
+def forget_image_file(filepath):
+    """Drop an image file from the index (e.g. after it was deleted or replaced)"""
+    with image_file_index_lock:
+        image_file_index.pop(filepath, None)
+
+def forget_variant_files(manifest):
+    """Drop an image's rebuilt variant files from the index"""
+    for variant in manifest['variants']:
+        forget_image_file(variant['path'])
+
+def schedule_image_variants(filepath):
+    """Queue variant generation for an image, dropping the files it replaces from the index"""
+    future = schedule_variants(filepath)
+    if future is None:
+        return None
+    
+    def forget(done):
+        if not done.exception():
+            forget_variant_files(done.result())
+    
+    future.add_done_callback(forget)
+    return future
+
+def image_file_response(filepath, info, max_age=None):
+    """Serve an indexed image file with ETag, 304 and Range handling"""
     try:
-        today = get_today_date()
-        filename = f"{image_type}_{today}.jpg"
+        f = open(filepath, 'rb')
+    except FileNotFoundError:
+        forget_image_file(filepath)
+        return None
+    # The one check per request that the file wasn't replaced since it was indexed
+    if get_file_id(os.fstat(f.fileno())) != info['file_id']:
+        info = index_open_image_file(filepath, f)
+    
+    if not is_resource_modified(request.environ, etag=info['etag'], last_modified=info['last_modified']):
+        f.close()
+        response = Response(status=304)
+    else:
+        response = Response(wrap_file(request.environ, f), mimetype=info['mimetype'], direct_passthrough=True)
+        response.content_length = info['size']
+    
+    response.set_etag(info['etag'])
+    response.last_modified = info['last_modified']
+    if max_age:
+        response.cache_control.public = True
+        response.cache_control.max_age = max_age
+        response.cache_control.immutable = True
+    else:
+        response.cache_control.no_cache = True
+    
+    if response.status_code == 304:
+        return response
+    try:
+        return response.make_conditional(request, accept_ranges=True, complete_length=info['size'])
+    except RequestedRangeNotSatisfiable as e:
+        response.close()
+        return e.get_response()
+
+def is_current_image_version(filepath):
+    """Whether the request's ?v= names the image file's current content"""
+    version = request.args.get('v')
+    info = get_image_file_info(filepath) if version else None
+    return bool(info) and info['etag'][:IMAGE_VERSION_LENGTH] == version
+
+def choose_image_file(filepath):
+    """The file to serve for an image: a resized variant if the request's ?w= or Accept calls for one"""
+    width = request.args.get('w', type=int)
+    accept = request.headers.get('Accept', '')
+    if width or 'image/webp' in accept or 'image/avif' in accept:
+        manifest = get_variant_manifest(filepath)
+        variant = manifest and choose_variant(manifest, width, accept)
+        if variant:
+            return variant['path']
+    return filepath
+
+@api.route('/api/daily-images/<image_type>', methods=['GET'])
+@api.route('/api/daily-images/<image_type>/<date>', methods=['GET'])
+def serve_daily_image(image_type, date=None):
+    """Serve a daily image file; date-stamped URLs whose ?v= matches the file's
+    content are cacheable for a long time.
+    
+    A resized WebP/AVIF/JPEG variant is served instead of the original when the
+    client asks for a width with ?w= or accepts a modern format.
+    """
+    try:
+        if date is not None and not is_valid_date(date):
+            return jsonify({'error': 'Invalid date'}), 400
+        
+        filename = f"{image_type}_{date or get_today_date()}.jpg"
         filepath = os.path.join(DAILY_IMAGES_DIR, filename)
+        if date is None and filepath not in image_file_index:
+            # Today's image may not be in yet: serve the source's last good one
+            last_good = daily_sources.get_value(DAILY_IMAGE_TYPES.get(image_type))
+            if last_good:
+                filepath = last_good['image_path']
         
-        if os.path.exists(filepath):
-            return send_file(filepath, mimetype='image/jpeg')
-        else:
-            return jsonify({'error': 'Image not found'}), 404
+        max_age = DATED_IMAGE_MAX_AGE if date and is_current_image_version(filepath) else None
+        filepath = choose_image_file(filepath)
+        info = get_image_file_info(filepath)
+        if info:
+            response = image_file_response(filepath, info, max_age)
+            if response:
+                response.vary.add('Accept')
+                return response
+        
+        return jsonify({'error': 'Image not found'}), 404
+            
+    except Exception as e:
+        logger.exception("Error serving daily image: %s", e)
+        return jsonify({'error': str(e)}), 500
+
+@api.route('/api/generated-images/<content_hash>', methods=['GET'])
+def serve_generated_image(content_hash):
+    """Serve a generated image from the image store (with variants, like daily images)"""
+    try:
+        filepath = ensure_stored_image(content_hash) if CONTENT_HASH.fullmatch(content_hash) else None
+        if filepath:
+            image_store.touch(content_hash)
+            filepath = choose_image_file(filepath)
+            info = get_image_file_info(filepath)
+            if info:
+                response = image_file_response(filepath, info, DATED_IMAGE_MAX_AGE)
+                if response:
+                    response.vary.add('Accept')
+                    return response
+        
+        return jsonify({'error': 'Image not found'}), 404
             
     except Exception as e:
-        print(f"Error serving daily image: {e}")
+        logger.exception("Error serving generated image: %s", e)
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/ask', methods=['POST'])
+def build_ask_request(question):
+    """Build the chat completion arguments for a question to /api/ask"""
+    return {
+        'model': ASK_MODEL,
+        'messages': [
+            {"role": "system", "content": ASK_SYSTEM_PROMPT},
+            {"role": "user", "content": question}
+        ],
+        'max_tokens': 150,
+        'temperature': 0.7
+    }
+
+def wants_stream(args, accept):
+    """Whether a client asked for a streamed (server-sent events) answer"""
+    return args.get('stream') in ('1', 'true') or 'text/event-stream' in (accept or '')
+
+def format_sse(data, event=None):
+    """Encode one server-sent event"""
+    message = f"event: {event}\n" if event else ''
+    return message + f"data: {json.dumps(data)}\n\n"
+
+def get_stream_token(chunk):
+    """Extract the text of one streamed chat completion chunk"""
+    if chunk.choices:
+        return chunk.choices[0].get('delta', {}).get('content') or ''
+    return ''
+
+def get_answer_context():
+    """Identify the current daily image set that questions are asked about"""
+    today = get_today_date()
+    entry = daily_payload_cache.get(today)
+    return entry['etag'] if entry else today
+
+def get_cached_answer(question, context):
+    """Look up a cached answer in the shared cache, then on disk (where near-duplicate
+    questions can match too), treating cache errors as a miss"""
+    key = f"answer:{make_answer_key(question, context)}"
+    answer = shared_cache.get(key)
+    if answer is None:
+        try:
+            answer = answer_cache.get(question, context)
+        except Exception as cache_error:
+            logger.warning("Answer cache error: %s", cache_error)
+        if answer is not None:
+            shared_cache.set(key, answer, ANSWER_TTL)
+    telemetry.record_cache('answer', answer is not None)
+    return answer
+
+def cache_answer(question, context, answer):
+    """Store an answer in the shared cache and on disk, ignoring cache errors"""
+    shared_cache.set(f"answer:{make_answer_key(question, context)}", answer, ANSWER_TTL)
+    try:
+        with telemetry.span('disk_write', target='answer_cache'):
+            answer_cache.put(question, context, answer)
+    except Exception as cache_error:
+        logger.warning("Answer cache error: %s", cache_error)
+
+def stream_cached_answer(answer):
+    """Yield a cached answer as the same events a live stream produces"""
+    yield format_sse({'token': answer})
+    yield format_sse({'answer': answer}, event='done')
+
+def create_chat_completion(request_args, **extra):
+    """Call the chat completion API through the OpenAI dispatcher"""
+    # Labelled by model, which tells chat and vision calls apart
+    with telemetry.span('openai', target=request_args['model']):
+        return openai_dispatcher.call(
+            get_openai().ChatCompletion.create,
+            tokens=estimate_chat_tokens(request_args),
+            **request_args,
+            **extra
+        )
+
+def get_completion_text(response):
+    """The text of a chat completion's first choice, or None if it has no choices"""
+    if response.choices and len(response.choices) > 0:
+        return response.choices[0].message.content.strip()
+    return None
+
+def get_completion_error(response):
+    """Why a chat completion has no answer, as told to the client"""
+    error = response.get('error')
+    if error:
+        logger.warning("OpenAI API error: %s", error.message)
+        return "Error from OpenAI: " + error.message
+    logger.warning("Unexpected OpenAI response structure")
+    return "Sorry, no response received from API."
+
+def overloaded_response(error):
+    """503 telling the client when OpenAI capacity should be available again"""
+    response = jsonify({'error': 'Too many requests to the AI service, please retry shortly'})
+    response.status_code = 503
+    response.headers['Retry-After'] = str(max(1, math.ceil(error.retry_after)))
+    return response
+
+def get_client_id():
+    """Who a request counts against for client quotas (see TRUST_FORWARDED_FOR)"""
+    return request.remote_addr or 'unknown'
+
+def admit_request(route, client, cost):
+    """Charge a client's quota, then wait for a slot in the route's pool; returns the
+    admission time for release_request(), or raises AdmissionRejected"""
+    client_quotas.take(client, cost, route)
+    try:
+        return route_limiters[route].acquire()
+    except AdmissionRejected:
+        # Shed for load, not for the client's own usage
+        client_quotas.refund(client, cost)
+        raise
+
+def release_request(route, admitted_at):
+    route_limiters[route].release(admitted_at)
+
+def admission_response(error):
+    """429 or 503 telling the client when to retry"""
+    response = jsonify({'error': 'Too many requests, please retry shortly'})
+    response.status_code = error.status
+    response.headers['Retry-After'] = str(max(1, math.ceil(error.retry_after)))
+    return response
+
+def get_request_cost(route, get_cost, data):
+    """What a request costs against its client's quota: `get_cost(json_body)`, or the route's cost"""
+    return get_cost(data) if get_cost else ROUTE_COSTS[route]
+
+def admission_controlled(route, get_cost=None):
+    """Run a view under admission control; streamed responses hold their slot until
+    the stream ends. `get_cost(json_body)` prices a request, by default ROUTE_COSTS."""
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            cost = get_request_cost(route, get_cost, request.get_json(silent=True) if get_cost else None)
+            try:
+                admitted_at = admit_request(route, get_client_id(), cost)
+            except AdmissionRejected as e:
+                logger.warning("Request rejected: %s", e)
+                return admission_response(e)
+            try:
+                response = make_response(view(*args, **kwargs))
+            except BaseException:
+                release_request(route, admitted_at)
+                raise
+            if response.is_streamed:
+                response.call_on_close(lambda: release_request(route, admitted_at))
+            else:
+                release_request(route, admitted_at)
+            return response
+        return wrapper
+    return decorator
+
+def stream_answer(chunks, question, context):
+    """Yield an answer as server-sent events: one per token, then a final 'done' event"""
+    try:
+        answer = []
+        for chunk in chunks:
+            token = get_stream_token(chunk)
+            if token:
+                answer.append(token)
+                yield format_sse({'token': token})
+        answer = ''.join(answer).strip()
+        if answer:
+            cache_answer(question, context, answer)
+        yield format_sse({'answer': answer}, event='done')
+    except Exception as e:
+        logger.warning("Streaming error: %s", e)
+        yield format_sse({'error': str(e)}, event='error')
+
+def sse_response(events):
+    """Wrap an event generator in an unbuffered text/event-stream response"""
+    response = Response(events, mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@api.route('/api/ask', methods=['POST'])
+@admission_controlled('ask')
 def ask():
+    """Answer a question; streams tokens as server-sent events with ?stream=1
+    or Accept: text/event-stream, otherwise returns one JSON payload"""
     try:
         data = request.json
         question = data.get('question', '')
-        print(f"Received question: {question}") # Log the received question
         
         if not question:
-            print("No question provided.") # Log if no question
             return jsonify({'error': 'No question provided'}), 400
+        
+        stream = wants_stream(request.args, request.headers.get('Accept'))
+        
+        # Repeated questions about the same daily images are answered from the cache
+        context = get_answer_context()
+        cached = get_cached_answer(question, context)
+        if cached:
+            if stream:
+                return sse_response(stream_cached_answer(cached))
+            return jsonify({'answer': cached})
+        
+        if stream:
+            chunks = create_chat_completion(build_ask_request(question), stream=True)
+            return sse_response(stream_with_context(stream_answer(chunks, question, context)))
 
         # Call OpenAI API
-        response = openai.ChatCompletion.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": "You are an image retrieval assistant and a college level professor that explains the interesting or important facts of the image that you retrieve. you only explain images that you've retrieved."},
-                {"role": "user", "content": question}
-            ],
-            max_tokens=150,
-            temperature=0.7
-        )
-        print(f"OpenAI API response: {response}") # Log the API response
-
-        if response.choices and len(response.choices) > 0:
-            answer = response.choices[0].message.content.strip()
-            print(f"Sending answer: {answer}") # Log the extracted answer
-            return jsonify({'answer': answer})
-        elif response.error:
-            print(f"OpenAI API error: {response.error.message}") # Log API error
-            return jsonify({'error': "Error from OpenAI: " + response.error.message}), 500
-        else:
-            print("Unexpected API response structure.") # Log unexpected structure
-            return jsonify({'error': "Sorry, no response received from API."}), 500
+        response = create_chat_completion(build_ask_request(question))
+        logger.debug("OpenAI response %s: %s", response.get('id'), response.get('usage'))
+
+        answer = get_completion_text(response)
+        if answer is None:
+            return jsonify({'error': get_completion_error(response)}), 500
+        cache_answer(question, context, answer)
+        return jsonify({'answer': answer})
 
+    except OpenAIOverloadedError as e:
+        logger.warning("OpenAI call rejected: %s", e)
+        return overloaded_response(e)
     except Exception as e:
-        print(f"Backend error: {e}") # Log any backend exceptions
+        logger.exception("Backend error: %s", e)
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/search-image', methods=['POST'])
+def resolve_image_url(category):
+    """Pick an image URL from the API that serves a category"""
+    # Route to specialized APIs based on category
+    if category == 'space':
+        # Use JWST API for space images
+        return get_jwst_image()
+    elif category == 'art':
+        # Use Metropolitan Museum API for art images
+        return get_met_museum_image()
+    elif category == 'earth':
+        # Use Unsplash with nature-specific search terms
+        return get_nature_image()
+    else:
+        # Default fallback
+        return get_fallback_image()
+
+def save_retrieved_image(image_url):
+    """Download a retrieved image into the image store"""
+    # Download the image
+    image_response = http_client.get(image_url, stream=True)
+    image_response.raise_for_status() # Raise an exception for bad status codes
+    
+    # Stored under its content hash, which also keys the description cache
+    stored = image_store.ingest(image_response)
+    save_path = stored['path']
+    
+    logger.debug("Image saved to %s", save_path)
+    
+    return save_path, stored['sha256']
+
+def build_vision_request(image_url):
+    """Build the chat completion arguments that ask the vision model to describe an image"""
+    return {
+        'model': VISION_MODEL,
+        'messages': [
+            {
+                "role": "system",
+                "content": VISION_SYSTEM_PROMPT
+            },
+            {
+                "role": "user",
+                "content": [
+                    {
+                        "type": "text",
+                        "text": VISION_USER_PROMPT
+                    },
+                    {
+                        "type": "image_url",
+                        "image_url": {
+                            "url": image_url,
+                            "detail": "high"
+                        }
+                    }
+                ]
+            }
+        ],
+        'max_tokens': 150
+    }
+
+def get_description_key(content_hash):
+    """Key for an image's description in the description cache"""
+    return make_description_key(content_hash, VISION_MODEL, VISION_SYSTEM_PROMPT, VISION_USER_PROMPT)
+
+def get_cached_description(cache_key):
+    """Look up a description in the shared cache, then on disk, treating errors as a miss"""
+    description = shared_cache.get(f"description:{cache_key}")
+    if description is None:
+        try:
+            description = description_cache.get(cache_key)
+        except Exception as cache_error:
+            logger.warning("Description cache error: %s", cache_error)
+        if description:
+            shared_cache.set(f"description:{cache_key}", description, DESCRIPTION_TTL)
+    telemetry.record_cache('description', bool(description))
+    return description
+
+def cache_description(cache_key, description):
+    """Store a description in the shared cache and on disk, ignoring errors"""
+    shared_cache.set(f"description:{cache_key}", description, DESCRIPTION_TTL)
+    try:
+        with telemetry.span('disk_write', target='description_cache'):
+            description_cache.put(cache_key, description)
+    except Exception as cache_error:
+        logger.warning("Description cache error: %s", cache_error)
+
+def describe_image(image_url, content_hash=None):
+    """Describe an image with the vision model, or return None if it fails.
+    
+    With the image's content hash, descriptions are cached and reused for identical images.
+    """
+    cache_key = None
+    if content_hash:
+        cache_key = get_description_key(content_hash)
+        cached = get_cached_description(cache_key)
+        if cached:
+            return cached
+    
+    try:
+        description = get_completion_text(create_chat_completion(build_vision_request(image_url)))
+        if description is not None and cache_key:
+            cache_description(cache_key, description)
+        return description
+            
+    except Exception as vision_error:
+        logger.warning("Vision API error: %s", vision_error)
+        return None
+
+def make_search_entry(image_url, local_path=None, description=None):
+    """A retrieved image as served by the search endpoints; without a local path it couldn't be saved"""
+    if local_path is None:
+        fallback = "Unable to save or analyze the image at this moment."
+    else:
+        fallback = "Unable to analyze the image at this moment."
+    return {
+        'url': image_url,
+        'local_path': local_path,
+        'description': description or fallback,
+        'analyzed': description is not None
+    }
+
+def retrieve_image(category):
+    """Resolve, save and describe one image for a category"""
+    image_url = resolve_image_url(category)
+    if not image_url:
+        return None
+    
+    try:
+        local_path, content_hash = save_retrieved_image(image_url)
+    except Exception as save_error:
+        logger.warning("Error saving image: %s", save_error)
+        return make_search_entry(image_url)
+    
+    # Only proceed with Vision API analysis after successful image save.
+    # The download above already proved the URL is reachable.
+    description = describe_image(image_url, content_hash)
+    return make_search_entry(image_url, local_path, description)
+
+def get_image_pool():
+    """Get the per-category prefetch pool, starting it on first use"""
+    global image_pool
+    with image_pool_lock:
+        if image_pool is None:
+            image_pool = ImagePool(retrieve_image, IMAGE_POOL_CATEGORIES, size=IMAGE_POOL_SIZE)
+            image_pool.fill_all()
+        return image_pool
+
+def get_search_entry(category):
+    """Serve a prefetched image when one is ready, otherwise retrieve one inline"""
+    entry = get_image_pool().pop(category)
+    telemetry.record_cache('image_pool', entry is not None)
+    if entry is None:
+        entry = retrieve_image(category)
+    return entry
+
+@api.route('/api/search-image', methods=['POST'])
+@admission_controlled('search-image')
 def search_image():
     try:
         data = request.json
@@ -296,269 +1388,466 @@ def search_image():
         if not prompt:
             return jsonify({'error': 'No prompt provided'}), 400
 
-        print(f"Searching for image with prompt: {prompt}, category: {category}")
-        
-        image_url = None
-        
-        # Route to specialized APIs based on category
-        if category == 'space':
-            # Use JWST API for space images
-            image_url = get_jwst_image()
-        elif category == 'art':
-            # Use Metropolitan Museum API for art images
-            image_url = get_met_museum_image()
-        elif category == 'earth':
-            # Use Unsplash with nature-specific search terms
-            image_url = get_nature_image()
-        else:
-            # Default fallback
-            image_url = get_fallback_image()
-        
-        if not image_url:
+        entry = get_search_entry(category)
+        if not entry:
             return jsonify({'error': 'Failed to retrieve image for this category'}), 500
 
-        print(f"Retrieved image URL before saving: {image_url}")
+        return jsonify({
+            'url': entry['url'],
+            'description': entry['description']
+        })
+        
+    except Exception as e:
+        logger.exception("Image search error: %s", e)
+        return jsonify({'error': str(e)}), 500
 
-        # --- Start Image Saving Logic ---
-        try:
-            # Define the directory to save images
-            save_dir = 'backend/retrieved_images'
-            
-            # Create the directory if it doesn't exist
-            if not os.path.exists(save_dir):
-                os.makedirs(save_dir)
-            
-            # Generate a unique filename using a timestamp
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            # Attempt to get file extension from URL, default to .jpg
-            filename = f"image_{timestamp}.jpg"
-            if '.' in image_url:
-                file_extension = image_url.split('.')[-1].split('?')[0] # Handle query parameters
-                if file_extension.lower() in ['jpg', 'jpeg', 'png', 'gif']:
-                    filename = f"image_{timestamp}.{file_extension}"
-            
-            save_path = os.path.join(save_dir, filename)
-            
-            # Download the image
-            image_response = requests.get(image_url, stream=True)
-            image_response.raise_for_status() # Raise an exception for bad status codes
-            
-            # Save the image to the file
-            with open(save_path, 'wb') as f:
-                for chunk in image_response.iter_content(chunk_size=8192):
-                    f.write(chunk)
-            
-            print(f"Image successfully saved to {save_path}")
+def parse_search_batch(data):
+    """The (prompt, category) items of a batch request, or None if it is malformed"""
+    items = data.get('items') if isinstance(data, dict) else data
+    if not isinstance(items, list) or not 0 < len(items) <= SEARCH_BATCH_MAX_ITEMS:
+        return None
+    if not all(isinstance(item, dict) and item.get('prompt') for item in items):
+        return None
+    return [(item['prompt'], item.get('category', '')) for item in items]
 
-            # Only proceed with Vision API analysis after successful image save
-            try:
-                # Verify the image URL is accessible
-                verify_response = requests.head(image_url)
-                verify_response.raise_for_status()
-                
-                print(f"Sending this URL to Vision API: {image_url}")
-                
-                vision_response = openai.ChatCompletion.create(
-                    model="gpt-4-vision-preview",
-                    messages=[
-                        {
-                            "role": "system",
-                            "content": "You are a precise image analyzer. Describe exactly what you see in the image, focusing on the main subject and key details. Do not make assumptions or add details that aren't visible. If you see a specific subject (like a cat, person, or landscape), start by identifying it clearly."
-                        },
-                        {
-                            "role": "user",
-                            "content": [
-                                {
-                                    "type": "text",
-                                    "text": "What do you see in this image? Provide a clear, accurate description of what is actually visible in the image."
-                                },
-                                {
-                                    "type": "image_url",
-                                    "image_url": {
-                                        "url": image_url,
-                                        "detail": "high"
-                                    }
-                                }
-                            ]
-                        }
-                    ],
-                    max_tokens=150
-                )
-                
-                if vision_response.choices and len(vision_response.choices) > 0:
-                    description = vision_response.choices[0].message.content.strip()
-                else:
-                    description = "Unable to analyze the image at this moment."
-                    
-            except Exception as vision_error:
-                print(f"Vision API error: {vision_error}")
-                description = "Unable to analyze the image at this moment."
+def format_search_result(index, category, entry, error=None):
+    """One batch item's result event: the image, or why there is none"""
+    if not entry:
+        return format_sse({
+            'index': index,
+            'category': category,
+            'error': error or 'Failed to retrieve image for this category'
+        })
+    return format_sse({
+        'index': index,
+        'category': category,
+        'url': entry['url'],
+        'description': entry['description']
+    })
 
-        except Exception as save_error:
-            print(f"Error saving image: {save_error}")
-            description = "Unable to save or analyze the image at this moment."
+def get_search_batch_cost(data):
+    """Quota cost of a batch search: one per item"""
+    items = parse_search_batch(data)
+    return len(items) if items else 1
 
-        print(f"Final image URL: {image_url}")
-        print(f"Generated description: {description}")
+def stream_search_batch(items, deadline):
+    """Yield each item's result as soon as it is ready, then a 'done' event.
+    
+    Items still running at the deadline are reported as timed out.
+    """
+    futures = {
+        search_batch_executor.submit(get_search_entry, category): (index, category)
+        for index, (_, category) in enumerate(items)
+    }
+    pending = set(futures)
+    failed = 0
+    try:
+        while pending:
+            done, pending = wait(pending, timeout=max(0, deadline - time.monotonic()), return_when=FIRST_COMPLETED)
+            if not done:
+                break
+            for future in done:
+                index, category = futures[future]
+                try:
+                    entry = future.result()
+                except Exception as e:
+                    logger.warning("Error retrieving '%s' image: %s", category, e)
+                    entry = None
+                failed += not entry
+                yield format_search_result(index, category, entry)
         
-        return jsonify({
-            'url': image_url,
-            'description': description
-        })
+        for future in pending:
+            index, category = futures[future]
+            failed += 1
+            yield format_search_result(index, category, None, 'Timed out')
+        yield format_sse({'count': len(items), 'failed': failed}, event='done')
+    finally:
+        # Don't start items nobody will read (e.g. the client went away)
+        for future in pending:
+            future.cancel()
+
+@api.route('/api/search-images', methods=['POST'])
+@admission_controlled('search-image', get_search_batch_cost)
+def search_images():
+    """Search images for several {prompt, category} items at once, streaming each
+    result as a server-sent event as soon as it is ready"""
+    try:
+        items = parse_search_batch(request.get_json(silent=True))
+        if items is None:
+            return jsonify({'error': f"Send 'items': a list of 1 to {SEARCH_BATCH_MAX_ITEMS} objects with a prompt and category"}), 400
+        
+        return sse_response(stream_search_batch(items, time.monotonic() + SEARCH_BATCH_DEADLINE))
         
     except Exception as e:
-        print(f"Image search error: {e}")
+        logger.exception("Batch image search error: %s", e)
         return jsonify({'error': str(e)}), 500
 
+def get_jwst_url():
+    """Build the JWST API URL for a random program"""
+    # Use JWST API to get a random program/observation
+    # For now, we'll use a known program ID, but in production you might want to fetch a list first
+    programs = [2733, 1345, 2736, 1536, 2107]  # Some popular JWST program IDs
+    program_id = random.choice(programs)
+    
+    return f"{JWST_API_BASE}/program/id/{program_id}"
+
+def parse_jwst_image(data):
+    """Extract an image URL from a JWST API program response"""
+    if 'observation_files' in data and data['observation_files']:
+        # Look for preview image files
+        for file in data['observation_files']:
+            if file.get('file_type') == 'preview' and file.get('file_url'):
+                return file['file_url']
+    
+    # Fallback to observation program image if available
+    if 'program_info' in data and data['program_info'].get('observation_preview'):
+        return data['program_info']['observation_preview']
+    
+    return None
+
 def get_jwst_image():
     """Get image from James Webb Space Telescope API"""
     try:
-        # Use JWST API to get a random program/observation
-        # For now, we'll use a known program ID, but in production you might want to fetch a list first
-        programs = [2733, 1345, 2736, 1536, 2107]  # Some popular JWST program IDs
-        program_id = random.choice(programs)
-        
-        jwst_url = f"https://api.jwstapi.com/program/id/{program_id}"
-        
-        response = requests.get(jwst_url, timeout=10)
+        response = http_client.get(get_jwst_url())
         if response.status_code == 200:
-            data = response.json()
-            # Extract image URL from JWST API response
-            if 'observation_files' in data and data['observation_files']:
-                # Look for preview image files
-                for file in data['observation_files']:
-                    if file.get('file_type') == 'preview' and file.get('file_url'):
-                        return file['file_url']
-            
-            # Fallback to observation program image if available
-            if 'program_info' in data and data['program_info'].get('observation_preview'):
-                return data['program_info']['observation_preview']
+            image_url = parse_jwst_image(response.json())
+            if image_url:
+                return image_url
                 
         # If JWST API fails, fallback to space-themed Unsplash search
         return get_unsplash_image("james webb space telescope nebula")
         
     except Exception as e:
-        print(f"JWST API error: {e}")
+        logger.warning("JWST API error: %s", e)
         # Fallback to space-themed Unsplash search
         return get_unsplash_image("space telescope nebula galaxy")
 
+def pick_met_object_id(search_data):
+    """Pick an object from a Met Museum search response, or None if nothing was found"""
+    if 'objectIDs' in search_data and search_data['objectIDs']:
+        # A random object from the first 20 results to ensure good quality
+        return random.choice(search_data['objectIDs'][:20])
+    return None
+
+def parse_met_object_image(object_data):
+    """Extract the best image URL from a Met Museum object"""
+    if object_data.get('primaryImage'):
+        return object_data['primaryImage']
+    elif object_data.get('additionalImages') and len(object_data['additionalImages']) > 0:
+        return object_data['additionalImages'][0]
+    return None
+
 def get_met_museum_image():
     """Get image from Metropolitan Museum of Art API"""
     try:
-        # Search for artworks with images
-        search_terms = ["landscape", "nature", "portrait", "painting", "sculpture", "impressionist"]
-        search_term = random.choice(search_terms)
+        # Pick from the local index when it has been built
+        artwork = met_index.pick()
+        telemetry.record_cache('met_index', artwork is not None)
+        if artwork:
+            return artwork[1]
         
-        search_url = f"https://collectionapi.metmuseum.org/public/collection/v1/search?hasImages=true&q={search_term}"
+        # Index not built yet: search the API directly
+        search_term = random.choice(MET_SEARCH_TERMS)
         
-        response = requests.get(search_url, timeout=10)
+        search_url = f"{MET_API_BASE}/search?hasImages=true&q={search_term}"
+        
+        response = http_client.get(search_url)
         if response.status_code == 200:
-            search_data = response.json()
-            
-            if 'objectIDs' in search_data and search_data['objectIDs']:
-                # Get a random object from the first 20 results to ensure good quality
-                object_ids = search_data['objectIDs'][:20]
-                object_id = random.choice(object_ids)
-                
+            object_id = pick_met_object_id(response.json())
+            if object_id:
                 # Get detailed object information
-                object_url = f"https://collectionapi.metmuseum.org/public/collection/v1/objects/{object_id}"
-                object_response = requests.get(object_url, timeout=10)
+                object_url = f"{MET_API_BASE}/objects/{object_id}"
+                object_response = http_client.get(object_url)
                 
                 if object_response.status_code == 200:
-                    object_data = object_response.json()
-                    
-                    # Get high quality image URL
-                    if object_data.get('primaryImage'):
-                        return object_data['primaryImage']
-                    elif object_data.get('additionalImages') and len(object_data['additionalImages']) > 0:
-                        return object_data['additionalImages'][0]
+                    image_url = parse_met_object_image(object_response.json())
+                    if image_url:
+                        return image_url
         
         # If Met Museum API fails, fallback to art-themed Unsplash search
         return get_unsplash_image("classical art museum painting")
         
     except Exception as e:
-        print(f"Met Museum API error: {e}")
+        logger.warning("Met Museum API error: %s", e)
         # Fallback to art-themed Unsplash search
         return get_unsplash_image("artwork painting museum")
 
 def get_nature_image():
     """Get nature image using Unsplash with nature-specific search terms"""
     try:
-        nature_terms = [
-            "pristine nature landscape", 
-            "mountain wilderness", 
-            "forest waterfall", 
-            "dramatic landscape", 
-            "natural scenery",
-            "wildlife nature",
-            "scenic landscape",
-            "nature photography"
-        ]
-        search_term = random.choice(nature_terms)
+        search_term = random.choice(NATURE_SEARCH_TERMS)
         
         return get_unsplash_image(search_term)
         
     except Exception as e:
-        print(f"Nature image search error: {e}")
+        logger.warning("Nature image search error: %s", e)
         return get_fallback_image()
 
-def get_unsplash_image(query):
-    """Helper function to get image from Unsplash API"""
-    try:
-        unsplash_url = "https://api.unsplash.com/search/photos"
-        headers = {
+def build_unsplash_request(query):
+    """Build the headers and params for an Unsplash photo search"""
+    return {
+        'headers': {
             "Authorization": f"Client-ID {os.getenv('UNSPLASH_ACCESS_KEY', 'demo-key')}"
-        }
-        params = {
+        },
+        'params': {
             "query": query,
             "per_page": 1,
             "orientation": "landscape"
         }
-        
-        response = requests.get(unsplash_url, headers=headers, params=params, timeout=10)
+    }
+
+def parse_unsplash_image(results):
+    """Extract the first photo URL from an Unsplash search response"""
+    if results['results']:
+        return results['results'][0]['urls']['regular']
+    return None
+
+def get_unsplash_image(query):
+    """Helper function to get image from Unsplash API"""
+    try:
+        response = http_client.get(UNSPLASH_SEARCH_URL, **build_unsplash_request(query))
         if response.status_code == 200:
-            results = response.json()
-            if results['results']:
-                return results['results'][0]['urls']['regular']
+            return parse_unsplash_image(response.json())
         
         return None
         
+    except CircuitOpenError as e:
+        # Unsplash is down; don't wait on it, use a known-good image
+        logger.info("Unsplash API skipped: %s", e)
+        return get_fallback_image()
     except Exception as e:
-        print(f"Unsplash API error: {e}")
+        logger.warning("Unsplash API error: %s", e)
         return None
 
 def get_fallback_image():
     """Fallback image URLs if APIs fail"""
     fallback_images = [
-        "https://images.unsplash.com/photo-1506905925346-21bda4d32df4?ixlib=rb-4.0.3&auto=format&fit=crop&w=1200&q=80",  # Earth
-        "https://images.unsplash.com/photo-1446776877081-d282a0f896e2?ixlib=rb-4.0.3&auto=format&fit=crop&w=1200&q=80",  # Space
-        "https://images.unsplash.com/photo-1578662996442-48f60103fc96?ixlib=rb-4.0.3&auto=format&fit=crop&w=1200&q=80"   # Art
+        f"{UNSPLASH_IMAGES_BASE}/photo-1506905925346-21bda4d32df4?ixlib=rb-4.0.3&auto=format&fit=crop&w=1200&q=80",  # Earth
+        f"{UNSPLASH_IMAGES_BASE}/photo-1446776877081-d282a0f896e2?ixlib=rb-4.0.3&auto=format&fit=crop&w=1200&q=80",  # Space
+        f"{UNSPLASH_IMAGES_BASE}/photo-1578662996442-48f60103fc96?ixlib=rb-4.0.3&auto=format&fit=crop&w=1200&q=80"   # Art
     ]
     return random.choice(fallback_images)
 
+def get_generated_image_url(content_hash):
+    """Absolute URL we serve a generated image from (the frontend is on another origin)"""
+    return url_for('api.serve_generated_image', content_hash=content_hash, _external=True)
+
+def get_cached_generation(key):
+    """Content hash of a cached generation whose image is (or can be copied) into the store, or None"""
+    try:
+        content_hash = generation_cache.get(key)
+    except Exception as cache_error:
+        logger.warning("Generation cache error: %s", cache_error)
+        content_hash = None
+    if content_hash is None:
+        # Maybe generated by another replica
+        content_hash = shared_cache.get(f"generation:{key}")
+    hit = bool(content_hash) and ensure_stored_image(content_hash) is not None
+    telemetry.record_cache('generation', hit)
+    return content_hash if hit else None
+
+def cache_generation(key, prompt, size, content_hash):
+    """Record a generated image on disk and share it (and its bytes) with other replicas"""
+    try:
+        with telemetry.span('disk_write', target='generation_cache'):
+            generation_cache.put(key, prompt, size, content_hash)
+    except Exception as cache_error:
+        logger.warning("Generation cache error: %s", cache_error)
+    try:
+        share_image(content_hash, image_store.get_path(content_hash))
+    except OSError as e:
+        logger.warning("Error sharing generated image: %s", e)
+    shared_cache.set(f"generation:{key}", content_hash, GENERATION_TTL)
+
+def wait_for_shared_generation(key):
+    """Wait for the generation another replica is running; returns its content hash or None"""
+    content_hash = shared_cache.wait_for(f"generation:{key}", IMAGE_GENERATION_WAIT)
+    if content_hash and ensure_stored_image(content_hash):
+        return content_hash
+    return None
+
+def start_image_generation(key):
+    """Join the running generation of a prompt key, or register a new one.
+    
+    Returns the generation's future and whether the caller has to run it (and
+    then pass its result to finish_image_generation).
+    """
+    with image_generations_lock:
+        future = image_generations.get(key)
+        if future is not None:
+            return future, False
+        future = image_generations[key] = Future()
+        # Running futures can't be cancelled by a waiter that gives up
+        future.set_running_or_notify_cancel()
+        return future, True
+
+def finish_image_generation(key, future, content_hash=None, error=None):
+    """Hand a generation's content hash (or error) to the requests waiting on it"""
+    with image_generations_lock:
+        image_generations.pop(key, None)
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(content_hash)
+
+def generate_image_file(prompt, size):
+    """Generate an image and download it into the image store; returns its content hash"""
+    with telemetry.span('openai', target='image'):
+        response = openai_dispatcher.call(
+            get_openai().Image.create,
+            model=IMAGE_MODEL,
+            prompt=prompt,
+            n=1,
+            size=size
+        )
+    if not response['data']:
+        return None
+    # OpenAI's URL expires, so keep our own copy; we serve it, so build its variants
+    save_path, content_hash = save_retrieved_image(response['data'][0]['url'])
+    schedule_image_variants(save_path)
+    return content_hash
+
+def get_generated_image(prompt, size):
+    """Content hash of the image for a prompt: cached, shared with a generation running
+    here or on another replica, or new"""
+    key = make_generation_key(prompt, size, IMAGE_MODEL)
+    content_hash = get_cached_generation(key)
+    if content_hash:
+        return content_hash
+    
+    future, leader = start_image_generation(key)
+    if not leader:
+        return future.result(timeout=IMAGE_GENERATION_WAIT)
+    try:
+        # Other replicas wait for the one that takes the lock
+        token = shared_cache.acquire(f"generation:{key}", IMAGE_GENERATION_WAIT)
+        if token is None:
+            content_hash = wait_for_shared_generation(key)
+        else:
+            try:
+                content_hash = generate_image_file(prompt, size)
+                if content_hash:
+                    cache_generation(key, prompt, size, content_hash)
+            finally:
+                shared_cache.release(f"generation:{key}", token)
+    except Exception as e:
+        finish_image_generation(key, future, error=e)
+        raise
+    finish_image_generation(key, future, content_hash)
+    return content_hash
+
+def get_image_request_size(data):
+    """Requested image size, or None if it isn't one OpenAI supports"""
+    size = data.get('size') or DEFAULT_IMAGE_SIZE
+    return size if size in IMAGE_SIZES else None
+
 # Keep the old endpoint for backwards compatibility
-@app.route('/api/generate-image', methods=['POST'])
+@api.route('/api/generate-image', methods=['POST'])
+@admission_controlled('generate-image')
 def generate_image():
+    """Generate an image for a prompt and return the URL we serve it from"""
     try:
         data = request.json
         prompt = data.get('prompt', '')
         if not prompt:
             return jsonify({'error': 'No prompt provided'}), 400
+        size = get_image_request_size(data)
+        if not size:
+            return jsonify({'error': f"Size must be one of {', '.join(IMAGE_SIZES)}"}), 400
 
-        # Call OpenAI Image API
-        response = openai.Image.create(
-            prompt=prompt,
-            n=1,
-            size="1024x1024"
-        )
-        if response['data'] and len(response['data']) > 0:
-            image_url = response['data'][0]['url']
-            return jsonify({'url': image_url})
+        content_hash = get_generated_image(prompt, size)
+        if content_hash:
+            return jsonify({'url': get_generated_image_url(content_hash)})
         else:
             return jsonify({'error': 'No image returned from OpenAI'}), 500
+    except OpenAIOverloadedError as e:
+        logger.warning("OpenAI call rejected: %s", e)
+        return overloaded_response(e)
     except Exception as e:
-        print(f"Image generation error: {e}")
+        logger.exception("Image generation error: %s", e)
         return jsonify({'error': str(e)}), 500
 
+@api.before_app_request
+def start_request_trace():
+    """Give each request a trace id (the caller's X-Request-ID if sent) for its log lines"""
+    g.trace_token = telemetry.start_trace(request.headers.get('X-Request-ID'))
+    g.request_start = time.perf_counter()
+
+@api.after_app_request
+def finish_request_trace(response):
+    """Record the request's latency and echo its trace id"""
+    if 'request_start' in g:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        telemetry.observe_request(route, request.method, response.status_code, time.perf_counter() - g.request_start)
+    response.headers['X-Request-ID'] = telemetry.current_trace_id.get()
+    return response
+
+@api.teardown_app_request
+def end_request_trace(error=None):
+    if 'trace_token' in g:
+        telemetry.end_trace(g.pop('trace_token'))
+
+telemetry.register_gauge(
+    'openai_dispatcher', 'OpenAI dispatcher queue depth, admissions, rejections and waits',
+    lambda: {(name,): value for name, value in openai_dispatcher.stats().items()}, ('stat',))
+telemetry.register_gauge(
+    'admission', 'Active and waiting requests, admissions and sheds per admission-controlled route',
+    lambda: {
+        (limiter.name, name): value
+        for limiter in (*route_limiters.values(), *async_route_limiters.values())
+        for name, value in limiter.stats().items()
+    },
+    ('route', 'stat'))
+telemetry.register_gauge(
+    'image_store', 'Images and bytes in the image store',
+    lambda: {(name,): value for name, value in image_store.stats().items()}, ('stat',))
+
+@api.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus metrics of this worker process"""
+    return Response(telemetry.render_metrics(), mimetype='text/plain; version=0.0.4')
+
+@api.route('/api/status/admission', methods=['GET'])
+def admission_status():
+    """Report each expensive route's active and waiting requests and shed counts"""
+    return jsonify({
+        'routes': {route: limiter.stats() for route, limiter in route_limiters.items()},
+        'async_routes': {route: limiter.stats() for route, limiter in async_route_limiters.items()},
+        'quotas': client_quotas.stats(),
+    })
+
+@api.route('/api/status/openai', methods=['GET'])
+def openai_status():
+    """Report the OpenAI dispatcher's queue depth, wait times and rejections"""
+    return jsonify(openai_dispatcher.stats())
+
+def preload():
+    """Load shared, read-mostly state before worker processes fork (gunicorn --preload),
+    so each worker starts warm and shares it copy-on-write.
+    
+    Starts no threads and opens no SQLite connections: neither survives a fork.
+    """
+    get_openai()
+    daily_sources.get_values()
+    met_index.load()
+    image_store.stats()
+
+def create_app():
+    """Build the Flask app serving the API"""
+    flask_app = Flask(__name__)
+    if TRUST_FORWARDED_FOR:
+        flask_app.wsgi_app = ProxyFix(flask_app.wsgi_app, x_for=1, x_proto=1, x_host=1)
+    CORS(flask_app)
+    flask_app.register_blueprint(api)
+    return flask_app
+
+# For `flask --app backend/app.py`, the dev server and async_app; wsgi.py serves production
+app = create_app()
+
 if __name__ == '__main__':
-    app.run(debug=True, port=3001) 
\ No newline at end of file
+    # FLASK_DEBUG=0 skips the reloader, which imports everything twice
+    debug = os.getenv('FLASK_DEBUG', '1') != '0'
+    # With the debug reloader, only the serving child process schedules the pre-warm
+    if not debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_daily_prewarm()
+    app.run(debug=debug, port=3001)
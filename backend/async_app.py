@@ -0,0 +1,515 @@
+"""Async (ASGI) serving mode.
+
+The upstream-bound routes (/api/ask, /api/search-image(s), /api/generate-image) run
+as async views on an async HTTP client and OpenAI's async API, so one process can
+hold hundreds of them in flight. Every other route, including the cached
+/api/daily-images endpoints, is served by the regular Flask app mounted underneath.
+
+Run with:
+    uvicorn async_app:app --app-dir backend --port 3001
+"""
+import asyncio
+import functools
+import logging
+import math
+import random
+import time
+from contextlib import asynccontextmanager
+
+import aiohttp
+from a2wsgi import WSGIMiddleware
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Mount, Route
+
+import app as sync_app
+import http_client
+import telemetry
+from admission import AdmissionRejected
+from http_client import CircuitOpenError
+from generation_cache import make_generation_key
+from image_ingest import ImageWriter, aiter_adaptive_chunks, get_expected_length
+from met_index import MET_API_BASE, MET_SEARCH_TERMS
+from openai_dispatcher import OpenAIOverloadedError, estimate_chat_tokens
+
+logger = logging.getLogger(__name__)
+
+# Threads serving the mounted sync Flask routes
+WSGI_WORKERS = 20
+
+# Shared aiohttp session for OpenAI's async API (it opens one per call otherwise)
+openai_session = None
+
+def use_openai_session():
+    """Point OpenAI's async calls in the current task at the shared session; returns the library"""
+    global openai_session
+    openai = sync_app.get_openai()
+    if openai_session is None:
+        openai_session = aiohttp.ClientSession()
+    openai.aiosession.set(openai_session)
+    return openai
+
+async def create_chat_completion(request_args, **extra):
+    """Async version of app.create_chat_completion"""
+    openai = use_openai_session()
+    with telemetry.span('openai', target=request_args['model']):
+        return await sync_app.openai_dispatcher.async_call(
+            openai.ChatCompletion.acreate,
+            tokens=estimate_chat_tokens(request_args),
+            **request_args,
+            **extra
+        )
+
+def overloaded_response(error):
+    """Async version of app.overloaded_response"""
+    return JSONResponse(
+        {'error': 'Too many requests to the AI service, please retry shortly'},
+        status_code=503,
+        headers={'Retry-After': str(max(1, math.ceil(error.retry_after)))}
+    )
+
+def admission_response(error):
+    """Async version of app.admission_response"""
+    return JSONResponse(
+        {'error': 'Too many requests, please retry shortly'},
+        status_code=error.status,
+        headers={'Retry-After': str(max(1, math.ceil(error.retry_after)))}
+    )
+
+def get_client_id(request):
+    """Async version of app.get_client_id"""
+    if sync_app.TRUST_FORWARDED_FOR:
+        # The last entry is the one our proxy appended
+        forwarded = request.headers.get('x-forwarded-for', '').split(',')[-1].strip()
+        if forwarded:
+            return forwarded
+    return request.client.host if request.client else 'unknown'
+
+async def admit_request(route, client, cost):
+    """Async version of app.admit_request (sharing its client quotas, with the async route pools)"""
+    sync_app.client_quotas.take(client, cost, route)
+    try:
+        return await sync_app.async_route_limiters[route].async_acquire()
+    except AdmissionRejected:
+        sync_app.client_quotas.refund(client, cost)
+        raise
+
+def release_request(route, admitted_at):
+    sync_app.async_route_limiters[route].release(admitted_at)
+
+async def release_at_end(body, route, admitted_at):
+    """Pass a streamed body through, releasing its admission slot when it ends"""
+    try:
+        async for chunk in body:
+            yield chunk
+    finally:
+        release_request(route, admitted_at)
+
+def admission_controlled(route, get_cost=None):
+    """Async version of app.admission_controlled"""
+    def decorator(view):
+        @functools.wraps(view)
+        async def wrapper(request):
+            cost = sync_app.get_request_cost(route, get_cost, await read_json(request) if get_cost else None)
+            try:
+                admitted_at = await admit_request(route, get_client_id(request), cost)
+            except AdmissionRejected as e:
+                logger.warning("Request rejected: %s", e)
+                return admission_response(e)
+            try:
+                response = await view(request)
+            except BaseException:
+                release_request(route, admitted_at)
+                raise
+            if isinstance(response, StreamingResponse):
+                response.body_iterator = release_at_end(response.body_iterator, route, admitted_at)
+            else:
+                release_request(route, admitted_at)
+            return response
+        return wrapper
+    return decorator
+
+async def get_unsplash_image(query):
+    """Async version of app.get_unsplash_image"""
+    try:
+        response = await http_client.async_get(sync_app.UNSPLASH_SEARCH_URL, **sync_app.build_unsplash_request(query))
+        if response.status_code == 200:
+            return sync_app.parse_unsplash_image(response.json())
+        return None
+    except CircuitOpenError as e:
+        logger.info("Unsplash API skipped: %s", e)
+        return sync_app.get_fallback_image()
+    except Exception as e:
+        logger.warning("Unsplash API error: %s", e)
+        return None
+
+async def get_jwst_image():
+    """Async version of app.get_jwst_image"""
+    try:
+        response = await http_client.async_get(sync_app.get_jwst_url())
+        if response.status_code == 200:
+            image_url = sync_app.parse_jwst_image(response.json())
+            if image_url:
+                return image_url
+        return await get_unsplash_image("james webb space telescope nebula")
+    except Exception as e:
+        logger.warning("JWST API error: %s", e)
+        return await get_unsplash_image("space telescope nebula galaxy")
+
+async def get_met_museum_image():
+    """Async version of app.get_met_museum_image"""
+    try:
+        artwork = sync_app.met_index.pick()
+        telemetry.record_cache('met_index', artwork is not None)
+        if artwork:
+            return artwork[1]
+
+        # Index not built yet: search the API directly
+        search_term = random.choice(MET_SEARCH_TERMS)
+        response = await http_client.async_get(f"{MET_API_BASE}/search", params={'hasImages': 'true', 'q': search_term})
+        if response.status_code == 200:
+            object_id = sync_app.pick_met_object_id(response.json())
+            if object_id:
+                object_response = await http_client.async_get(f"{MET_API_BASE}/objects/{object_id}")
+                if object_response.status_code == 200:
+                    image_url = sync_app.parse_met_object_image(object_response.json())
+                    if image_url:
+                        return image_url
+
+        return await get_unsplash_image("classical art museum painting")
+    except Exception as e:
+        logger.warning("Met Museum API error: %s", e)
+        return await get_unsplash_image("artwork painting museum")
+
+async def get_nature_image():
+    """Async version of app.get_nature_image"""
+    try:
+        return await get_unsplash_image(random.choice(sync_app.NATURE_SEARCH_TERMS))
+    except Exception as e:
+        logger.warning("Nature image search error: %s", e)
+        return sync_app.get_fallback_image()
+
+async def resolve_image_url(category):
+    """Async version of app.resolve_image_url"""
+    if category == 'space':
+        return await get_jwst_image()
+    elif category == 'art':
+        return await get_met_museum_image()
+    elif category == 'earth':
+        return await get_nature_image()
+    else:
+        return sync_app.get_fallback_image()
+
+async def save_retrieved_image(image_url):
+    """Async version of app.save_retrieved_image"""
+    async with http_client.async_stream('GET', image_url) as response:
+        response.raise_for_status()
+        expected_length = get_expected_length(response.headers)
+        with telemetry.span('download', target=response.url.host):
+            # Disk writes and the final fsync run on threads, so the event loop never waits on the disk
+            writer = await asyncio.to_thread(ImageWriter, None, sync_app.image_store.root, expected_length)
+            try:
+                async for chunk in aiter_adaptive_chunks(response, expected_length):
+                    await asyncio.to_thread(writer.write, chunk)
+            except BaseException:
+                # Also when cancelled, so no partial temp file is left behind
+                writer.abort()
+                raise
+            stored = await asyncio.to_thread(writer.commit)
+    telemetry.download_bytes.inc(stored['size'], target=response.url.host)
+    sync_app.image_store.record(stored)
+    save_path = stored['path']
+
+    logger.debug("Image saved to %s", save_path)
+    return save_path, stored['sha256']
+
+async def describe_image(image_url, content_hash=None):
+    """Async version of app.describe_image"""
+    cache_key = None
+    if content_hash:
+        cache_key = sync_app.get_description_key(content_hash)
+        cached = await asyncio.to_thread(sync_app.get_cached_description, cache_key)
+        if cached:
+            return cached
+
+    try:
+        vision_response = await create_chat_completion(sync_app.build_vision_request(image_url))
+        description = sync_app.get_completion_text(vision_response)
+        if description is not None and cache_key:
+            await asyncio.to_thread(sync_app.cache_description, cache_key, description)
+        return description
+    except Exception as vision_error:
+        logger.warning("Vision API error: %s", vision_error)
+        return None
+
+async def retrieve_image(category):
+    """Async version of app.retrieve_image"""
+    image_url = await resolve_image_url(category)
+    if not image_url:
+        return None
+
+    try:
+        local_path, content_hash = await save_retrieved_image(image_url)
+    except Exception as save_error:
+        logger.warning("Error saving image: %s", save_error)
+        return sync_app.make_search_entry(image_url)
+
+    description = await describe_image(image_url, content_hash)
+    return sync_app.make_search_entry(image_url, local_path, description)
+
+async def read_json(request):
+    """Parse a JSON request body, treating a missing or invalid body as empty"""
+    try:
+        return await request.json() or {}
+    except ValueError:
+        return {}
+
+async def stream_answer(chunks, question, context):
+    """Async version of app.stream_answer"""
+    try:
+        answer = []
+        async for chunk in chunks:
+            token = sync_app.get_stream_token(chunk)
+            if token:
+                answer.append(token)
+                yield sync_app.format_sse({'token': token})
+        answer = ''.join(answer).strip()
+        if answer:
+            await asyncio.to_thread(sync_app.cache_answer, question, context, answer)
+        yield sync_app.format_sse({'answer': answer}, event='done')
+    except Exception as e:
+        logger.warning("Streaming error: %s", e)
+        yield sync_app.format_sse({'error': str(e)}, event='error')
+
+async def iterate(events):
+    """Adapt a plain iterator of events to an async one"""
+    for event in events:
+        yield event
+
+def event_stream_response(events):
+    """Wrap async events in an unbuffered text/event-stream response"""
+    return StreamingResponse(
+        events,
+        media_type='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@admission_controlled('ask')
+async def ask(request):
+    try:
+        data = await read_json(request)
+        question = data.get('question', '')
+        if not question:
+            return JSONResponse({'error': 'No question provided'}, status_code=400)
+
+        stream = sync_app.wants_stream(request.query_params, request.headers.get('accept'))
+        context = sync_app.get_answer_context()
+        cached = await asyncio.to_thread(sync_app.get_cached_answer, question, context)
+        if cached:
+            if stream:
+                return event_stream_response(iterate(sync_app.stream_cached_answer(cached)))
+            return JSONResponse({'answer': cached})
+
+        if stream:
+            chunks = await create_chat_completion(sync_app.build_ask_request(question), stream=True)
+            return event_stream_response(stream_answer(chunks, question, context))
+
+        response = await create_chat_completion(sync_app.build_ask_request(question))
+        logger.debug("OpenAI response %s: %s", response.get('id'), response.get('usage'))
+
+        answer = sync_app.get_completion_text(response)
+        if answer is None:
+            return JSONResponse({'error': sync_app.get_completion_error(response)}, status_code=500)
+        await asyncio.to_thread(sync_app.cache_answer, question, context, answer)
+        return JSONResponse({'answer': answer})
+    except OpenAIOverloadedError as e:
+        logger.warning("OpenAI call rejected: %s", e)
+        return overloaded_response(e)
+    except Exception as e:
+        logger.exception("Backend error: %s", e)
+        return JSONResponse({'error': str(e)}, status_code=500)
+
+async def get_search_entry(category):
+    """Async version of app.get_search_entry"""
+    entry = sync_app.get_image_pool().pop(category)
+    telemetry.record_cache('image_pool', entry is not None)
+    if entry is None:
+        entry = await retrieve_image(category)
+    return entry
+
+@admission_controlled('search-image')
+async def search_image(request):
+    try:
+        data = await read_json(request)
+        prompt = data.get('prompt', '')
+        category = data.get('category', '')
+        if not prompt:
+            return JSONResponse({'error': 'No prompt provided'}, status_code=400)
+
+        entry = await get_search_entry(category)
+        if not entry:
+            return JSONResponse({'error': 'Failed to retrieve image for this category'}, status_code=500)
+
+        return JSONResponse({'url': entry['url'], 'description': entry['description']})
+    except Exception as e:
+        logger.exception("Image search error: %s", e)
+        return JSONResponse({'error': str(e)}, status_code=500)
+
+async def stream_search_batch(items, deadline):
+    """Async version of app.stream_search_batch"""
+    tasks = {
+        asyncio.ensure_future(get_search_entry(category)): (index, category)
+        for index, (_, category) in enumerate(items)
+    }
+    pending = set(tasks)
+    failed = 0
+    try:
+        while pending:
+            done, pending = await asyncio.wait(
+                pending, timeout=max(0, deadline - time.monotonic()), return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                break
+            for task in done:
+                index, category = tasks[task]
+                try:
+                    entry = task.result()
+                except Exception as e:
+                    logger.warning("Error retrieving '%s' image: %s", category, e)
+                    entry = None
+                failed += not entry
+                yield sync_app.format_search_result(index, category, entry)
+
+        for task in pending:
+            index, category = tasks[task]
+            failed += 1
+            yield sync_app.format_search_result(index, category, None, 'Timed out')
+        yield sync_app.format_sse({'count': len(items), 'failed': failed}, event='done')
+    finally:
+        for task in pending:
+            task.cancel()
+
+@admission_controlled('search-image', sync_app.get_search_batch_cost)
+async def search_images(request):
+    try:
+        items = sync_app.parse_search_batch(await read_json(request))
+        if items is None:
+            return JSONResponse(
+                {'error': f"Send 'items': a list of 1 to {sync_app.SEARCH_BATCH_MAX_ITEMS} objects with a prompt and category"},
+                status_code=400)
+
+        return event_stream_response(stream_search_batch(items, time.monotonic() + sync_app.SEARCH_BATCH_DEADLINE))
+    except Exception as e:
+        logger.exception("Batch image search error: %s", e)
+        return JSONResponse({'error': str(e)}, status_code=500)
+
+async def generate_image_file(prompt, size):
+    """Async version of app.generate_image_file"""
+    openai = use_openai_session()
+    with telemetry.span('openai', target='image'):
+        response = await sync_app.openai_dispatcher.async_call(
+            openai.Image.acreate, model=sync_app.IMAGE_MODEL, prompt=prompt, n=1, size=size)
+    if not response['data']:
+        return None
+    save_path, content_hash = await save_retrieved_image(response['data'][0]['url'])
+    sync_app.schedule_image_variants(save_path)
+    return content_hash
+
+async def get_generated_image(prompt, size):
+    """Async version of app.get_generated_image (sharing its running generations and locks)"""
+    key = make_generation_key(prompt, size, sync_app.IMAGE_MODEL)
+    content_hash = await asyncio.to_thread(sync_app.get_cached_generation, key)
+    if content_hash:
+        return content_hash
+
+    future, leader = sync_app.start_image_generation(key)
+    if not leader:
+        return await asyncio.wait_for(asyncio.wrap_future(future), sync_app.IMAGE_GENERATION_WAIT)
+    try:
+        lock_key = f"generation:{key}"
+        token = await asyncio.to_thread(sync_app.shared_cache.acquire, lock_key, sync_app.IMAGE_GENERATION_WAIT)
+        if token is None:
+            content_hash = await asyncio.to_thread(sync_app.wait_for_shared_generation, key)
+        else:
+            try:
+                content_hash = await generate_image_file(prompt, size)
+                if content_hash:
+                    await asyncio.to_thread(sync_app.cache_generation, key, prompt, size, content_hash)
+            finally:
+                await asyncio.to_thread(sync_app.shared_cache.release, lock_key, token)
+    except BaseException as e:
+        # Also on cancellation (client gone), so waiting requests don't hang
+        if not isinstance(e, Exception):
+            e = RuntimeError('Image generation was cancelled')
+        sync_app.finish_image_generation(key, future, error=e)
+        raise
+    sync_app.finish_image_generation(key, future, content_hash)
+    return content_hash
+
+def get_generated_image_url(request, content_hash):
+    """Async version of app.get_generated_image_url"""
+    return f"{str(request.base_url).rstrip('/')}/api/generated-images/{content_hash}"
+
+@admission_controlled('generate-image')
+async def generate_image(request):
+    try:
+        data = await read_json(request)
+        prompt = data.get('prompt', '')
+        if not prompt:
+            return JSONResponse({'error': 'No prompt provided'}, status_code=400)
+        size = sync_app.get_image_request_size(data)
+        if not size:
+            return JSONResponse({'error': f"Size must be one of {', '.join(sync_app.IMAGE_SIZES)}"}, status_code=400)
+
+        content_hash = await get_generated_image(prompt, size)
+        if content_hash:
+            return JSONResponse({'url': get_generated_image_url(request, content_hash)})
+        return JSONResponse({'error': 'No image returned from OpenAI'}, status_code=500)
+    except OpenAIOverloadedError as e:
+        logger.warning("OpenAI call rejected: %s", e)
+        return overloaded_response(e)
+    except Exception as e:
+        logger.exception("Image generation error: %s", e)
+        return JSONResponse({'error': str(e)}, status_code=500)
+
+@asynccontextmanager
+async def lifespan(app):
+    """Start the daily pre-warm on startup and close the shared async clients on shutdown"""
+    global openai_session
+    sync_app.start_daily_prewarm()
+    yield
+    await http_client.close_async_client()
+    if openai_session is not None:
+        await openai_session.close()
+        openai_session = None
+
+async def trace_request(request, call_next):
+    """Async counterpart of the Flask app's request tracing hooks"""
+    token = telemetry.start_trace(request.headers.get('x-request-id'))
+    start = time.perf_counter()
+    try:
+        response = await call_next(request)
+        telemetry.observe_request(request.url.path, request.method, response.status_code, time.perf_counter() - start)
+        response.headers['X-Request-ID'] = telemetry.current_trace_id.get()
+        return response
+    finally:
+        telemetry.end_trace(token)
+
+# Same open CORS policy as flask_cors gives the sync routes, plus request tracing
+route_middleware = [
+    Middleware(CORSMiddleware, allow_origins=['*'], allow_methods=['*'], allow_headers=['*']),
+    Middleware(BaseHTTPMiddleware, dispatch=trace_request),
+]
+
+app = Starlette(
+    routes=[
+        Route('/api/ask', ask, methods=['POST', 'OPTIONS'], middleware=route_middleware),
+        Route('/api/search-image', search_image, methods=['POST', 'OPTIONS'], middleware=route_middleware),
+        Route('/api/search-images', search_images, methods=['POST', 'OPTIONS'], middleware=route_middleware),
+        Route('/api/generate-image', generate_image, methods=['POST', 'OPTIONS'], middleware=route_middleware),
+        Mount('/', app=WSGIMiddleware(sync_app.app, workers=WSGI_WORKERS)),
+    ],
+    lifespan=lifespan,
+)
@@ -0,0 +1,145 @@
+"""Local stand-in for the shared cache: a small Redis-compatible (RESP2) server.
+
+Supports what tiered_cache uses (PING, AUTH, SELECT, GET, SET with EX/PX/NX,
+DEL, EXISTS, and EVAL of its lock release script) plus FLUSHDB, DBSIZE and INFO
+for inspection, keeping keys in memory with lazy expiry. Not a Redis replacement:
+one keyspace, no persistence, no Lua.
+
+Run on its own with:
+    python backend/bench/fake_cache_server.py --port 6390
+
+and point backends at it with CACHE_URL=redis://127.0.0.1:6390/0.
+"""
+import argparse
+import socketserver
+import threading
+import time
+
+# The only script EVAL runs: tiered_cache's compare-and-delete lock release
+RELEASE_SCRIPT = b"if redis.call('GET', KEYS[1]) == ARGV[1] then return redis.call('DEL', KEYS[1]) else return 0 end"
+
+class FakeCacheServer:
+    """Threaded RESP server over an in-memory dict"""
+
+    def __init__(self, port=0, host='127.0.0.1'):
+        self.data = {}
+        self.commands = {}
+        self.lock = threading.Lock()
+        self.server = socketserver.ThreadingTCPServer((host, port), make_handler(self))
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"redis://{host}:{port}/0"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, name='fake-cache', daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def stats(self):
+        with self.lock:
+            return {'keys': len(self.data), 'commands': dict(self.commands)}
+
+    def _get(self, key):
+        entry = self.data.get(key)
+        if entry and entry[1] is not None and entry[1] <= time.monotonic():
+            del self.data[key]
+            return None
+        return entry
+
+    def run(self, args):
+        """Execute one command; returns the reply (an Exception for error replies)"""
+        name = args[0].decode().upper()
+        with self.lock:
+            self.commands[name] = self.commands.get(name, 0) + 1
+            if name == 'PING':
+                return 'PONG'
+            if name in ('AUTH', 'SELECT'):
+                return 'OK'
+            if name == 'GET':
+                entry = self._get(args[1])
+                return entry[0] if entry else None
+            if name == 'SET':
+                expires_at = None
+                options = [a.decode().upper() for a in args[3:]]
+                if 'NX' in options and self._get(args[1]):
+                    return None
+                for unit, scale in (('EX', 1.0), ('PX', 0.001)):
+                    if unit in options:
+                        expires_at = time.monotonic() + int(options[options.index(unit) + 1]) * scale
+                self.data[args[1]] = (args[2], expires_at)
+                return 'OK'
+            if name == 'DEL':
+                return sum(1 for key in args[1:] if self._get(key) and self.data.pop(key))
+            if name == 'EVAL':
+                if args[1] != RELEASE_SCRIPT or args[2] != b'1':
+                    return ValueError("ERR only the lock release script is supported")
+                entry = self._get(args[3])
+                if entry and entry[0] == args[4]:
+                    del self.data[args[3]]
+                    return 1
+                return 0
+            if name == 'EXISTS':
+                return sum(1 for key in args[1:] if self._get(key))
+            if name == 'FLUSHDB':
+                self.data.clear()
+                return 'OK'
+            if name == 'DBSIZE':
+                return len(self.data)
+            if name == 'INFO':
+                return f"# Keyspace\r\nkeys:{len(self.data)}\r\n".encode()
+        return ValueError(f"ERR unknown command '{name}'")
+
+def encode_reply(reply):
+    if reply is None:
+        return b'$-1\r\n'
+    if isinstance(reply, Exception):
+        return f"-{reply}\r\n".encode()
+    if isinstance(reply, str):
+        return f"+{reply}\r\n".encode()
+    if isinstance(reply, int):
+        return f":{reply}\r\n".encode()
+    return b'$%d\r\n%s\r\n' % (len(reply), reply)
+
+def make_handler(fake):
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            while True:
+                args = self.read_command()
+                if not args:
+                    return
+                self.wfile.write(encode_reply(fake.run(args)))
+
+        def read_command(self):
+            """One command as a list of bytes arguments (None when the client is gone)"""
+            line = self.rfile.readline()
+            if not line.startswith(b'*'):
+                return None
+            args = []
+            for _ in range(int(line[1:])):
+                length = int(self.rfile.readline()[1:])
+                args.append(self.rfile.read(length + 2)[:-2])
+            return args
+
+    return Handler
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--port', type=int, default=6390)
+    args = parser.parse_args()
+    fake = FakeCacheServer(args.port).start()
+    print(f"Fake cache server at {fake.url}")
+    try:
+        fake.thread.join()
+    except KeyboardInterrupt:
+        fake.stop()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,351 @@
+"""Local stand-in for every upstream API the backend calls.
+
+Serves NASA APOD, NatGeo, the Art Institute (API and IIIF images), the Met
+collection API, JWST, Unsplash (search and images) and OpenAI (chat, streamed
+chat and image generation), each under its own path prefix, with configurable
+latency, error rate and payload sizes.
+
+Run on its own with:
+    python backend/bench/fake_upstream.py --port 8900 --latency 50 --error-rate 0.05
+
+and point the backend at it with the variables from get_upstream_env().
+
+All stand-ins share one host, so the backend's per-host connection pool and
+circuit breaker are shared between them too; injected errors on one upstream
+count against the others.
+"""
+import argparse
+import hashlib
+import io
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+try:
+    from PIL import Image
+except ImportError:  # plain JPEG-looking bytes are enough without variants
+    Image = None
+
+UPSTREAMS = ('nasa', 'natgeo', 'artic', 'artic-iiif', 'met', 'jwst', 'unsplash', 'unsplash-images', 'images', 'openai')
+
+# Latency (seconds) and error rate applied to upstreams without their own setting
+DEFAULT_LATENCY = 0.05
+DEFAULT_ERROR_RATE = 0.0
+
+WORDS = ('nebula', 'light', 'galaxy', 'pigment', 'canvas', 'forest', 'river', 'star',
+         'texture', 'shadow', 'mountain', 'ancient', 'color', 'telescope', 'the', 'and')
+
+def make_text(length, seed=0):
+    """Deterministic filler text of about `length` characters"""
+    rng = random.Random(seed)
+    words = []
+    size = 0
+    while size < length:
+        word = rng.choice(WORDS)
+        words.append(word)
+        size += len(word) + 1
+    return ' '.join(words)
+
+def make_jpeg(size):
+    """A real JPEG of roughly `size` bytes (noise compresses poorly, so size tracks pixels)"""
+    if Image is None:
+        return b'\xff\xd8\xff\xe0' + bytes(max(0, size - 6)) + b'\xff\xd9'
+    side = max(16, int((size / 1.2) ** 0.5))
+    rng = random.Random(side)
+    image = Image.frombytes('RGB', (side, side), rng.randbytes(side * side * 3))
+    buffer = io.BytesIO()
+    image.save(buffer, 'JPEG', quality=85)
+    return buffer.getvalue()
+
+class FakeUpstream:
+    """Threaded HTTP server emulating the upstream APIs.
+
+    `latency` and `error_rate` apply to every upstream unless overridden per name
+    in `latencies` / `error_rates`. Images are `image_bytes` JPEGs that come in
+    `distinct_images` different contents, so content-keyed caches see realistic
+    hit rates. Chat answers are `text_chars` long and streamed a word at a time
+    every `token_interval` seconds.
+    """
+
+    def __init__(self, port=0, latency=DEFAULT_LATENCY, error_rate=DEFAULT_ERROR_RATE, jitter=0.2,
+                 latencies=None, error_rates=None, image_bytes=200_000, distinct_images=20,
+                 text_chars=600, token_interval=0.01):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.jitter = jitter
+        self.latencies = latencies or {}
+        self.error_rates = error_rates or {}
+        self.distinct_images = max(1, distinct_images)
+        self.text_chars = text_chars
+        self.token_interval = token_interval
+        self.image = make_jpeg(image_bytes)
+        self.counts = {name: 0 for name in UPSTREAMS}
+        self.errors = {name: 0 for name in UPSTREAMS}
+        self._lock = threading.Lock()
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), make_handler(self))
+        self.server.daemon_threads = True
+        self.base_url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, name='fake-upstream', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def get_upstream_env(self):
+        """Environment variables that point the backend at this server"""
+        return get_upstream_env(self.base_url)
+
+    def get_image(self, name):
+        """Image bytes for a name; names map onto `distinct_images` different contents"""
+        variant = int(hashlib.md5(name.encode('utf-8')).hexdigest(), 16) % self.distinct_images
+        # Bytes after the JPEG end marker are ignored by decoders but change the hash
+        return self.image + variant.to_bytes(4, 'big')
+
+    def admit(self, upstream):
+        """Count a request, wait out its latency and decide whether it fails"""
+        latency = self.latencies.get(upstream, self.latency)
+        if latency:
+            time.sleep(max(0.0, latency * random.uniform(1 - self.jitter, 1 + self.jitter)))
+        failed = random.random() < self.error_rates.get(upstream, self.error_rate)
+        with self._lock:
+            self.counts[upstream] += 1
+            if failed:
+                self.errors[upstream] += 1
+        return not failed
+
+    def stats(self):
+        with self._lock:
+            return {'requests': dict(self.counts), 'errors': dict(self.errors)}
+
+def get_upstream_env(base_url):
+    """Environment variables that point the backend's upstream URLs at a fake server"""
+    return {
+        'NASA_API': 'bench',
+        'NASA_API_BASE': f"{base_url}/nasa",
+        'NATGEO_API_URL': f"{base_url}/natgeo/api/dailyphoto",
+        'ARTIC_API_BASE': f"{base_url}/artic/api/v1",
+        'ARTIC_IIIF_BASE': f"{base_url}/artic-iiif",
+        'MET_API_BASE': f"{base_url}/met",
+        'JWST_API_BASE': f"{base_url}/jwst",
+        'UNSPLASH_API_BASE': f"{base_url}/unsplash",
+        'UNSPLASH_IMAGES_BASE': f"{base_url}/unsplash-images",
+        'UNSPLASH_ACCESS_KEY': 'bench',
+        'OPENAI_API_BASE': f"{base_url}/openai/v1",
+        'OPENAI_API_KEY': 'bench',
+    }
+
+def make_handler(fake):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, format, *args):
+            pass
+
+        def send_body(self, body, content_type='application/json', status=200):
+            if not isinstance(body, bytes):
+                body = json.dumps(body).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def read_json(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            try:
+                return json.loads(self.rfile.read(length) or b'{}')
+            except ValueError:
+                return {}
+
+        def do_GET(self):
+            self.route('GET')
+
+        def do_POST(self):
+            self.route('POST')
+
+        def route(self, method):
+            url = urlsplit(self.path)
+            upstream, _, path = url.path.lstrip('/').partition('/')
+            body = self.read_json() if method == 'POST' else {}
+            if upstream not in fake.counts:
+                return self.send_body({'error': 'unknown upstream'}, status=404)
+            if not fake.admit(upstream):
+                return self.send_body({'error': 'injected failure'}, status=503)
+
+            handler = getattr(self, 'handle_' + upstream.replace('-', '_'))
+            handler(path, parse_qs(url.query), body)
+
+        def image_url(self, name):
+            return f"{fake.base_url}/images/{name}.jpg"
+
+        def send_image(self, name):
+            self.send_body(fake.get_image(name), content_type='image/jpeg')
+
+        def handle_nasa(self, path, query, body):
+            day = time.strftime('%Y-%m-%d')
+            self.send_body({
+                'media_type': 'image',
+                'url': self.image_url(f"apod-{day}"),
+                'hdurl': self.image_url(f"apod-{day}-hd"),
+                'title': 'Bench Nebula',
+                'explanation': make_text(fake.text_chars, seed=1),
+                'date': day,
+            })
+
+        def handle_natgeo(self, path, query, body):
+            self.send_body({
+                'src': self.image_url(f"natgeo-{time.strftime('%Y-%m-%d')}"),
+                'alt': 'Bench landscape',
+                'description': make_text(fake.text_chars, seed=2),
+                'credit': 'Bench Photographer',
+            })
+
+        def handle_artic(self, path, query, body):
+            page = query.get('page', ['1'])[0]
+            self.send_body({'data': [
+                {
+                    'id': i,
+                    'title': f"Bench Artwork {page}-{i}",
+                    'image_id': f"bench-{page}-{i}",
+                    'artist_display': 'Bench Artist',
+                    'date_display': '1890',
+                    'artist_title': 'Bench Artist',
+                }
+                for i in range(10)
+            ]})
+
+        def handle_artic_iiif(self, path, query, body):
+            self.send_image(path.split('/')[0])
+
+        def handle_met(self, path, query, body):
+            if path == 'search':
+                return self.send_body({'total': 80, 'objectIDs': list(range(1, 81))})
+            object_id = int(path.rsplit('/', 1)[-1])
+            self.send_body({
+                'objectID': object_id,
+                'primaryImage': self.image_url(f"met-{object_id}"),
+                'additionalImages': [],
+                'title': f"Bench Object {object_id}",
+                'artistDisplayName': 'Bench Artist',
+            })
+
+        def handle_jwst(self, path, query, body):
+            program_id = path.rsplit('/', 1)[-1]
+            self.send_body({'body': [], 'observation_files': [
+                {'file_type': 'preview', 'file_url': self.image_url(f"jwst-{program_id}-{random.randrange(10)}")}
+            ]})
+
+        def handle_unsplash(self, path, query, body):
+            photo = random.randrange(1000)
+            self.send_body({'total': 1, 'results': [
+                {'urls': {'regular': f"{fake.base_url}/unsplash-images/photo-{photo}"}}
+            ]})
+
+        def handle_unsplash_images(self, path, query, body):
+            self.send_image(path)
+
+        def handle_images(self, path, query, body):
+            self.send_image(path.rsplit('.', 1)[0])
+
+        def handle_openai(self, path, query, body):
+            if path.endswith('images/generations'):
+                return self.send_body({'created': int(time.time()), 'data': [
+                    {'url': self.image_url(f"generated-{random.randrange(1000)}")}
+                ]})
+            if not path.endswith('chat/completions'):
+                return self.send_body({'error': {'message': 'not emulated'}}, status=404)
+
+            answer = make_text(fake.text_chars, seed=len(json.dumps(body.get('messages', []))))
+            if body.get('stream'):
+                return self.stream_chat(answer)
+            tokens = len(answer) // 4
+            self.send_body({
+                'id': 'chatcmpl-bench',
+                'object': 'chat.completion',
+                'created': int(time.time()),
+                'model': body.get('model', ''),
+                'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': answer}, 'finish_reason': 'stop'}],
+                'usage': {'prompt_tokens': 50, 'completion_tokens': tokens, 'total_tokens': 50 + tokens},
+            })
+
+        def stream_chat(self, answer):
+            """Send the answer as server-sent chunks, one word at a time"""
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/event-stream')
+            self.send_header('Connection', 'close')
+            self.end_headers()
+            self.close_connection = True
+            for word in answer.split(' '):
+                chunk = {
+                    'id': 'chatcmpl-bench',
+                    'object': 'chat.completion.chunk',
+                    'choices': [{'index': 0, 'delta': {'content': word + ' '}, 'finish_reason': None}],
+                }
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode('utf-8'))
+                self.wfile.flush()
+                if fake.token_interval:
+                    time.sleep(fake.token_interval)
+            self.wfile.write(b"data: [DONE]\n\n")
+
+    return Handler
+
+def parse_overrides(values, cast=float):
+    """Parse repeated NAME=VALUE options into a dict"""
+    overrides = {}
+    for value in values or []:
+        name, _, setting = value.partition('=')
+        if name not in UPSTREAMS:
+            raise argparse.ArgumentTypeError(f"Unknown upstream '{name}' (one of {', '.join(UPSTREAMS)})")
+        overrides[name] = cast(setting)
+    return overrides
+
+def add_upstream_arguments(parser):
+    """Options shared by this script and the benchmark runner"""
+    parser.add_argument('--latency', type=float, default=DEFAULT_LATENCY * 1000, help='upstream latency in ms')
+    parser.add_argument('--jitter', type=float, default=0.2, help='latency jitter as a fraction')
+    parser.add_argument('--error-rate', type=float, default=DEFAULT_ERROR_RATE, help='fraction of upstream requests failing with 503')
+    parser.add_argument('--upstream-latency', action='append', metavar='NAME=MS', help='latency for one upstream')
+    parser.add_argument('--upstream-error-rate', action='append', metavar='NAME=RATE', help='error rate for one upstream')
+    parser.add_argument('--image-kb', type=int, default=200, help='approximate image size in KB')
+    parser.add_argument('--distinct-images', type=int, default=20, help='number of different image contents')
+    parser.add_argument('--text-chars', type=int, default=600, help='length of descriptions and chat answers')
+    parser.add_argument('--token-interval', type=float, default=10, help='ms between streamed chat tokens')
+
+def make_fake_upstream(args, port=0):
+    """Build a FakeUpstream from parsed add_upstream_arguments() options"""
+    return FakeUpstream(
+        port=port,
+        latency=args.latency / 1000,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        latencies={name: ms / 1000 for name, ms in parse_overrides(args.upstream_latency).items()},
+        error_rates=parse_overrides(args.upstream_error_rate),
+        image_bytes=args.image_kb * 1024,
+        distinct_images=args.distinct_images,
+        text_chars=args.text_chars,
+        token_interval=args.token_interval / 1000,
+    )
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--port', type=int, default=8900)
+    add_upstream_arguments(parser)
+    args = parser.parse_args()
+    fake = make_fake_upstream(args, port=args.port).start()
+    print(f"Fake upstreams at {fake.base_url}; backend environment:")
+    for name, value in fake.get_upstream_env().items():
+        print(f"  {name}={value}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        fake.stop()
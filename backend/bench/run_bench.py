@@ -0,0 +1,274 @@
+"""Load benchmark of the backend against local upstream stand-ins.
+
+Starts fake_upstream in-process, launches the backend in a subprocess (the Flask
+app, or the ASGI mode with --mode async) inside a scratch directory so its caches
+and images never touch the repo, then drives every route with concurrent clients
+and reports p50/p95/p99 latency, RPS, errors, throttled (429/503) responses,
+response size and the server's memory per route. Admission control is lifted
+unless --admission is given; latency and size cover the requests not throttled.
+
+    python backend/bench/run_bench.py
+    python backend/bench/run_bench.py --mode async --concurrency 32 --requests 500
+    python backend/bench/run_bench.py --latency 300 --error-rate 0.05 --json results.json
+    python backend/bench/run_bench.py --replicas 3 --shared-cache
+    python backend/bench/run_bench.py --admission --routes ask,search-image
+
+With --replicas, requests are spread at random over several backends, each with
+its own scratch directory like separate hosts; --shared-cache points them all at
+a local Redis-compatible stand-in, so the upstream counts show how many fetches
+the replicas share.
+
+Each route gets one untimed request first (reported as "cold") so one-off work
+like building the daily set doesn't skew its percentiles.
+"""
+import argparse
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import requests
+
+from fake_cache_server import FakeCacheServer
+from fake_upstream import add_upstream_arguments, make_fake_upstream
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Backend settings that take admission control out of the way
+ADMISSION_LIFTED_ENV = {
+    'CLIENT_QUOTA_PER_MINUTE': '1000000',
+    'CLIENT_QUOTA_BURST': '1000000',
+    **{name: '10000' for name in (
+        'ASK_CONCURRENCY', 'SEARCH_CONCURRENCY', 'GENERATE_CONCURRENCY',
+        'ASYNC_ASK_CONCURRENCY', 'ASYNC_SEARCH_CONCURRENCY', 'ASYNC_GENERATE_CONCURRENCY')},
+}
+
+QUESTIONS = [
+    "What is a nebula?",
+    "How far away is this galaxy?",
+    "Who painted this and when?",
+    "What technique was used in this painting?",
+    "Why is the sky blue in this photo?",
+    "How did this mountain form?",
+    "What does the telescope actually measure?",
+    "What makes this landscape unusual?",
+]
+
+def get_scenarios():
+    """Route name -> (method, path, JSON body factory, extra headers)"""
+    today = datetime.now().strftime('%Y-%m-%d')
+    return {
+        'daily-images': ('GET', '/api/daily-images', None, {}),
+        'daily-images-archive': ('GET', '/api/daily-images?limit=10', None, {}),
+        'daily-image': ('GET', '/api/daily-images/nasa', None, {}),
+        'daily-image-dated': ('GET', f'/api/daily-images/art/{today}', None, {}),
+        'daily-image-variant': ('GET', f'/api/daily-images/natgeo/{today}?w=480', None, {'Accept': 'image/webp,*/*'}),
+        'ask': ('POST', '/api/ask', lambda: {'question': random.choice(QUESTIONS)}, {}),
+        'ask-stream': ('POST', '/api/ask?stream=1', lambda: {'question': random.choice(QUESTIONS) + ' Explain briefly.'}, {}),
+        'search-image': ('POST', '/api/search-image', lambda: {'prompt': 'show me something', 'category': random.choice(['space', 'art', 'earth'])}, {}),
+        'search-images': ('POST', '/api/search-images', lambda: {'items': [{'prompt': 'show me something', 'category': c} for c in ('space', 'art', 'earth')]}, {}),
+        'generate-image': ('POST', '/api/generate-image', lambda: {'prompt': 'a lighthouse at dusk'}, {}),
+        'generate-image-uncached': ('POST', '/api/generate-image', lambda: {'prompt': f'a lighthouse at dusk, take {random.random()}'}, {}),
+        'status-openai': ('GET', '/api/status/openai', None, {}),
+        'metrics': ('GET', '/metrics', None, {}),
+    }
+
+def get_free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def start_backend(mode, port, env, workdir):
+    """Launch the backend in a subprocess and wait until it answers"""
+    if mode == 'async':
+        command = [sys.executable, '-m', 'uvicorn', 'async_app:app', '--app-dir', BACKEND_DIR,
+                   '--port', str(port), '--log-level', 'warning']
+    else:
+        command = [sys.executable, '-c',
+                   f"import sys; sys.path.insert(0, {BACKEND_DIR!r}); import app; "
+                   f"app.app.run(port={port}, threaded=True)"]
+    log = open(os.path.join(workdir, 'backend.log'), 'w')
+    process = subprocess.Popen(command, cwd=workdir, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Backend exited with {process.returncode}, see {log.name}")
+        try:
+            requests.get(f"{base_url}/api/status/openai", timeout=1)
+            return process, base_url
+        except requests.RequestException:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError("Backend did not start within 30s")
+
+def get_memory(pid):
+    """Current and peak resident memory of a process in MB (Linux /proc, else psutil)"""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            fields = dict(line.split(':', 1) for line in f)
+        return int(fields['VmRSS'].split()[0]) / 1024, int(fields['VmHWM'].split()[0]) / 1024
+    except (OSError, KeyError):
+        pass
+    try:
+        import psutil
+        rss = psutil.Process(pid).memory_info().rss / (1024 * 1024)
+        return rss, None
+    except Exception:
+        return None, None
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+def send(session, base_url, scenario, timeout):
+    """Send one request (to a random one of several base URLs if given a list) and
+    return (latency seconds, status or None, body bytes)"""
+    method, path, make_body, headers = scenario
+    if isinstance(base_url, list):
+        base_url = random.choice(base_url)
+    start = time.perf_counter()
+    try:
+        response = session.request(method, base_url + path, json=make_body() if make_body else None,
+                                   headers=headers, timeout=timeout)
+        size = len(response.content)
+        return time.perf_counter() - start, response.status_code, size
+    except requests.RequestException:
+        return time.perf_counter() - start, None, 0
+
+def run_scenario(base_url, scenario, total, concurrency, timeout):
+    """Fire `total` requests from `concurrency` clients; returns latency and status samples"""
+    local = threading.local()
+    counter = iter(range(total))
+    counter_lock = threading.Lock()
+    samples = []
+
+    def worker():
+        if not hasattr(local, 'session'):
+            local.session = requests.Session()
+        while True:
+            with counter_lock:
+                if next(counter, None) is None:
+                    return
+            samples.append(send(local.session, base_url, scenario, timeout))
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for _ in range(concurrency):
+            executor.submit(worker)
+    return samples, time.perf_counter() - start
+
+def summarize(name, cold, samples, elapsed, memory):
+    # Shed requests are counted apart; latency and size cover the requests served
+    throttled = sum(1 for s in samples if s[1] in (429, 503))
+    errors = sum(1 for s in samples if s[1] is None or (s[1] >= 500 and s[1] != 503))
+    served = [s for s in samples if s[1] not in (429, 503)] or samples
+    latencies = sorted(s[0] for s in served)
+    return {
+        'route': name,
+        'requests': len(samples),
+        'errors': errors,
+        'throttled': throttled,
+        'rps': len(samples) / elapsed if elapsed else 0.0,
+        'cold_ms': cold[0] * 1000,
+        'p50_ms': percentile(latencies, 0.50) * 1000,
+        'p95_ms': percentile(latencies, 0.95) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        'max_ms': latencies[-1] * 1000,
+        'avg_bytes': sum(s[2] for s in served) / len(served),
+        'rss_mb': memory[0],
+        'peak_rss_mb': memory[1],
+    }
+
+def print_report(results):
+    columns = [
+        ('route', 20, '{}'), ('requests', 8, '{}'), ('errors', 6, '{}'), ('throttled', 9, '{}'), ('rps', 8, '{:.1f}'),
+        ('cold_ms', 9, '{:.1f}'), ('p50_ms', 9, '{:.1f}'), ('p95_ms', 9, '{:.1f}'), ('p99_ms', 9, '{:.1f}'),
+        ('avg_bytes', 10, '{:.0f}'), ('rss_mb', 8, '{:.1f}'),
+    ]
+    print(' '.join(name.rjust(width) for name, width, _ in columns))
+    for result in results:
+        print(' '.join(
+            ('-' if result[name] is None else fmt.format(result[name])).rjust(width)
+            for name, width, fmt in columns
+        ))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--mode', choices=['sync', 'async'], default='sync')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--requests', type=int, default=200, help='requests per route')
+    parser.add_argument('--routes', help='comma-separated subset of: ' + ', '.join(get_scenarios()))
+    parser.add_argument('--timeout', type=float, default=60)
+    parser.add_argument('--openai-rpm', type=int, default=100000, help='backend OPENAI_RPM (high, so the limiter stays out of the way)')
+    parser.add_argument('--openai-tpm', type=int, default=100000000, help='backend OPENAI_TPM')
+    parser.add_argument('--json', help='also write the results to this file')
+    parser.add_argument('--keep', action='store_true', help="keep the backend's scratch directory")
+    parser.add_argument('--replicas', type=int, default=1, help='backend processes to spread requests over')
+    parser.add_argument('--shared-cache', action='store_true', help='share a local Redis-compatible cache between the replicas')
+    parser.add_argument('--admission', action='store_true',
+                        help="keep the backend's admission pools and client quotas (lifted by default, "
+                             "since every bench client comes from one address)")
+    add_upstream_arguments(parser)
+    args = parser.parse_args()
+
+    scenarios = get_scenarios()
+    names = args.routes.split(',') if args.routes else list(scenarios)
+
+    fake = make_fake_upstream(args).start()
+    cache_server = FakeCacheServer().start() if args.shared_cache else None
+    env = dict(os.environ, **fake.get_upstream_env(),
+               OPENAI_RPM=str(args.openai_rpm), OPENAI_TPM=str(args.openai_tpm),
+               DAILY_PREWARM='0', PYTHONUNBUFFERED='1')
+    if cache_server:
+        env['CACHE_URL'] = cache_server.url
+    if not args.admission:
+        env.update(ADMISSION_LIFTED_ENV)
+    workdirs, processes, base_urls = [], [], []
+    for _ in range(args.replicas):
+        workdir = tempfile.mkdtemp(prefix='bench_')
+        process, base_url = start_backend(args.mode, get_free_port(), env, workdir)
+        workdirs.append(workdir)
+        processes.append(process)
+        base_urls.append(base_url)
+    print(f"Backend ({args.mode}) at {', '.join(base_urls)}, upstreams at {fake.base_url}, "
+          f"scratch dir {', '.join(workdirs)}" + (f", shared cache at {cache_server.url}" if cache_server else ''))
+
+    results = []
+    try:
+        for name in names:
+            scenario = scenarios[name]
+            cold = send(requests.Session(), base_urls[0], scenario, args.timeout)
+            samples, elapsed = run_scenario(base_urls, scenario, args.requests, args.concurrency, args.timeout)
+            results.append(summarize(name, cold, samples, elapsed, get_memory(processes[0].pid)))
+    finally:
+        for process in processes:
+            process.terminate()
+            process.wait(timeout=10)
+        fake.stop()
+        if cache_server:
+            cache_server.stop()
+
+    print_report(results)
+    print(f"Upstream requests: {json.dumps(fake.stats()['requests'])}")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'mode': args.mode, 'args': vars(args), 'results': results, 'upstream': fake.stats()}, f, indent=2)
+    if not args.keep:
+        import shutil
+        for workdir in workdirs:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+if __name__ == '__main__':
+    main()
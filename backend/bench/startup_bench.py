@@ -0,0 +1,175 @@
+"""Startup-time benchmark of the backend.
+
+Measures, in a scratch directory so no caches are touched:
+  - importing the app module and building the app (median of --runs fresh interpreters)
+  - the dev server (python backend/app.py, FLASK_DEBUG=0): spawn to first response
+  - gunicorn with backend/gunicorn.conf.py (if installed): spawn to first response,
+    and how long one more worker takes to boot from the preloaded master (SIGTTIN),
+    which is what scaling out under load costs
+
+    python backend/bench/startup_bench.py
+    python backend/bench/startup_bench.py --runs 10 --json startup.json
+
+The slowest imports of one run are listed too, to spot what regressed.
+"""
+import argparse
+import json
+import os
+import re
+import signal
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import requests
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMPORT_SCRIPT = (
+    "import sys, time; sys.path.insert(0, {backend!r}); start = time.perf_counter(); "
+    "import app; imported = time.perf_counter(); app.create_app(); created = time.perf_counter(); "
+    "print(imported - start, created - imported)"
+)
+
+WORKER_READY = re.compile(r'Worker (\d+) ready in ([\d.]+) ms')
+
+def get_env():
+    # Keep the benchmark offline: no scheduled pre-warm fetching real upstreams
+    return dict(os.environ, DAILY_PREWARM='0', PYTHONUNBUFFERED='1')
+
+def measure_import(workdir, runs):
+    """Seconds to import the app module and to build the app, per fresh interpreter"""
+    imports, creates = [], []
+    for _ in range(runs):
+        output = subprocess.check_output(
+            [sys.executable, '-c', IMPORT_SCRIPT.format(backend=BACKEND_DIR)], cwd=workdir, env=get_env())
+        imported, created = map(float, output.split()[-2:])
+        imports.append(imported)
+        creates.append(created)
+    return imports, creates
+
+def get_slowest_imports(workdir, count=10):
+    """(cumulative ms, module) of the top-level imports that took longest"""
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f"import sys; sys.path.insert(0, {BACKEND_DIR!r}); import app"],
+        cwd=workdir, env=get_env(), capture_output=True, text=True)
+    modules = []
+    for line in result.stderr.splitlines():
+        parts = line.split('|')
+        # Only modules imported directly by the backend (one level of indentation)
+        if len(parts) == 3 and parts[1].strip().isdigit() and re.match(r' {1,3}\S', parts[2]):
+            modules.append((int(parts[1]) / 1000, parts[2].strip()))
+    return sorted(modules, reverse=True)[:count]
+
+def wait_until_ready(process, url, timeout=60):
+    """Seconds until `url` answers, or None if the process exits or times out"""
+    start = time.perf_counter()
+    while time.perf_counter() - start < timeout:
+        if process.poll() is not None:
+            return None
+        try:
+            requests.get(url, timeout=1)
+            return time.perf_counter() - start
+        except requests.RequestException:
+            time.sleep(0.01)
+    return None
+
+def stop(process):
+    process.terminate()
+    try:
+        process.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+def measure_dev_server(workdir, port):
+    """Spawn-to-first-response seconds of the Flask dev server without the reloader"""
+    env = dict(get_env(), FLASK_DEBUG='0')
+    command = [sys.executable, '-c',
+               f"import sys; sys.path.insert(0, {BACKEND_DIR!r}); import app; app.app.run(port={port})"]
+    process = subprocess.Popen(command, cwd=workdir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        return wait_until_ready(process, f"http://127.0.0.1:{port}/api/status/openai")
+    finally:
+        stop(process)
+
+def measure_gunicorn(workdir, port, workers):
+    """Spawn-to-first-response seconds under gunicorn, and the boot time (ms) of a worker added with SIGTTIN"""
+    log_path = os.path.join(workdir, 'gunicorn.log')
+    env = dict(get_env(), BIND=f"127.0.0.1:{port}", WEB_CONCURRENCY=str(workers))
+    command = [sys.executable, '-m', 'gunicorn', '-c', os.path.join(BACKEND_DIR, 'gunicorn.conf.py'),
+               '--error-logfile', log_path]
+    process = subprocess.Popen(command, cwd=workdir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        ready = wait_until_ready(process, f"http://127.0.0.1:{port}/api/status/openai")
+        if ready is None:
+            return None, None
+
+        def get_boot_times():
+            with open(log_path) as f:
+                return WORKER_READY.findall(f.read())
+
+        deadline = time.monotonic() + 10
+        while len(get_boot_times()) < workers and time.monotonic() < deadline:
+            time.sleep(0.05)
+        booted = len(get_boot_times())
+        process.send_signal(signal.SIGTTIN)
+        while len(get_boot_times()) <= booted and time.monotonic() < deadline + 10:
+            time.sleep(0.05)
+        boot_times = get_boot_times()
+        scale_out = float(boot_times[-1][1]) if len(boot_times) > booted else None
+        return ready, scale_out
+    finally:
+        stop(process)
+
+def get_free_port():
+    import socket
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--runs', type=int, default=5, help='fresh interpreters per measurement')
+    parser.add_argument('--workers', type=int, default=2, help='gunicorn workers to start with')
+    parser.add_argument('--json', help='also write the results to this file')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='startup_bench_')
+    results = {}
+    try:
+        imports, creates = measure_import(workdir, args.runs)
+        results['import_ms'] = statistics.median(imports) * 1000
+        results['create_app_ms'] = statistics.median(creates) * 1000
+        results['slowest_imports'] = get_slowest_imports(workdir)
+
+        dev = [measure_dev_server(workdir, get_free_port()) for _ in range(args.runs)]
+        dev = [d for d in dev if d is not None]
+        results['dev_server_ready_ms'] = statistics.median(dev) * 1000 if dev else None
+
+        try:
+            import gunicorn  # noqa: F401
+        except ImportError:
+            print("gunicorn is not installed, skipping it")
+        else:
+            ready, scale_out = measure_gunicorn(workdir, get_free_port(), args.workers)
+            results['gunicorn_ready_ms'] = ready * 1000 if ready is not None else None
+            results['gunicorn_new_worker_ms'] = scale_out
+    finally:
+        import shutil
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    for name, value in results.items():
+        if name == 'slowest_imports':
+            continue
+        print(f"{name:>24} {'-' if value is None else f'{value:.1f}'}")
+    print("Slowest imports (ms):")
+    for duration, module in results['slowest_imports']:
+        print(f"{duration:>10.1f}  {module}")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+import glob
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+
+# Page size of range queries, by default and at most
+ARCHIVE_PAGE_SIZE = 10
+ARCHIVE_MAX_PAGE_SIZE = 100
+
+DATA_FILE_DATE = re.compile(r'daily_data_(\d{4}-\d{2}-\d{2})\.json$')
+
+class DailyArchive:
+    """Every day's daily image set, one row per date and category, in SQLite.
+
+    The (date, category) primary key doubles as the index for single-day lookups
+    and for paging through date ranges newest first.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory and not os.path.exists(directory):
+                os.makedirs(directory)
+            conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS daily_images ('
+                'date TEXT NOT NULL, category TEXT NOT NULL, data TEXT NOT NULL, '
+                'updated_at REAL NOT NULL, PRIMARY KEY (date, category))'
+            )
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def put(self, date, category, value):
+        """Store (or replace) one source's entry for a day"""
+        with self._lock:
+            conn = self._connect()
+            conn.execute(
+                'INSERT OR REPLACE INTO daily_images (date, category, data, updated_at) VALUES (?, ?, ?, ?)',
+                (date, category, json.dumps(value), time.time())
+            )
+            conn.commit()
+
+    def get_day(self, date):
+        """A day's set as {category: entry}, or None if the day isn't archived"""
+        with self._lock:
+            rows = self._connect().execute(
+                'SELECT category, data FROM daily_images WHERE date = ? ORDER BY category', (date,)
+            ).fetchall()
+        if not rows:
+            return None
+        return {category: json.loads(data) for category, data in rows}
+
+    def get_days(self, start=None, end=None, before=None, limit=ARCHIVE_PAGE_SIZE):
+        """Days between `start` and `end` (inclusive), newest first, older than `before`.
+
+        Returns (days, next_before): a list of {'date', 'images'} and the value of
+        `before` for the next page, or None on the last page.
+        """
+        limit = max(1, min(limit, ARCHIVE_MAX_PAGE_SIZE))
+        conditions, params = [], []
+        for clause, value in (('date >= ?', start), ('date <= ?', end), ('date < ?', before)):
+            if value:
+                conditions.append(clause)
+                params.append(value)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+
+        with self._lock:
+            conn = self._connect()
+            # One row more than a page tells whether another page follows
+            dates = [row[0] for row in conn.execute(
+                f'SELECT DISTINCT date FROM daily_images {where} ORDER BY date DESC LIMIT ?',
+                params + [limit + 1]
+            )]
+            has_more = len(dates) > limit
+            dates = dates[:limit]
+            if not dates:
+                return [], None
+            rows = conn.execute(
+                'SELECT date, category, data FROM daily_images WHERE date >= ? AND date <= ? '
+                'ORDER BY date DESC, category',
+                (dates[-1], dates[0])
+            ).fetchall()
+
+        days = {date: {} for date in dates}
+        for date, category, data in rows:
+            if date in days:
+                days[date][category] = json.loads(data)
+        return [{'date': date, 'images': images} for date, images in days.items()], dates[-1] if has_more else None
+
+    def import_json_files(self, directory):
+        """Backfill from daily_data_<date>.json files, keeping entries already archived.
+
+        Returns the number of (date, category) entries added.
+        """
+        added = 0
+        for path in sorted(glob.glob(os.path.join(directory, 'daily_data_*.json'))):
+            match = DATA_FILE_DATE.search(path)
+            if not match:
+                continue
+            try:
+                with open(path, 'r') as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                continue
+            updated_at = os.path.getmtime(path)
+            with self._lock:
+                conn = self._connect()
+                for category, value in data.items():
+                    cursor = conn.execute(
+                        'INSERT OR IGNORE INTO daily_images (date, category, data, updated_at) VALUES (?, ?, ?, ?)',
+                        (match.group(1), category, json.dumps(value), updated_at)
+                    )
+                    added += cursor.rowcount
+                conn.commit()
+        return added
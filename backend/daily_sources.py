@@ -0,0 +1,117 @@
+import json
+import os
+import threading
+import time
+
+from file_utils import atomic_write, FileLock
+
+# Default freshness and negative-cache lifetimes (seconds) of a source's entry
+SOURCE_TTL = 24 * 3600
+SOURCE_NEGATIVE_TTL = 300
+
+# How often (seconds) the in-memory entries are re-read to pick up other workers' fetches
+SOURCE_RELOAD_INTERVAL = 30
+
+class DailySourceCache:
+    """Last good result of each daily source, with its own freshness and negative TTL.
+
+    A result is fresh while it is from today and younger than its source's TTL, but
+    it stays servable after that (even from a previous day) until a refetch replaces
+    it. A failed fetch is remembered so the source isn't retried before its negative
+    TTL runs out. Entries live in one small JSON file shared by worker processes.
+    """
+
+    def __init__(self, path, ttls=None, negative_ttls=None):
+        self.path = path
+        self.ttls = ttls or {}
+        self.negative_ttls = negative_ttls or {}
+        self.entries = None
+        self._loaded_at = 0
+        self._lock = threading.Lock()
+
+    def _load(self):
+        try:
+            with open(self.path, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _get_entries(self):
+        with self._lock:
+            if self.entries is None or time.monotonic() - self._loaded_at > SOURCE_RELOAD_INTERVAL:
+                self.entries = self._load()
+                self._loaded_at = time.monotonic()
+            return self.entries
+
+    def reload(self):
+        """Re-read the entries now, e.g. after another worker fetched a source"""
+        with self._lock:
+            self.entries = None
+
+    def get_values(self):
+        """The last good result of every source that has one"""
+        return {
+            category: entry['value']
+            for category, entry in self._get_entries().items() if entry.get('value')
+        }
+
+    def get_value(self, category):
+        return self._get_entries().get(category, {}).get('value')
+
+    def fresh_for(self, category, today):
+        """Seconds until a source's entry goes stale (0 if it already is)"""
+        entry = self._get_entries().get(category, {})
+        if not entry.get('value') or entry['value'].get('date') != today:
+            return 0
+        age = time.time() - entry['fetched_at']
+        return max(0, self.ttls.get(category, SOURCE_TTL) - age)
+
+    def needs_refresh(self, category, today):
+        """Whether a source is stale and not held off by a recent failure"""
+        if self.fresh_for(category, today) > 0:
+            return False
+        failed_at = self._get_entries().get(category, {}).get('failed_at')
+        return not failed_at or time.time() - failed_at > self.negative_ttls.get(category, SOURCE_NEGATIVE_TTL)
+
+    def _update(self, category, changes):
+        """Merge changes into a source's entry on disk and in memory"""
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        with FileLock(self.path + '.lock'):
+            entries = self._load()
+            entries.setdefault(category, {}).update(changes)
+            atomic_write(self.path, json.dumps(entries), mode='w')
+        with self._lock:
+            self.entries = entries
+            self._loaded_at = time.monotonic()
+
+    def record_success(self, category, value, fetched_at=None):
+        """Store a fetched value; `fetched_at` backdates it (e.g. when another replica fetched it)"""
+        self._update(category, {'value': value, 'fetched_at': fetched_at or time.time(), 'failed_at': None})
+
+    def update_value(self, category, update):
+        """Replace a source's value with update(value), keeping when it was fetched;
+        returns the new value, or None if update() returned None"""
+        with FileLock(self.path + '.lock'):
+            entries = self._load()
+            value = entries.get(category, {}).get('value')
+            value = value and update(value)
+            if not value:
+                return None
+            entries[category]['value'] = value
+            atomic_write(self.path, json.dumps(entries), mode='w')
+        with self._lock:
+            self.entries = entries
+            self._loaded_at = time.monotonic()
+        return value
+
+    def record_failure(self, category):
+        """Keep the last good value but hold off retries for the negative TTL"""
+        self._update(category, {'failed_at': time.time()})
+
+    def seed(self, data):
+        """Fill sources with no entry yet from a previously saved daily set"""
+        for category, value in data.items():
+            if not self._get_entries().get(category):
+                self._update(category, {'value': value, 'fetched_at': time.time(), 'failed_at': None})
@@ -0,0 +1,33 @@
+import hashlib
+
+from sqlite_cache import SQLiteCache
+
+# Default lifetime (seconds) and size bound of the description cache
+DESCRIPTION_TTL = 30 * 24 * 3600
+DESCRIPTION_MAX_ENTRIES = 5000
+
+def make_description_key(content_hash, *prompt_parts):
+    """Key a description by the image's content hash and everything sent with it"""
+    sha = hashlib.sha256(content_hash.encode('utf-8'))
+    for part in prompt_parts:
+        sha.update(b'\0')
+        sha.update(part.encode('utf-8'))
+    return sha.hexdigest()
+
+class DescriptionCache(SQLiteCache):
+    """Vision-model descriptions stored in SQLite, with TTL and LRU eviction"""
+
+    table = 'descriptions'
+    columns = (('description', 'TEXT NOT NULL'),)
+
+    def __init__(self, path, ttl=DESCRIPTION_TTL, max_entries=DESCRIPTION_MAX_ENTRIES):
+        super().__init__(path, ttl, max_entries)
+
+    def get(self, key):
+        """Return a cached description, or None if missing or expired"""
+        row = self.get_row(key, ('description',))
+        return row[0] if row else None
+
+    def put(self, key, description):
+        """Store a description, evicting expired and least recently used entries"""
+        self.put_row(key, {'description': description})
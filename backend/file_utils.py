@@ -0,0 +1,85 @@
+import os
+import tempfile
+import time
+
+import telemetry
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+def atomic_write(path, data, mode='wb'):
+    """Write data to path via a temp file in the same directory and an atomic rename"""
+    directory = os.path.dirname(path) or '.'
+    with telemetry.span('disk_write', target=os.path.basename(os.path.abspath(directory))):
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp_', suffix=os.path.basename(path))
+        try:
+            with os.fdopen(fd, mode) as f:
+                if callable(data):
+                    data(f)
+                else:
+                    f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+        except Exception:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+    return path
+
+class FileLock:
+    """Advisory lock on a file, shared between processes (e.g. gunicorn workers)"""
+
+    def __init__(self, path, poll_interval=0.1):
+        self.path = path
+        self.poll_interval = poll_interval
+        self._fd = None
+
+    def _try_lock(self, fd):
+        try:
+            if fcntl:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                os.lseek(fd, 0, os.SEEK_SET)
+                msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+            return True
+        except OSError:
+            return False
+
+    def acquire(self, blocking=True, timeout=None):
+        """Acquire the lock; returns False if it could not be taken in time"""
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self._try_lock(fd):
+            if not blocking or (deadline is not None and time.monotonic() >= deadline):
+                os.close(fd)
+                return False
+            time.sleep(self.poll_interval)
+        self._fd = fd
+        return True
+
+    def release(self):
+        """Release the lock if held"""
+        if self._fd is None:
+            return
+        try:
+            if fcntl:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+            else:
+                os.lseek(self._fd, 0, os.SEEK_SET)
+                msvcrt.locking(self._fd, msvcrt.LK_UNLCK, 1)
+        finally:
+            os.close(self._fd)
+            self._fd = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
@@ -0,0 +1,37 @@
+import hashlib
+
+from sqlite_cache import SQLiteCache
+
+# Default lifetime (seconds) and size bound of the generation cache
+GENERATION_TTL = 30 * 24 * 3600
+GENERATION_MAX_ENTRIES = 5000
+
+def normalize_prompt(prompt):
+    """Lowercase a prompt and collapse its whitespace"""
+    return ' '.join(prompt.lower().split())
+
+def make_generation_key(prompt, size, model):
+    """Key a generated image by its normalized prompt, size and model"""
+    sha = hashlib.sha256(normalize_prompt(prompt).encode('utf-8'))
+    for part in (size, model):
+        sha.update(b'\0')
+        sha.update(part.encode('utf-8'))
+    return sha.hexdigest()
+
+class GenerationCache(SQLiteCache):
+    """Content hashes of generated images (in the image store) stored in SQLite, with TTL and LRU eviction"""
+
+    table = 'generations'
+    columns = (('prompt', 'TEXT NOT NULL'), ('size', 'TEXT NOT NULL'), ('content_hash', 'TEXT NOT NULL'))
+
+    def __init__(self, path, ttl=GENERATION_TTL, max_entries=GENERATION_MAX_ENTRIES):
+        super().__init__(path, ttl, max_entries)
+
+    def get(self, key):
+        """Return a generated image's content hash, or None if missing or expired"""
+        row = self.get_row(key, ('content_hash',))
+        return row[0] if row else None
+
+    def put(self, key, prompt, size, content_hash):
+        """Store a generated image's content hash, evicting expired and least recently used entries"""
+        self.put_row(key, {'prompt': prompt, 'size': size, 'content_hash': content_hash})
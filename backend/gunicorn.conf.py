@@ -0,0 +1,32 @@
+"""gunicorn settings for backend/wsgi.py: gunicorn -c backend/gunicorn.conf.py"""
+import os
+import time
+
+# The backend modules import each other as top-level modules
+pythonpath = os.path.dirname(os.path.abspath(__file__))
+wsgi_app = 'wsgi:app'
+
+bind = os.getenv('BIND', '0.0.0.0:3001')
+workers = int(os.getenv('WEB_CONCURRENCY', '4'))
+# Requests mostly wait on upstreams, so each worker serves several on threads; the
+# admission-controlled routes run at most 10 at once (see app.route_limiters), so
+# the remaining threads stay free for the cheap cached routes
+worker_class = 'gthread'
+threads = int(os.getenv('GUNICORN_THREADS', '16'))
+timeout = 60
+graceful_timeout = 30
+
+# Import the app and load shared state once in the master, before forking workers
+preload_app = True
+
+def pre_fork(server, worker):
+    worker.boot_started = time.perf_counter()
+
+def post_fork(server, worker):
+    # Threads don't survive the fork, so each worker starts its own scheduler;
+    # per-source file locks keep the workers from fetching the same source twice
+    import app
+    app.start_daily_prewarm()
+
+def post_worker_init(worker):
+    worker.log.info("Worker %s ready in %.1f ms", worker.pid, (time.perf_counter() - worker.boot_started) * 1000)
@@ -0,0 +1,243 @@
+import threading
+import time
+from contextlib import asynccontextmanager
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import telemetry
+
+# Only needed by the async serving mode, so imported on first use, see import_httpx()
+httpx = None
+
+# (connect, read) timeouts in seconds per upstream host
+HOST_TIMEOUTS = {
+    'api.nasa.gov': (3.05, 30),
+    'apod.nasa.gov': (3.05, 30),
+    'natgeoapi.herokuapp.com': (3.05, 30),
+    'api.artic.edu': (3.05, 30),
+    'www.artic.edu': (3.05, 30),
+    'collectionapi.metmuseum.org': (3.05, 10),
+    'api.jwstapi.com': (3.05, 10),
+    'api.unsplash.com': (3.05, 10),
+}
+DEFAULT_TIMEOUT = (3.05, 20)
+
+# Connections kept alive per host
+POOL_MAXSIZE = 20
+
+# Total concurrent connections of the async client, across hosts
+ASYNC_MAX_CONNECTIONS = 200
+
+# Consecutive failures that open a host's breaker, and how long it stays open
+BREAKER_FAILURE_THRESHOLD = 5
+BREAKER_RESET_TIMEOUT = 30
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a host whose circuit breaker is open"""
+
+class CircuitBreaker:
+    """Stops calling a host after repeated failures, then lets one trial call through"""
+
+    def __init__(self, failure_threshold=BREAKER_FAILURE_THRESHOLD, reset_timeout=BREAKER_RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return 'half-open'
+        return 'open'
+
+    def allow_request(self):
+        """Whether a call may go out now"""
+        with self._lock:
+            state = self.state
+            if state == 'closed':
+                return True
+            if state == 'half-open' and not self.trial_in_flight:
+                self.trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_in_flight = False
+
+    def cancel_trial(self):
+        """Let another call be the trial when this one ended without an outcome, e.g. cancelled"""
+        with self._lock:
+            self.trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self.trial_in_flight = False
+            if self.failures >= self.failure_threshold or self.opened_at is not None:
+                self.opened_at = time.monotonic()
+
+sessions = {}
+breakers = {}
+registry_lock = threading.Lock()
+
+def make_session():
+    """Create a keep-alive session with bounded retries and exponential backoff"""
+    retry = Retry(
+        total=2,
+        backoff_factor=0.3,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=('GET', 'HEAD'),
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_MAXSIZE, max_retries=retry)
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+def get_session(host):
+    """Get the pooled session for a host, creating it on first use"""
+    session = sessions.get(host)
+    if session is None:
+        with registry_lock:
+            session = sessions.setdefault(host, make_session())
+    return session
+
+def get_breaker(host):
+    """Get the circuit breaker for a host, creating it on first use"""
+    breaker = breakers.get(host)
+    if breaker is None:
+        with registry_lock:
+            breaker = breakers.setdefault(host, CircuitBreaker())
+    return breaker
+
+def record_response(breaker, response):
+    """Count a 5xx as a failure for the host's breaker"""
+    if response.status_code >= 500:
+        breaker.record_failure()
+    else:
+        breaker.record_success()
+
+def request(method, url, **kwargs):
+    """Send a request through the host's pooled session and circuit breaker"""
+    host = urlsplit(url).hostname or ''
+    breaker = get_breaker(host)
+    with telemetry.span('upstream', target=host) as span:
+        if not breaker.allow_request():
+            span['status'] = 'circuit_open'
+            raise CircuitOpenError(f"Circuit open for {host}")
+
+        kwargs.setdefault('timeout', HOST_TIMEOUTS.get(host, DEFAULT_TIMEOUT))
+        try:
+            response = get_session(host).request(method, url, **kwargs)
+        except requests.RequestException:
+            breaker.record_failure()
+            raise
+        except BaseException:
+            breaker.cancel_trial()
+            raise
+
+        span['status'] = response.status_code
+        record_response(breaker, response)
+        return response
+
+def get(url, **kwargs):
+    """GET through the shared client"""
+    return request('GET', url, **kwargs)
+
+def head(url, **kwargs):
+    """HEAD through the shared client"""
+    return request('HEAD', url, **kwargs)
+
+async_client = None
+
+def import_httpx():
+    global httpx
+    if httpx is None:
+        import httpx as library
+        httpx = library
+    return httpx
+
+def get_async_client():
+    """Get the shared async client (created inside the running event loop)"""
+    global async_client
+    if async_client is None:
+        import_httpx()
+        async_client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=ASYNC_MAX_CONNECTIONS, max_keepalive_connections=POOL_MAXSIZE),
+            transport=httpx.AsyncHTTPTransport(retries=2),
+            follow_redirects=True,
+        )
+    return async_client
+
+async def close_async_client():
+    """Close the shared async client, e.g. on server shutdown"""
+    global async_client
+    if async_client is not None:
+        await async_client.aclose()
+        async_client = None
+
+def get_async_timeout(host):
+    """Per-host timeouts in httpx form"""
+    connect, read = HOST_TIMEOUTS.get(host, DEFAULT_TIMEOUT)
+    return import_httpx().Timeout(read, connect=connect)
+
+async def async_request(method, url, **kwargs):
+    """Async counterpart of request(), sharing the same circuit breakers"""
+    host = urlsplit(url).hostname or ''
+    breaker = get_breaker(host)
+    with telemetry.span('upstream', target=host) as span:
+        if not breaker.allow_request():
+            span['status'] = 'circuit_open'
+            raise CircuitOpenError(f"Circuit open for {host}")
+
+        kwargs.setdefault('timeout', get_async_timeout(host))
+        try:
+            response = await get_async_client().request(method, url, **kwargs)
+        except httpx.HTTPError:
+            breaker.record_failure()
+            raise
+        except BaseException:
+            breaker.cancel_trial()
+            raise
+
+        span['status'] = response.status_code
+        record_response(breaker, response)
+        return response
+
+async def async_get(url, **kwargs):
+    """GET through the shared async client"""
+    return await async_request('GET', url, **kwargs)
+
+@asynccontextmanager
+async def async_stream(method, url, **kwargs):
+    """Stream a response body through the shared async client and circuit breaker"""
+    host = urlsplit(url).hostname or ''
+    breaker = get_breaker(host)
+    with telemetry.span('upstream', target=host) as span:
+        if not breaker.allow_request():
+            span['status'] = 'circuit_open'
+            raise CircuitOpenError(f"Circuit open for {host}")
+
+        kwargs.setdefault('timeout', get_async_timeout(host))
+        try:
+            async with get_async_client().stream(method, url, **kwargs) as response:
+                span['status'] = response.status_code
+                record_response(breaker, response)
+                yield response
+        except httpx.TransportError:
+            breaker.record_failure()
+            raise
+        except BaseException:
+            breaker.cancel_trial()
+            raise
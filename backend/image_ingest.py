@@ -0,0 +1,184 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import uuid
+
+from image_variants import sniff_image_mimetype
+
+# Largest image we are willing to store
+MAX_IMAGE_BYTES = int(os.getenv('MAX_IMAGE_BYTES', str(25 * 1024 * 1024)))
+
+# Read sizes grow from MIN to MAX as a download proceeds
+MIN_CHUNK_SIZE = 64 * 1024
+MAX_CHUNK_SIZE = 1024 * 1024
+
+# Bytes needed to recognize an image format
+SNIFF_BYTES = 16
+
+EXTENSIONS = {
+    'image/jpeg': '.jpg',
+    'image/png': '.png',
+    'image/gif': '.gif',
+    'image/webp': '.webp',
+    'image/avif': '.avif',
+}
+
+class IngestError(Exception):
+    """Raised when a download is not a complete, acceptable image"""
+
+def get_expected_length(headers):
+    """Declared body size, or None when it's missing or describes an encoded body"""
+    if headers.get('Content-Encoding', 'identity') != 'identity':
+        return None
+    try:
+        return int(headers['Content-Length'])
+    except (KeyError, ValueError):
+        return None
+
+def get_initial_chunk_size(expected_length):
+    """Start with ~1/16th of the body, within the chunk size bounds"""
+    if not expected_length:
+        return MIN_CHUNK_SIZE
+    return max(MIN_CHUNK_SIZE, min(MAX_CHUNK_SIZE, expected_length // 16))
+
+def iter_adaptive_chunks(response, expected_length=None):
+    """Read a streamed requests response in chunks that double up to MAX_CHUNK_SIZE"""
+    chunk_size = get_initial_chunk_size(expected_length)
+    while True:
+        chunk = response.raw.read(chunk_size, decode_content=True)
+        if not chunk:
+            break
+        yield chunk
+        chunk_size = min(chunk_size * 2, MAX_CHUNK_SIZE)
+
+async def aiter_adaptive_chunks(response, expected_length=None):
+    """Async version of iter_adaptive_chunks, for a streamed httpx response: joins
+    what arrives into chunks that double up to MAX_CHUNK_SIZE"""
+    chunk_size = get_initial_chunk_size(expected_length)
+    buffer = bytearray()
+    async for data in response.aiter_bytes():
+        buffer += data
+        if len(buffer) >= chunk_size:
+            yield bytes(buffer)
+            buffer.clear()
+            chunk_size = min(chunk_size * 2, MAX_CHUNK_SIZE)
+    if buffer:
+        yield bytes(buffer)
+
+def get_blob_path(blob_dir, content_hash, ext):
+    """Content-addressed location of a blob, sharded by hash prefix"""
+    return os.path.join(blob_dir, content_hash[:2], content_hash + ext)
+
+class ImageWriter:
+    """Writes a downloaded image to a temp file while hashing and validating it.
+
+    `commit()` checks the declared length and magic bytes, stores the content once
+    under its hash in `blob_dir`, and, when a `filepath` is given, atomically links
+    it into place there. Nothing ever appears unless the whole image arrived.
+    """
+
+    def __init__(self, filepath, blob_dir, expected_length=None, max_bytes=MAX_IMAGE_BYTES):
+        if expected_length is not None and expected_length > max_bytes:
+            raise IngestError(f"Image too large: {expected_length} bytes")
+        self.filepath = filepath
+        self.blob_dir = blob_dir
+        self.expected_length = expected_length
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.header = b''
+        self.sha = hashlib.sha256()
+
+        os.makedirs(blob_dir, exist_ok=True)
+        fd, self.tmp_path = tempfile.mkstemp(dir=blob_dir, prefix='.tmp_')
+        self.file = os.fdopen(fd, 'wb')
+
+    def write(self, chunk):
+        self.size += len(chunk)
+        if self.size > self.max_bytes:
+            raise IngestError(f"Image exceeds {self.max_bytes} bytes")
+        if len(self.header) < SNIFF_BYTES:
+            self.header += chunk[:SNIFF_BYTES - len(self.header)]
+        self.sha.update(chunk)
+        self.file.write(chunk)
+
+    def commit(self):
+        """Validate the image and move it into place; returns its metadata"""
+        try:
+            if self.expected_length is not None and self.size != self.expected_length:
+                raise IngestError(f"Truncated image: got {self.size} of {self.expected_length} bytes")
+            mimetype = sniff_image_mimetype(self.header)
+            if mimetype is None:
+                raise IngestError("Downloaded file is not a recognized image")
+
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.file.close()
+
+            content_hash = self.sha.hexdigest()
+            blob_path = get_blob_path(self.blob_dir, content_hash, EXTENSIONS[mimetype])
+            if os.path.exists(blob_path):
+                # Identical image already stored
+                os.remove(self.tmp_path)
+            else:
+                os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+                os.replace(self.tmp_path, blob_path)
+            if self.filepath:
+                link_into_place(blob_path, self.filepath)
+        except Exception:
+            self.abort()
+            raise
+
+        return {
+            'path': self.filepath or blob_path,
+            'blob_path': blob_path,
+            'sha256': content_hash,
+            'size': self.size,
+            'mimetype': mimetype,
+        }
+
+    def abort(self):
+        """Discard the partial download"""
+        if not self.file.closed:
+            self.file.close()
+        try:
+            os.remove(self.tmp_path)
+        except OSError:
+            pass
+
+def link_into_place(blob_path, filepath):
+    """Atomically make `filepath` refer to the blob, hard-linking where possible"""
+    directory = os.path.dirname(filepath) or '.'
+    os.makedirs(directory, exist_ok=True)
+    tmp_link = os.path.join(directory, f".tmp_link_{uuid.uuid4().hex}")
+    try:
+        os.link(blob_path, tmp_link)
+    except OSError:
+        # No hard links here (e.g. another filesystem): fall back to a copy
+        shutil.copyfile(blob_path, tmp_link)
+    os.replace(tmp_link, filepath)
+
+def ingest_response(response, filepath, blob_dir, max_bytes=MAX_IMAGE_BYTES):
+    """Stream a requests response (opened with stream=True) into the blob directory,
+    linking it at `filepath` unless that is None"""
+    expected_length = get_expected_length(response.headers)
+    writer = ImageWriter(filepath, blob_dir, expected_length, max_bytes)
+    try:
+        for chunk in iter_adaptive_chunks(response, expected_length):
+            writer.write(chunk)
+    except Exception:
+        writer.abort()
+        raise
+    finally:
+        response.close()
+    return writer.commit()
+
+def ingest_bytes(data, filepath, blob_dir, max_bytes=MAX_IMAGE_BYTES):
+    """Store an image already in memory (e.g. from the shared cache) like ingest_response"""
+    writer = ImageWriter(filepath, blob_dir, len(data), max_bytes)
+    try:
+        writer.write(data)
+    except Exception:
+        writer.abort()
+        raise
+    return writer.commit()
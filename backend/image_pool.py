@@ -0,0 +1,82 @@
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# Seconds a prefetched image stays servable
+POOL_ENTRY_MAX_AGE = 3600
+
+class ImagePool:
+    """Bounded pools of ready-to-serve images per category, refilled in the background.
+
+    `producer(category)` builds one entry (URL, local copy, description) and is
+    called from a small thread pool whenever a category drops below `size`.
+    """
+
+    def __init__(self, producer, categories, size=3, max_age=POOL_ENTRY_MAX_AGE, workers=3):
+        self.producer = producer
+        self.size = size
+        self.max_age = max_age
+        self.pools = {category: deque() for category in categories}
+        self.pending = {category: 0 for category in categories}
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='image-pool')
+
+    def pop(self, category):
+        """Take a ready entry for a category (None if none is ready) and schedule a refill"""
+        if category not in self.pools:
+            return None
+
+        entry = None
+        now = time.monotonic()
+        with self.lock:
+            pool = self.pools[category]
+            while pool:
+                candidate = pool.popleft()
+                if now - candidate['created_at'] < self.max_age:
+                    entry = candidate
+                    break
+
+        self.refill(category)
+        return entry
+
+    def refill(self, category):
+        """Start producing entries until the category's pool is full again"""
+        with self.lock:
+            missing = self.size - len(self.pools[category]) - self.pending[category]
+            if missing <= 0:
+                return
+            self.pending[category] += missing
+
+        for _ in range(missing):
+            self.executor.submit(self._produce, category)
+
+    def fill_all(self):
+        """Top up every category"""
+        for category in self.pools:
+            self.refill(category)
+
+    def _produce(self, category):
+        try:
+            entry = self.producer(category)
+        except Exception as e:
+            logger.warning("Error prefetching '%s' image: %s", category, e)
+            entry = None
+
+        with self.lock:
+            self.pending[category] -= 1
+            # Only keep fully analyzed images; failures are retried on the next pop
+            if entry and entry.get('analyzed'):
+                entry['created_at'] = time.monotonic()
+                self.pools[category].append(entry)
+
+    def stats(self):
+        """Ready and in-flight entry counts per category"""
+        with self.lock:
+            return {
+                category: {'ready': len(pool), 'pending': self.pending[category]}
+                for category, pool in self.pools.items()
+            }
@@ -0,0 +1,283 @@
+import glob
+import json
+import logging
+import os
+import re
+import threading
+import time
+from datetime import datetime, timedelta
+from urllib.parse import urlsplit
+
+import telemetry
+from file_utils import atomic_write, FileLock
+from image_ingest import EXTENSIONS, ingest_bytes, ingest_response, get_blob_path
+
+logger = logging.getLogger(__name__)
+
+# Default quota for the store: total bytes and age (seconds) of stored images
+STORE_MAX_BYTES = 1024 * 1024 * 1024
+STORE_MAX_AGE = 30 * 24 * 3600
+
+# Days of per-day image files kept in the daily images directory
+DAILY_RETENTION_DAYS = 30
+
+# Seconds between background maintenance runs (manifest sync, eviction, sweep), and
+# between writes of new and touched entries to the shared manifest in the meantime
+MAINTENANCE_INTERVAL = 600
+FLUSH_INTERVAL = 15
+
+# Age (seconds) after which a blob no manifest lists (e.g. recorded by a worker that
+# died before flushing) or a leftover temp file is deleted
+ORPHAN_GRACE = 3600
+
+BLOB_NAME = re.compile(r'^[0-9a-f]{64}(%s)$' % '|'.join(re.escape(ext) for ext in EXTENSIONS.values()))
+
+DATED_FILE = re.compile(r'_(\d{4}-\d{2}-\d{2})[._]')
+
+class ImageStore:
+    """Content-addressed image store with a size/age quota.
+
+    Images live at `<root>/<hash[:2]>/<hash>.<ext>`, so names never collide and
+    identical images are stored once. A compact manifest (hash -> [ext, size,
+    created, last used]) answers lookups and listings without touching the
+    directory tree. Images another worker stored but hasn't written to the manifest
+    yet are found on disk. A background job syncs the manifest between worker
+    processes, evicts expired and least recently used images over quota, deletes
+    blobs no manifest lists, and sweeps old per-day files out of the daily images
+    directory.
+    """
+
+    def __init__(self, root, max_bytes=STORE_MAX_BYTES, max_age=STORE_MAX_AGE,
+                 daily_dir=None, daily_retention_days=DAILY_RETENTION_DAYS):
+        self.root = root
+        self.manifest_path = os.path.join(root, 'manifest.json')
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.daily_dir = daily_dir
+        self.daily_retention_days = daily_retention_days
+        self.entries = None
+        self.pending = {}
+        self._lock = threading.Lock()
+        self._maintenance_thread = None
+
+    def _load_manifest(self):
+        try:
+            with open(self.manifest_path, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _get_entries(self):
+        if self.entries is None:
+            self.entries = self._load_manifest()
+        return self.entries
+
+    def record(self, stored):
+        """Add an ingested image (see image_ingest.ImageWriter.commit) to the manifest"""
+        now = time.time()
+        ext = os.path.splitext(stored['blob_path'])[1]
+        with self._lock:
+            entries = self._get_entries()
+            existing = entries.get(stored['sha256'])
+            created = existing[2] if existing else now
+            entries[stored['sha256']] = self.pending[stored['sha256']] = [ext, stored['size'], created, now]
+        self.start_maintenance()
+
+    def ingest(self, response, filepath=None):
+        """Stream a download into the store, optionally linking it at `filepath`"""
+        host = urlsplit(getattr(response, 'url', None) or '').hostname or ''
+        with telemetry.span('download', target=host):
+            stored = ingest_response(response, filepath, self.root)
+        telemetry.download_bytes.inc(stored['size'], target=host)
+        self.record(stored)
+        return stored
+
+    def add(self, data, filepath=None):
+        """Store image bytes, optionally linking them at `filepath`"""
+        stored = ingest_bytes(data, filepath, self.root)
+        self.record(stored)
+        return stored
+
+    def touch(self, content_hash):
+        """Mark an image as recently used"""
+        with self._lock:
+            entry = self._get_entries().get(content_hash)
+            if entry:
+                entry[3] = time.time()
+                self.pending[content_hash] = entry
+
+    def get_path(self, content_hash):
+        """Path of a stored image, or None if it isn't in the store"""
+        with self._lock:
+            entry = self._get_entries().get(content_hash)
+        if entry is None:
+            return self._find_blob(content_hash)
+        return get_blob_path(self.root, content_hash, entry[0])
+
+    def _find_blob(self, content_hash):
+        """Look for an image stored by another worker that isn't in our manifest yet, and adopt it"""
+        for ext in set(EXTENSIONS.values()):
+            blob_path = get_blob_path(self.root, content_hash, ext)
+            try:
+                stat = os.stat(blob_path)
+            except OSError:
+                continue
+            now = time.time()
+            with self._lock:
+                entries = self._get_entries()
+                if content_hash not in entries:
+                    entries[content_hash] = self.pending[content_hash] = [ext, stat.st_size, stat.st_mtime, now]
+            return blob_path
+        return None
+
+    def stats(self):
+        """Image count and total bytes in the store"""
+        with self._lock:
+            entries = self._get_entries()
+            return {'images': len(entries), 'bytes': sum(e[1] for e in entries.values())}
+
+    def _remove_blob(self, content_hash, ext):
+        """Delete a blob and any variants generated next to it"""
+        blob_path = get_blob_path(self.root, content_hash, ext)
+        for path in glob.glob(os.path.splitext(blob_path)[0] + '*'):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def flush(self):
+        """Merge our new and touched entries into the manifest other workers read"""
+        with self._lock:
+            if not self.pending:
+                return
+        self._sync(evict=False)
+
+    def maintain(self):
+        """Sync the manifest with other workers, enforce the quota and sweep daily files"""
+        self._sync(evict=True)
+        if self.daily_dir:
+            self.sweep_daily_files()
+
+    def _sync(self, evict):
+        os.makedirs(self.root, exist_ok=True)
+        file_lock = FileLock(self.manifest_path + '.lock')
+        if not file_lock.acquire(timeout=30):
+            return
+        try:
+            with self._lock:
+                pending, self.pending = self.pending, {}
+
+            # Merge our new and touched entries into what other workers have written
+            merged = self._load_manifest()
+            for content_hash, entry in pending.items():
+                current = merged.get(content_hash)
+                if current:
+                    entry = [entry[0], entry[1], min(current[2], entry[2]), max(current[3], entry[3])]
+                merged[content_hash] = entry
+
+            evicted = self._select_evictions(merged) if evict else []
+            for content_hash in evicted:
+                self._remove_blob(content_hash, merged.pop(content_hash)[0])
+
+            atomic_write(self.manifest_path, json.dumps(merged, separators=(',', ':')), mode='w')
+            with self._lock:
+                # Keep entries recorded while we were working
+                merged.update(self.pending)
+                self.entries = merged
+
+            if evicted:
+                logger.info("Image store evicted %d images", len(evicted))
+            if evict:
+                self.sweep_orphans(merged)
+        finally:
+            file_lock.release()
+
+    def sweep_orphans(self, entries):
+        """Delete old blobs that no manifest lists, and temp files left by failed writes"""
+        cutoff = time.time() - ORPHAN_GRACE
+        removed = 0
+        for directory in [self.root] + glob.glob(os.path.join(self.root, '??')):
+            try:
+                names = os.listdir(directory)
+            except OSError:
+                continue
+            for name in names:
+                blob = BLOB_NAME.match(name)
+                if not blob and not name.startswith('.tmp_'):
+                    continue
+                path = os.path.join(directory, name)
+                try:
+                    if os.path.getmtime(path) > cutoff:
+                        continue
+                except OSError:
+                    continue
+                if blob is None:
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+                elif name[:64] not in entries:
+                    self._remove_blob(name[:64], blob.group(1))
+                    removed += 1
+        if removed:
+            logger.info("Image store removed %d unlisted images", removed)
+
+    def _select_evictions(self, entries):
+        """Expired images, then least recently used ones until the store fits its quota"""
+        now = time.time()
+        evicted = [h for h, e in entries.items() if now - e[2] > self.max_age]
+        total = sum(e[1] for h, e in entries.items() if h not in evicted)
+        if total > self.max_bytes:
+            by_last_used = sorted((e[3], h) for h, e in entries.items() if h not in evicted)
+            for _, content_hash in by_last_used:
+                if total <= self.max_bytes:
+                    break
+                total -= entries[content_hash][1]
+                evicted.append(content_hash)
+        return evicted
+
+    def get_daily_cutoff(self):
+        """The oldest date whose per-day images are kept"""
+        return (datetime.now() - timedelta(days=self.daily_retention_days)).strftime('%Y-%m-%d')
+
+    def sweep_daily_files(self):
+        """Delete per-day images, variants and lock files older than the retention period.
+
+        The small daily_data JSON files are kept as the record of past days.
+        """
+        cutoff = self.get_daily_cutoff()
+        try:
+            names = os.listdir(self.daily_dir)
+        except OSError:
+            return
+        for name in names:
+            match = DATED_FILE.search(name)
+            if not match or match.group(1) >= cutoff or name.startswith('daily_data_'):
+                continue
+            try:
+                os.remove(os.path.join(self.daily_dir, name))
+            except OSError:
+                pass
+
+    def start_maintenance(self, interval=MAINTENANCE_INTERVAL):
+        """Run maintenance periodically on a daemon thread (started once per process)"""
+        with self._lock:
+            if self._maintenance_thread is not None:
+                return
+            self._maintenance_thread = threading.Thread(
+                target=self._maintenance_loop, args=(interval,), name='image-store', daemon=True
+            )
+        self._maintenance_thread.start()
+
+    def _maintenance_loop(self, interval):
+        next_maintenance = time.monotonic() + interval
+        while True:
+            time.sleep(min(FLUSH_INTERVAL, interval))
+            try:
+                if time.monotonic() >= next_maintenance:
+                    next_maintenance = time.monotonic() + interval
+                    self.maintain()
+                else:
+                    self.flush()
+            except Exception as e:
+                logger.warning("Image store maintenance error: %s", e)
@@ -0,0 +1,207 @@
+import base64
+import io
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_all_start_methods, get_context
+
+from file_utils import atomic_write
+
+try:
+    from PIL import Image, ImageFilter, features
+except ImportError:  # Pillow is optional; without it only the original files are served
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+# Widths (px) of the resized variants generated for every image
+VARIANT_WIDTHS = (480, 960, 1600)
+
+# Output formats in order of preference, with their mimetypes
+VARIANT_FORMATS = {
+    'avif': 'image/avif',
+    'webp': 'image/webp',
+    'jpeg': 'image/jpeg',
+}
+
+# Width (px) of the inline blur placeholder
+PLACEHOLDER_WIDTH = 16
+
+# How long (seconds) a missing variant manifest is remembered before looking again
+MISSING_MANIFEST_TTL = 30
+
+IMAGE_SIGNATURES = (
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'GIF87a', 'image/gif'),
+    (b'GIF89a', 'image/gif'),
+)
+
+variant_executor = None
+variant_executor_lock = threading.Lock()
+
+# Variant manifests by source path (or the time we looked, if there was none yet),
+# least recently used first and bounded to MAX_VARIANT_MANIFESTS
+MAX_VARIANT_MANIFESTS = 1024
+variant_manifests = OrderedDict()
+variant_manifests_lock = threading.Lock()
+
+def sniff_image_mimetype(header):
+    """Detect an image mimetype from its first bytes, or None if it isn't a known image"""
+    for signature, mimetype in IMAGE_SIGNATURES:
+        if header.startswith(signature):
+            return mimetype
+    if header[:4] == b'RIFF' and header[8:12] == b'WEBP':
+        return 'image/webp'
+    if header[4:12] in (b'ftypavif', b'ftypavis'):
+        return 'image/avif'
+    return None
+
+def get_supported_formats():
+    """Get the variant formats this Pillow build can encode"""
+    if Image is None:
+        return []
+    formats = ['jpeg']
+    if features.check('webp'):
+        formats.insert(0, 'webp')
+    if features.check('avif'):
+        formats.insert(0, 'avif')
+    return formats
+
+def get_manifest_path(source_path):
+    """Path of the sidecar file listing a source image's variants"""
+    return os.path.splitext(source_path)[0] + '.variants.json'
+
+def make_placeholder(image):
+    """Build a tiny blurred JPEG of the image as a data URI"""
+    height = max(1, round(image.height * PLACEHOLDER_WIDTH / image.width))
+    tiny = image.resize((PLACEHOLDER_WIDTH, height)).filter(ImageFilter.GaussianBlur(1))
+    buffer = io.BytesIO()
+    tiny.save(buffer, 'JPEG', quality=40)
+    return 'data:image/jpeg;base64,' + base64.b64encode(buffer.getvalue()).decode('ascii')
+
+def generate_variants(source_path):
+    """Write resized variants of an image next to it (runs in a worker process)"""
+    stem = os.path.splitext(source_path)[0]
+    with Image.open(source_path) as original:
+        image = original.convert('RGB')
+
+    variants = []
+    for width in VARIANT_WIDTHS:
+        if width > image.width and variants:
+            break
+        target_width = min(width, image.width)
+        height = max(1, round(image.height * target_width / image.width))
+        resized = image.resize((target_width, height), Image.LANCZOS)
+
+        for fmt in get_supported_formats():
+            path = f"{stem}_w{width}.{fmt}"
+            buffer = io.BytesIO()
+            resized.save(buffer, fmt.upper(), quality=80)
+            atomic_write(path, buffer.getvalue())
+            variants.append({'width': width, 'format': fmt, 'path': path})
+
+    manifest = {
+        'width': image.width,
+        'height': image.height,
+        'placeholder': make_placeholder(image),
+        'variants': variants,
+    }
+    atomic_write(get_manifest_path(source_path), json.dumps(manifest), mode='w')
+    return manifest
+
+def get_variant_executor():
+    """Get the shared process pool used for variant generation.
+
+    Its processes are started from a fork server (or spawned) rather than forked
+    from the threaded server process, whose locks may be held mid-fork.
+    """
+    global variant_executor
+    with variant_executor_lock:
+        if variant_executor is None:
+            workers = int(os.getenv('IMAGE_VARIANT_WORKERS', '2'))
+            if 'forkserver' in get_all_start_methods():
+                context = get_context('forkserver')
+                # The fork server only needs this module, not the whole app
+                context.set_forkserver_preload([__name__])
+            else:
+                context = get_context('spawn')
+            variant_executor = ProcessPoolExecutor(max_workers=workers, mp_context=context)
+        return variant_executor
+
+def remember_variant_manifest(source_path, manifest):
+    """Cache a manifest (or the time none was found), dropping the least recently used"""
+    with variant_manifests_lock:
+        variant_manifests[source_path] = manifest
+        variant_manifests.move_to_end(source_path)
+        while len(variant_manifests) > MAX_VARIANT_MANIFESTS:
+            variant_manifests.popitem(last=False)
+
+def schedule_variants(source_path):
+    """Queue variant generation for an image; returns a future, or None without Pillow"""
+    if Image is None:
+        return None
+    future = get_variant_executor().submit(generate_variants, source_path)
+
+    def remember(done):
+        if not done.exception():
+            remember_variant_manifest(source_path, done.result())
+
+    future.add_done_callback(remember)
+    return future
+
+def forget_variants(source_path):
+    """Stop serving an image's variants until they are rebuilt, e.g. after it was replaced"""
+    remember_variant_manifest(source_path, time.monotonic())
+    try:
+        os.remove(get_manifest_path(source_path))
+    except OSError:
+        pass
+
+def get_variant_manifest(source_path):
+    """Get the variant manifest for an image, reading its sidecar file on first use"""
+    with variant_manifests_lock:
+        manifest = variant_manifests.get(source_path)
+        if manifest is not None:
+            variant_manifests.move_to_end(source_path)
+    if isinstance(manifest, dict):
+        return manifest
+    if manifest is not None and time.monotonic() - manifest < MISSING_MANIFEST_TTL:
+        return None
+
+    try:
+        with open(get_manifest_path(source_path), 'r') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        remember_variant_manifest(source_path, time.monotonic())
+        return None
+
+    remember_variant_manifest(source_path, manifest)
+    return manifest
+
+def parse_accepted_formats(accept_header):
+    """Get the variant formats a client accepts, in our order of preference"""
+    accept_header = accept_header or ''
+    accepted = [fmt for fmt in ('avif', 'webp') if VARIANT_FORMATS[fmt] in accept_header]
+    return accepted + ['jpeg']
+
+def choose_variant(manifest, width, accept_header):
+    """Pick the smallest variant at least `width` wide in the best accepted format"""
+    accepted = parse_accepted_formats(accept_header)
+    for fmt in accepted:
+        candidates = sorted(
+            (v for v in manifest['variants'] if v['format'] == fmt),
+            key=lambda v: v['width']
+        )
+        if not candidates:
+            continue
+        if width:
+            for variant in candidates:
+                if variant['width'] >= width:
+                    return variant
+        return candidates[-1]
+    return None
@@ -0,0 +1,165 @@
+import json
+import logging
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import http_client
+from file_utils import atomic_write, FileLock
+
+logger = logging.getLogger(__name__)
+
+MET_API_BASE = os.getenv('MET_API_BASE', 'https://collectionapi.metmuseum.org/public/collection/v1')
+
+# Search terms indexed for /api/search-image?category=art
+MET_SEARCH_TERMS = ["landscape", "nature", "portrait", "painting", "sculpture", "impressionist"]
+
+# Leading search results looked up per term (the top results are the best quality)
+MET_RESULTS_PER_TERM = 30
+
+# How often (seconds) the index is rebuilt in the background
+MET_INDEX_REFRESH = 24 * 3600
+
+# Minimum seconds between rebuild attempts, so a failing API isn't hammered
+MET_INDEX_RETRY = 300
+
+class MetIndex:
+    """Local index of Met Museum artworks with images, per search term, kept on disk.
+
+    Picking an artwork is a local random choice; the network is only used by the
+    background refresh that rebuilds the index.
+    """
+
+    def __init__(self, path, terms=MET_SEARCH_TERMS, refresh_interval=MET_INDEX_REFRESH, cache=None):
+        self.path = path
+        self.cache = cache
+        self.terms = list(terms)
+        self.refresh_interval = refresh_interval
+        self.index = None
+        self._lock = threading.Lock()
+        self._refreshing = False
+        self._last_attempt = 0
+        self._loaded_at = 0
+
+    def _load(self):
+        try:
+            with open(self.path, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _is_stale(self, index):
+        return not index or any(
+            time.time() - index.get(term, {}).get('refreshed_at', 0) > self.refresh_interval
+            for term in self.terms
+        )
+
+    def load(self):
+        """Load the index from disk without refreshing it"""
+        with self._lock:
+            self.index = self._load()
+            self._loaded_at = time.monotonic()
+        return self.index
+
+    def get_index(self):
+        """Get the in-memory index, loading it from disk and refreshing it when stale"""
+        with self._lock:
+            reload_due = time.monotonic() - self._loaded_at > MET_INDEX_RETRY
+            if self.index is None or (reload_due and self._is_stale(self.index)):
+                # Another worker may already have written a fresher copy
+                self.index = self._load()
+                self._loaded_at = time.monotonic()
+            stale = self._is_stale(self.index)
+        if stale:
+            self.refresh_in_background()
+        return self.index
+
+    def pick(self):
+        """Pick a random indexed artwork as (object_id, image_url), or None if the index is empty"""
+        index = self.get_index()
+        terms = [term for term in self.terms if index.get(term, {}).get('objects')]
+        if not terms:
+            return None
+        artwork = random.choice(index[random.choice(terms)]['objects'])
+        return artwork['id'], artwork['primaryImage']
+
+    def refresh_in_background(self):
+        """Rebuild the index on a background thread unless a rebuild is already running"""
+        with self._lock:
+            if self._refreshing or time.monotonic() - self._last_attempt < MET_INDEX_RETRY:
+                return
+            self._refreshing = True
+            self._last_attempt = time.monotonic()
+        threading.Thread(target=self.refresh, name='met-index-refresh', daemon=True).start()
+
+    def refresh(self):
+        """Rebuild stale terms from the Met API and write the index to disk"""
+        file_lock = FileLock(self.path + '.lock')
+        try:
+            directory = os.path.dirname(self.path)
+            if directory and not os.path.exists(directory):
+                os.makedirs(directory)
+            # Only one worker process rebuilds at a time
+            if not file_lock.acquire(blocking=False):
+                return
+
+            index = self._load()
+            with ThreadPoolExecutor(max_workers=8, thread_name_prefix='met-index') as executor:
+                for term in self.terms:
+                    if time.time() - index.get(term, {}).get('refreshed_at', 0) <= self.refresh_interval:
+                        continue
+                    try:
+                        entry = self._get_term(term, executor)
+                    except Exception as e:
+                        logger.warning("Error indexing Met Museum term '%s': %s", term, e)
+                        continue
+                    if entry:
+                        index[term] = entry
+
+            atomic_write(self.path, json.dumps(index), mode='w')
+            with self._lock:
+                self.index = index
+            logger.info("Met Museum index refreshed: %d artworks", sum(len(v['objects']) for v in index.values()))
+        except Exception as e:
+            logger.warning("Error refreshing Met Museum index: %s", e)
+        finally:
+            file_lock.release()
+            with self._lock:
+                self._refreshing = False
+
+    def _get_term(self, term, executor):
+        """A term's fresh index entry, built once across replicas when there is a shared cache"""
+        def build():
+            return {'refreshed_at': time.time(), 'objects': self._build_term(term, executor)}
+
+        if self.cache is None:
+            return build()
+        return self.cache.get_or_set(f"met_index:{term}", build, self.refresh_interval)
+
+    def _build_term(self, term, executor):
+        """Search a term and keep only the objects that have a primary image"""
+        response = http_client.get(f"{MET_API_BASE}/search", params={'hasImages': 'true', 'q': term})
+        response.raise_for_status()
+        object_ids = (response.json().get('objectIDs') or [])[:MET_RESULTS_PER_TERM]
+
+        objects = []
+        for data in executor.map(self._fetch_object, object_ids):
+            if data and data.get('primaryImage'):
+                objects.append({
+                    'id': data['objectID'],
+                    'primaryImage': data['primaryImage'],
+                    'title': data.get('title', ''),
+                    'artist': data.get('artistDisplayName', ''),
+                })
+        return objects
+
+    def _fetch_object(self, object_id):
+        try:
+            response = http_client.get(f"{MET_API_BASE}/objects/{object_id}")
+            if response.status_code == 200:
+                return response.json()
+        except Exception as e:
+            logger.warning("Error fetching Met Museum object %s: %s", object_id, e)
+        return None
@@ -0,0 +1,153 @@
+import asyncio
+import threading
+import time
+
+# Rough characters per token, for estimating a request's token cost up front
+CHARS_PER_TOKEN = 4
+
+# Token cost charged for a high-detail image in a vision request
+IMAGE_TOKEN_COST = 765
+
+class OpenAIOverloadedError(Exception):
+    """Raised when a call cannot be started within its deadline"""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+def estimate_chat_tokens(request):
+    """Estimate prompt plus completion tokens for chat completion arguments"""
+    chars = 0
+    images = 0
+    for message in request.get('messages', []):
+        content = message.get('content')
+        if isinstance(content, str):
+            chars += len(content)
+            continue
+        for part in content or []:
+            if part.get('type') == 'text':
+                chars += len(part.get('text', ''))
+            elif part.get('type') == 'image_url':
+                images += 1
+    return chars // CHARS_PER_TOKEN + images * IMAGE_TOKEN_COST + request.get('max_tokens', 0)
+
+class TokenBucket:
+    """Token bucket kept as the time it will next be full, so callers can reserve ahead"""
+
+    def __init__(self, capacity, per_minute):
+        self.capacity = capacity
+        self.rate = per_minute / 60.0
+        self.full_at = 0.0
+
+    def start_time(self, cost, now):
+        """Earliest time `cost` tokens are available, given earlier reservations"""
+        cost = min(cost, self.capacity)
+        return max(now, self.full_at - (self.capacity - cost) / self.rate)
+
+    def reserve(self, cost, start):
+        """Take `cost` tokens at `start`"""
+        cost = min(cost, self.capacity)
+        self.full_at = max(self.full_at, start) + cost / self.rate
+
+    def adjust(self, delta):
+        """Correct an earlier reservation by `delta` tokens once the real cost is known"""
+        self.full_at += delta / self.rate
+
+class OpenAIDispatcher:
+    """Central gate for OpenAI calls: requests-per-minute and tokens-per-minute buckets,
+    a bounded queue, and deadline-aware admission.
+
+    A call reserves its slot up front. If that slot is further away than the call's
+    deadline, or the queue is full, it is rejected at once with OpenAIOverloadedError
+    instead of waiting and timing out.
+    """
+
+    def __init__(self, rpm, tpm, max_queue=50, deadline=10):
+        self.requests = TokenBucket(max(1, rpm // 6), rpm)
+        self.tokens = TokenBucket(max(1, tpm // 6), tpm)
+        self.max_queue = max_queue
+        self.deadline = deadline
+        self._lock = threading.Lock()
+        self.queue_depth = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def reserve(self, tokens, deadline=None):
+        """Reserve a slot and return how long to wait for it, or raise OpenAIOverloadedError"""
+        deadline = self.deadline if deadline is None else deadline
+        with self._lock:
+            now = time.monotonic()
+            start = max(self.requests.start_time(1, now), self.tokens.start_time(tokens, now))
+            wait = start - now
+
+            if wait > 0 and self.queue_depth >= self.max_queue:
+                self.rejected += 1
+                raise OpenAIOverloadedError("OpenAI queue is full", retry_after=wait)
+            if wait > deadline:
+                self.rejected += 1
+                raise OpenAIOverloadedError("OpenAI rate limit would be exceeded", retry_after=wait)
+
+            self.requests.reserve(1, start)
+            self.tokens.reserve(tokens, start)
+            self.admitted += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+            if wait > 0:
+                self.queue_depth += 1
+            return wait
+
+    def _leave_queue(self, wait):
+        if wait > 0:
+            with self._lock:
+                self.queue_depth -= 1
+
+    def settle(self, estimated, actual):
+        """Correct the token bucket with a call's real usage"""
+        if actual is not None:
+            with self._lock:
+                self.tokens.adjust(actual - estimated)
+
+    def call(self, fn, tokens=0, deadline=None, **kwargs):
+        """Run `fn(**kwargs)` once the rate limits allow it"""
+        wait = self.reserve(tokens, deadline)
+        try:
+            if wait > 0:
+                time.sleep(wait)
+        finally:
+            self._leave_queue(wait)
+        response = fn(**kwargs)
+        self.settle(tokens, get_usage(response))
+        return response
+
+    async def async_call(self, fn, tokens=0, deadline=None, **kwargs):
+        """Await `fn(**kwargs)` once the rate limits allow it"""
+        wait = self.reserve(tokens, deadline)
+        try:
+            if wait > 0:
+                await asyncio.sleep(wait)
+        finally:
+            self._leave_queue(wait)
+        response = await fn(**kwargs)
+        self.settle(tokens, get_usage(response))
+        return response
+
+    def stats(self):
+        """Queue depth, wait times and admission counters"""
+        with self._lock:
+            return {
+                'queue_depth': self.queue_depth,
+                'max_queue': self.max_queue,
+                'admitted': self.admitted,
+                'rejected': self.rejected,
+                'avg_wait': self.total_wait / self.admitted if self.admitted else 0.0,
+                'max_wait': self.max_wait,
+            }
+
+def get_usage(response):
+    """Total tokens reported by a (non-streaming) OpenAI response, if any"""
+    try:
+        return response['usage']['total_tokens']
+    except (KeyError, TypeError):
+        return None
@@ -0,0 +1,77 @@
+import os
+import sqlite3
+import threading
+import time
+
+class SQLiteCache:
+    """Entries stored by key in one SQLite table, with TTL and LRU eviction.
+
+    Subclasses name the `table` and its value `columns` ((name, SQL type) pairs)
+    and any extra `indexes` ((name, columns) pairs); every row also gets the
+    created_at and last_used times the TTL and LRU eviction work from. The
+    connection is shared by threads and opened on first use.
+    """
+
+    table = None
+    columns = ()
+    indexes = ()
+
+    def __init__(self, path, ttl, max_entries):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory and not os.path.exists(directory):
+                os.makedirs(directory)
+            conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            columns = ''.join(f'{name} {sql_type}, ' for name, sql_type in self.columns)
+            conn.execute(
+                f'CREATE TABLE IF NOT EXISTS {self.table} ('
+                f'key TEXT PRIMARY KEY, {columns}created_at REAL NOT NULL, last_used REAL NOT NULL)'
+            )
+            for name, index_columns in (*self.indexes, ('last_used', 'last_used')):
+                conn.execute(f'CREATE INDEX IF NOT EXISTS {self.table}_{name} ON {self.table} ({index_columns})')
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def _touch(self, conn, key, now):
+        conn.execute(f'UPDATE {self.table} SET last_used = ? WHERE key = ?', (now, key))
+        conn.commit()
+
+    def get_row(self, key, columns):
+        """Values of `columns` for a key, marking it used; None if missing or expired"""
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            row = conn.execute(
+                f'SELECT {", ".join(columns)} FROM {self.table} WHERE key = ? AND created_at > ?',
+                (key, now - self.ttl)
+            ).fetchone()
+            if row is not None:
+                self._touch(conn, key, now)
+            return row
+
+    def put_row(self, key, values):
+        """Store a key's values (by column name), evicting expired and least recently used entries"""
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            conn.execute(
+                f'INSERT OR REPLACE INTO {self.table} (key, {", ".join(values)}, created_at, last_used) '
+                f'VALUES ({", ".join("?" * (len(values) + 3))})',
+                (key, *values.values(), now, now)
+            )
+            conn.execute(f'DELETE FROM {self.table} WHERE created_at <= ?', (now - self.ttl,))
+            conn.execute(
+                f'DELETE FROM {self.table} WHERE key IN ('
+                f'SELECT key FROM {self.table} ORDER BY last_used DESC LIMIT -1 OFFSET ?)',
+                (self.max_entries,)
+            )
+            conn.commit()
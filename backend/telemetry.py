@@ -0,0 +1,225 @@
+import atexit
+import contextvars
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+# Histogram buckets (seconds) for request, upstream and disk latencies
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+LOG_FORMAT = '%(asctime)s %(levelname)s %(name)s trace=%(trace_id)s %(message)s'
+
+logger = logging.getLogger(__name__)
+
+# Trace id of the request being handled (per thread / asyncio task)
+current_trace_id = contextvars.ContextVar('trace_id', default='-')
+
+def format_labels(names, values):
+    if not names:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for v in values)
+    return '{' + ','.join(f'{n}="{v}"' for n, v in zip(names, escaped)) + '}'
+
+class Counter:
+    """Monotonic counter with labels"""
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, '') for name in self.labels)
+        with self._lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def collect(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self.values.items()):
+                lines.append(f"{self.name}{format_labels(self.labels, key)} {value}")
+        return lines
+
+class Histogram:
+    """Cumulative-bucket histogram with labels"""
+
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self.values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, '') for name in self.labels)
+        with self._lock:
+            counts = self.values.get(key)
+            if counts is None:
+                # Per-bucket counts, then count and sum
+                counts = self.values[key] = [0] * len(self.buckets) + [0, 0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            counts[-2] += 1
+            counts[-1] += value
+
+    def collect(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, counts in sorted(self.values.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, counts):
+                    cumulative += count
+                    lines.append(f"{self.name}_bucket{format_labels(self.labels + ('le',), key + (bound,))} {cumulative}")
+                lines.append(f"{self.name}_bucket{format_labels(self.labels + ('le',), key + ('+Inf',))} {counts[-2]}")
+                lines.append(f"{self.name}_count{format_labels(self.labels, key)} {counts[-2]}")
+                lines.append(f"{self.name}_sum{format_labels(self.labels, key)} {counts[-1]}")
+        return lines
+
+class Gauge:
+    """Value read from a callback when metrics are collected.
+
+    The callback returns a number, or a dict of label-value tuples to numbers.
+    """
+
+    def __init__(self, name, documentation, callback, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.callback = callback
+        self.labels = tuple(labels)
+
+    def collect(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} gauge"]
+        try:
+            values = self.callback()
+        except Exception as e:
+            logger.warning("Gauge %s failed: %s", self.name, e)
+            return lines
+        if not isinstance(values, dict):
+            values = {(): values}
+        for key, value in sorted(values.items()):
+            lines.append(f"{self.name}{format_labels(self.labels, key)} {value}")
+        return lines
+
+metrics = []
+metrics_lock = threading.Lock()
+
+def register(metric):
+    with metrics_lock:
+        metrics.append(metric)
+    return metric
+
+def render_metrics():
+    """All metrics of this process in the Prometheus text format"""
+    with metrics_lock:
+        registered = list(metrics)
+    lines = []
+    for metric in registered:
+        lines.extend(metric.collect())
+    return '\n'.join(lines) + '\n'
+
+http_request_seconds = register(Histogram(
+    'http_request_duration_seconds', 'Time to response headers per route', ('route', 'method', 'status')))
+span_seconds = register(Histogram(
+    'span_duration_seconds', 'Duration of upstream calls, downloads and disk writes', ('span', 'target', 'status')))
+cache_requests = register(Counter(
+    'cache_requests_total', 'Cache lookups by cache and result', ('cache', 'result')))
+download_bytes = register(Counter(
+    'download_bytes_total', 'Bytes of images downloaded', ('target',)))
+
+def register_gauge(name, documentation, callback, labels=()):
+    return register(Gauge(name, documentation, callback, labels))
+
+def record_cache(cache, hit):
+    """Count a cache hit or miss"""
+    cache_requests.inc(cache=cache, result='hit' if hit else 'miss')
+
+@contextmanager
+def span(name, target=''):
+    """Time a unit of work (upstream call, download, disk write).
+
+    Yields a dict the caller can put a 'status' into (e.g. an HTTP status code);
+    otherwise it is 'ok', or 'error' if the block raised.
+    """
+    attrs = {}
+    start = time.perf_counter()
+    status = 'ok'
+    try:
+        yield attrs
+    except Exception as e:
+        status = 'error'
+        attrs.setdefault('error', type(e).__name__)
+        raise
+    finally:
+        duration = time.perf_counter() - start
+        status = attrs.get('status', status)
+        span_seconds.observe(duration, span=name, target=target, status=status)
+        if logger.isEnabledFor(logging.DEBUG):
+            error = f" error={attrs['error']}" if 'error' in attrs else ''
+            logger.debug("span=%s target=%s status=%s duration_ms=%.1f%s", name, target, status, duration * 1000, error)
+
+def start_trace(trace_id=None):
+    """Set the current request's trace id; returns a token for end_trace()"""
+    return current_trace_id.set(trace_id or uuid.uuid4().hex[:16])
+
+def end_trace(token):
+    current_trace_id.reset(token)
+
+def observe_request(route, method, status, duration):
+    http_request_seconds.observe(duration, route=route, method=method, status=status)
+
+class TraceIdFilter(logging.Filter):
+    """Stamp records with the trace id while still on the request's thread or task"""
+
+    def filter(self, record):
+        record.trace_id = current_trace_id.get()
+        return True
+
+log_listener = None
+log_listener_lock = threading.Lock()
+log_queue_handler = None
+
+def setup_logging(level=LOG_LEVEL):
+    """Send log records through a queue to a background thread, so logging never
+    blocks a request on terminal or file I/O (configured once per process)"""
+    global log_listener, log_queue_handler
+    with log_listener_lock:
+        if log_listener is not None:
+            return
+        stream_handler = logging.StreamHandler()
+        stream_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+
+        queue_handler = logging.handlers.QueueHandler(queue.SimpleQueue())
+        queue_handler.addFilter(TraceIdFilter())
+        root = logging.getLogger()
+        root.addHandler(queue_handler)
+        root.setLevel(level)
+
+        log_queue_handler = queue_handler
+        log_listener = logging.handlers.QueueListener(queue_handler.queue, stream_handler)
+        log_listener.start()
+        atexit.register(log_listener.stop)
+
+def restart_logging_after_fork():
+    """A forked worker (e.g. under gunicorn --preload) inherits the log listener but
+    not its thread, so give it a fresh queue and listener"""
+    global log_listener
+    if log_listener is None:
+        return
+    log_queue_handler.queue = queue.SimpleQueue()
+    log_listener = logging.handlers.QueueListener(log_queue_handler.queue, *log_listener.handlers)
+    log_listener.start()
+    atexit.register(log_listener.stop)
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=restart_logging_after_fork)
@@ -0,0 +1,51 @@
+"""Offline checks of the backend's caching, locking and admission code, against
+the benchmark's local upstream and cache stand-ins.
+
+    python -m pytest backend/tests
+"""
+import os
+import sys
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [BACKEND_DIR, os.path.join(BACKEND_DIR, 'bench')]
+
+from fake_cache_server import FakeCacheServer  # noqa: E402
+from fake_upstream import FakeUpstream  # noqa: E402
+
+@pytest.fixture(scope='session')
+def fake_upstream():
+    fake = FakeUpstream(latency=0.05, error_rate=0, jitter=0, image_bytes=20_000).start()
+    yield fake
+    fake.stop()
+
+@pytest.fixture
+def fake_cache():
+    server = FakeCacheServer().start()
+    yield server
+    server.stop()
+
+@pytest.fixture(scope='session')
+def backend(fake_upstream, tmp_path_factory):
+    """The app module, pointed at the fake upstreams, imported in a scratch directory"""
+    os.environ.update(fake_upstream.get_upstream_env(), DAILY_PREWARM='0', CACHE_URL='')
+    os.chdir(tmp_path_factory.mktemp('backend'))
+    import app
+    return app
+
+@pytest.fixture
+def app_dir(backend, tmp_path, monkeypatch):
+    """The app module with its relative paths in a fresh directory and its in-memory state reset"""
+    monkeypatch.chdir(tmp_path)
+    backend.daily_sources.reload()
+    backend.daily_payload_cache.clear()
+    backend.daily_refreshes.clear()
+    backend.image_file_index.clear()
+    backend.image_store.entries = None
+    backend.image_store.pending = {}
+    backend.create_daily_images_directory()
+    return backend
+
+def upstream_counts(fake):
+    return fake.stats()['requests']
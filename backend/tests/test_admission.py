@@ -0,0 +1,93 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from admission import AdmissionRejected, ClientQuotas, ConcurrencyLimiter
+
+def test_limiter_admits_up_to_its_limit():
+    limiter = ConcurrencyLimiter('test', limit=2, budget=0.05)
+    first = limiter.acquire()
+    limiter.acquire()
+
+    with pytest.raises(AdmissionRejected) as rejected:
+        limiter.acquire()
+    assert rejected.value.status == 503
+    assert limiter.stats()['shed'] == 1
+
+    limiter.release(first)
+    limiter.acquire()
+    assert limiter.stats()['active'] == 2
+
+def test_limiter_hands_a_released_slot_to_a_waiter():
+    limiter = ConcurrencyLimiter('test', limit=1, budget=2)
+    admitted_at = limiter.acquire()
+    threading.Timer(0.05, limiter.release, (admitted_at,)).start()
+
+    start = time.monotonic()
+    limiter.acquire()
+    assert time.monotonic() - start < 1
+    assert limiter.stats()['admitted'] == 2
+
+def test_limiter_sheds_when_queue_is_full():
+    limiter = ConcurrencyLimiter('test', limit=1, budget=1, max_queue=0)
+    limiter.acquire()
+    with pytest.raises(AdmissionRejected, match='queue_full'):
+        limiter.acquire()
+
+def test_limiter_sheds_when_expected_wait_exceeds_budget():
+    limiter = ConcurrencyLimiter('test', limit=1, budget=0.5)
+    limiter.service_time = 2.0
+    limiter.acquire()
+
+    start = time.monotonic()
+    with pytest.raises(AdmissionRejected, match='expected_wait') as rejected:
+        limiter.acquire()
+    assert time.monotonic() - start < 0.1
+    assert rejected.value.retry_after >= 2.0
+
+def test_limiter_async_acquire():
+    limiter = ConcurrencyLimiter('test', limit=1, budget=1)
+
+    async def main():
+        admitted_at = await limiter.async_acquire()
+        waiter = asyncio.ensure_future(limiter.async_acquire())
+        await asyncio.sleep(0.05)
+        assert not waiter.done()
+        limiter.release(admitted_at)
+        await asyncio.wait_for(waiter, 1)
+
+    asyncio.run(main())
+    assert limiter.stats() == {**limiter.stats(), 'active': 1, 'waiting': 0, 'admitted': 2}
+
+def test_quotas_allow_burst_then_reject_with_retry_after():
+    quotas = ClientQuotas(per_minute=60, burst=3)
+    for _ in range(3):
+        quotas.take('a', 1)
+
+    with pytest.raises(AdmissionRejected) as rejected:
+        quotas.take('a', 1)
+    assert rejected.value.status == 429
+    assert 0 < rejected.value.retry_after <= 1.01
+
+    # Other clients have their own buckets
+    quotas.take('b', 1)
+
+def test_quota_rejection_charges_nothing_and_refund_gives_back():
+    quotas = ClientQuotas(per_minute=60, burst=2)
+    quotas.take('a', 2)
+    for _ in range(3):
+        with pytest.raises(AdmissionRejected):
+            quotas.take('a', 1)
+
+    quotas.refund('a', 1)
+    quotas.take('a', 1)
+
+def test_quotas_forget_least_recently_seen_clients():
+    quotas = ClientQuotas(per_minute=60, burst=1, max_clients=2)
+    for client in ('a', 'b', 'c'):
+        quotas.take(client, 1)
+    assert quotas.stats() == {'clients': 2}
+    # 'a' was dropped, so it starts with a full bucket again
+    quotas.take('a', 1)
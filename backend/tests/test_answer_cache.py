@@ -0,0 +1,12 @@
+import sqlite3
+
+from answer_cache import AnswerCache, make_answer_key
+
+def test_rows_are_keyed_like_the_shared_cache(tmp_path):
+    cache = AnswerCache(str(tmp_path / 'answers.sqlite3'))
+    cache.put('What is this?', 'ctx', 'A nebula')
+
+    assert cache.get('what is THIS', 'ctx') == 'A nebula'
+    assert cache.get('What is this?', 'other') is None
+    keys = [row[0] for row in sqlite3.connect(cache.path).execute('SELECT key FROM answers')]
+    assert keys == [make_answer_key('what is this', 'ctx')]
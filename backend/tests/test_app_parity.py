@@ -0,0 +1,55 @@
+import asyncio
+
+import httpx
+import pytest
+from openai.util import convert_to_openai_object
+
+ANSWER = {'id': 'chatcmpl-test', 'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': ' 42 '}}]}
+NO_CHOICES = {'id': 'chatcmpl-test', 'choices': [], 'error': {'message': 'quota exceeded'}}
+
+@pytest.fixture
+def both_apps(app_dir, monkeypatch):
+    """POST a request to the Flask app and to the async app; returns both (status, json)"""
+    import async_app
+
+    def post(path, body):
+        sync_response = app_dir.app.test_client().post(path, json=body)
+
+        async def post_async():
+            transport = httpx.ASGITransport(app=async_app.app)
+            async with httpx.AsyncClient(transport=transport, base_url='http://test') as client:
+                return await client.post(path, json=body)
+
+        async_response = asyncio.run(post_async())
+        return (sync_response.status_code, sync_response.json), (async_response.status_code, async_response.json())
+
+    def complete_with(completion):
+        response = convert_to_openai_object(completion)
+
+        async def async_completion(*args, **kwargs):
+            return response
+
+        monkeypatch.setattr(app_dir, 'create_chat_completion', lambda *args, **kwargs: response)
+        monkeypatch.setattr(async_app, 'create_chat_completion', async_completion)
+        monkeypatch.setattr(app_dir, 'get_cached_answer', lambda question, context: None)
+
+    post.complete_with = complete_with
+    return post
+
+@pytest.mark.parametrize('completion, expected', [
+    (ANSWER, (200, {'answer': '42'})),
+    (NO_CHOICES, (500, {'error': 'Error from OpenAI: quota exceeded'})),
+])
+def test_ask_answers_alike(both_apps, completion, expected):
+    both_apps.complete_with(completion)
+    assert both_apps('/api/ask', {'question': 'What is this?'}) == (expected, expected)
+
+@pytest.mark.parametrize('path, body', [
+    ('/api/ask', {}),
+    ('/api/search-image', {'category': 'art'}),
+    ('/api/generate-image', {'prompt': 'a cat', 'size': '3x3'}),
+])
+def test_invalid_requests_are_rejected_alike(both_apps, path, body):
+    sync_result, async_result = both_apps(path, body)
+    assert sync_result == async_result
+    assert sync_result[0] == 400
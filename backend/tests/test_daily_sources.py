@@ -0,0 +1,130 @@
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from conftest import BACKEND_DIR, upstream_counts
+from daily_sources import DailySourceCache
+from file_utils import FileLock
+
+TODAY = '2026-01-02'
+
+def test_source_freshness_and_negative_ttl(tmp_path):
+    cache = DailySourceCache(str(tmp_path / 'sources.json'), ttls={'space': 60}, negative_ttls={'space': 60})
+    assert cache.needs_refresh('space', TODAY)
+
+    cache.record_success('space', {'date': TODAY})
+    assert cache.fresh_for('space', TODAY) > 50
+    assert not cache.needs_refresh('space', TODAY)
+    # Stale the next day, but still served
+    assert cache.needs_refresh('space', '2026-01-03')
+    assert cache.get_value('space') == {'date': TODAY}
+
+    cache.record_success('space', {'date': TODAY}, fetched_at=time.time() - 120)
+    cache.record_failure('space')
+    assert not cache.needs_refresh('space', TODAY)
+    assert cache.get_value('space') == {'date': TODAY}
+
+def test_reload_picks_up_other_workers_entries(tmp_path):
+    path = str(tmp_path / 'sources.json')
+    ours = DailySourceCache(path)
+    assert ours.get_values() == {}
+    DailySourceCache(path).record_success('art', {'date': TODAY})
+
+    ours.reload()
+    assert ours.get_values() == {'art': {'date': TODAY}}
+
+def test_cold_requests_share_one_fetch_per_source(app_dir, fake_upstream):
+    before = upstream_counts(fake_upstream)
+
+    def get_daily_images(_):
+        return app_dir.app.test_client().get('/api/daily-images')
+
+    with ThreadPoolExecutor(8) as pool:
+        responses = list(pool.map(get_daily_images, range(8)))
+
+    assert all(r.status_code == 200 and r.json for r in responses)
+    assert set(get_daily_images(None).json) == {'space', 'earth', 'art'}
+    after = upstream_counts(fake_upstream)
+    assert after['nasa'] - before['nasa'] == 1
+    assert after['natgeo'] - before['natgeo'] == 1
+
+def test_cold_request_waits_for_another_workers_fetch(app_dir, fake_upstream):
+    categories = list(app_dir.get_daily_sources())
+    locks = [FileLock(os.path.join(app_dir.DAILY_IMAGES_DIR, f".source_{c}.lock")) for c in categories]
+    for lock in locks:
+        assert lock.acquire(blocking=False)
+
+    def other_worker():
+        time.sleep(0.5)
+        sources = DailySourceCache(app_dir.DAILY_SOURCES_PATH)
+        for category in categories:
+            sources.record_success(category, {'type': category, 'date': app_dir.get_today_date()})
+        for lock in locks:
+            lock.release()
+
+    before = upstream_counts(fake_upstream)
+    threading.Thread(target=other_worker).start()
+    start = time.monotonic()
+    response = app_dir.app.test_client().get('/api/daily-images')
+
+    assert time.monotonic() - start >= 0.4
+    assert set(response.json) == set(categories)
+    assert upstream_counts(fake_upstream) == before
+
+def test_refresh_uses_a_fetch_another_worker_just_finished(app_dir, fake_upstream):
+    today = app_dir.get_today_date()
+    result = {'type': 'space', 'image_path': os.path.join(app_dir.DAILY_IMAGES_DIR, f"nasa_{today}.jpg"), 'date': today}
+    # This worker hasn't seen it yet
+    app_dir.daily_sources.get_values()
+    DailySourceCache(app_dir.DAILY_SOURCES_PATH).record_success('space', result)
+
+    before = upstream_counts(fake_upstream)
+    assert app_dir.refresh_daily_source('space') == result
+    assert upstream_counts(fake_upstream)['nasa'] == before['nasa']
+
+def test_refresh_serves_the_original_before_its_variants_are_built(app_dir, fake_upstream):
+    result = app_dir.refresh_daily_source('space')
+    assert result and 'placeholder' not in result
+
+    deadline = time.monotonic() + 20
+    while 'placeholder' not in app_dir.daily_sources.get_value('space') and time.monotonic() < deadline:
+        time.sleep(0.05)
+    value = app_dir.daily_sources.get_value('space')
+    assert value['placeholder'].startswith('data:image/jpeg') and value['widths']
+    assert value['image_url'] == result['image_url']
+    assert app_dir.load_daily_data(result['date'])['space']['widths'] == value['widths']
+
+OTHER_WORKER = """
+import json, sys, time
+sys.path.insert(0, sys.argv[1])
+from daily_sources import DailySourceCache
+from file_utils import FileLock
+
+lock = FileLock(sys.argv[2])
+lock.acquire()
+print('locked', flush=True)
+time.sleep(0.5)
+DailySourceCache(sys.argv[3]).record_success('space', json.loads(sys.argv[4]))
+lock.release()
+"""
+
+def test_refresh_waits_for_a_fetch_in_another_process(app_dir, fake_upstream):
+    today = app_dir.get_today_date()
+    result = {'type': 'space', 'image_path': os.path.join(app_dir.DAILY_IMAGES_DIR, f"nasa_{today}.jpg"), 'date': today}
+    lock_path = os.path.join(app_dir.DAILY_IMAGES_DIR, '.source_space.lock')
+    other_worker = subprocess.Popen(
+        [sys.executable, '-c', OTHER_WORKER, BACKEND_DIR, lock_path, os.path.abspath(app_dir.DAILY_SOURCES_PATH),
+         json.dumps(result)],
+        stdout=subprocess.PIPE, text=True
+    )
+    try:
+        assert other_worker.stdout.readline().strip() == 'locked'
+        before = upstream_counts(fake_upstream)
+        assert app_dir.refresh_daily_source('space') == result
+        assert upstream_counts(fake_upstream)['nasa'] == before['nasa']
+    finally:
+        other_worker.wait(10)
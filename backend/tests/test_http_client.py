@@ -0,0 +1,96 @@
+import asyncio
+import time
+
+import pytest
+
+import http_client
+from http_client import CircuitBreaker, CircuitOpenError
+
+class HangingClient:
+    """Async client whose calls never finish"""
+
+    async def request(self, method, url, **kwargs):
+        await asyncio.Event().wait()
+
+def half_open_breaker(host):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+    breaker.record_failure()
+    http_client.breakers[host] = breaker
+    return breaker
+
+def test_breaker_opens_then_lets_one_trial_through():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.05)
+    breaker.record_failure()
+    assert breaker.allow_request()
+    breaker.record_failure()
+    assert breaker.state == 'open' and not breaker.allow_request()
+
+    time.sleep(0.06)
+    assert breaker.allow_request()
+    assert not breaker.allow_request()
+    breaker.record_success()
+    assert breaker.state == 'closed'
+
+def test_cancelled_half_open_trial_lets_the_next_call_through(monkeypatch):
+    host = 'cancelled.test'
+    breaker = half_open_breaker(host)
+    monkeypatch.setattr(http_client, 'get_async_client', HangingClient)
+
+    async def main():
+        trial = asyncio.ensure_future(http_client.async_get(f"http://{host}/"))
+        await asyncio.sleep(0.01)
+        # The trial is in flight, so other calls are turned away
+        with pytest.raises(CircuitOpenError):
+            await http_client.async_get(f"http://{host}/")
+        trial.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await trial
+
+    try:
+        asyncio.run(main())
+        assert breaker.state == 'half-open'
+        assert breaker.allow_request()
+    finally:
+        http_client.breakers.pop(host, None)
+
+def test_interrupted_half_open_trial_lets_the_next_call_through(monkeypatch):
+    host = 'interrupted.test'
+    breaker = half_open_breaker(host)
+
+    class InterruptedSession:
+        def request(self, method, url, **kwargs):
+            raise KeyboardInterrupt
+
+    monkeypatch.setattr(http_client, 'get_session', lambda host: InterruptedSession())
+    try:
+        with pytest.raises(KeyboardInterrupt):
+            http_client.get(f"http://{host}/")
+        assert breaker.allow_request()
+    finally:
+        http_client.breakers.pop(host, None)
+
+def test_cancelled_half_open_stream_lets_the_next_call_through(fake_upstream):
+    host = '127.0.0.1'
+    breaker = half_open_breaker(host)
+
+    async def stream():
+        async with http_client.async_stream('GET', f"{fake_upstream.base_url}/images/photo-1.jpg"):
+            pass
+
+    async def main():
+        try:
+            # Cancelled while waiting for the (slow) upstream's response
+            task = asyncio.ensure_future(stream())
+            await asyncio.sleep(0.01)
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+        finally:
+            await http_client.close_async_client()
+
+    try:
+        asyncio.run(main())
+        assert breaker.state == 'half-open'
+        assert breaker.allow_request()
+    finally:
+        http_client.breakers.pop(host, None)
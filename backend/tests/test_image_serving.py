@@ -0,0 +1,83 @@
+import io
+import os
+
+from PIL import Image
+
+from file_utils import atomic_write
+from image_store import ImageStore
+
+def make_jpeg(size):
+    buffer = io.BytesIO()
+    Image.effect_noise((size, size), 50).convert('RGB').save(buffer, 'JPEG')
+    return buffer.getvalue()
+
+def test_replaced_file_is_served_with_its_own_length_and_etag(app_dir):
+    path = os.path.join(app_dir.DAILY_IMAGES_DIR, f"nasa_{app_dir.get_today_date()}.jpg")
+    client = app_dir.app.test_client()
+    atomic_write(path, make_jpeg(8))
+    first = client.get('/api/daily-images/nasa')
+
+    replacement = make_jpeg(64)
+    atomic_write(path, replacement)
+    second = client.get('/api/daily-images/nasa', headers={'If-None-Match': first.headers['ETag']})
+
+    assert second.status_code == 200
+    assert second.data == replacement
+    assert int(second.headers['Content-Length']) == len(replacement)
+    assert second.headers['ETag'] != first.headers['ETag']
+
+def test_dated_url_is_immutable_only_for_its_current_version(app_dir):
+    today = app_dir.get_today_date()
+    path = os.path.join(app_dir.DAILY_IMAGES_DIR, f"nasa_{today}.jpg")
+
+    def fetch():
+        # As download_image() does
+        atomic_write(path, make_jpeg(16))
+        app_dir.index_image_file(path)
+        return {'image_path': path, 'image_url': f"/api/daily-images/nasa/{today}"}
+
+    client = app_dir.app.test_client()
+    first_url = app_dir.fetch_versioned_source(fetch)['image_url']
+    assert 'immutable' in client.get(first_url).headers['Cache-Control']
+
+    # Refetched during the day: the old URL must be revalidated, the new one is immutable
+    second_url = app_dir.fetch_versioned_source(fetch)['image_url']
+    assert second_url != first_url
+    assert client.get(first_url).headers['Cache-Control'] == 'no-cache'
+    assert 'immutable' in client.get(second_url).headers['Cache-Control']
+
+def test_generated_image_is_served_by_every_worker(app_dir):
+    # Stored by another worker that hasn't flushed its manifest
+    other_worker = ImageStore(app_dir.IMAGE_STORE_DIR)
+    stored = other_worker.add(make_jpeg(16))
+
+    response = app_dir.app.test_client().get(f"/api/generated-images/{stored['sha256']}")
+    assert response.status_code == 200
+    assert response.headers['ETag'].strip('"') == stored['sha256']
+
+def test_indexed_image_is_served_without_stat_calls(app_dir, monkeypatch):
+    path = os.path.join(app_dir.DAILY_IMAGES_DIR, f"nasa_{app_dir.get_today_date()}.jpg")
+    atomic_write(path, make_jpeg(8))
+    client = app_dir.app.test_client()
+    etag = client.get('/api/daily-images/nasa').headers['ETag']
+
+    def no_stat(*args, **kwargs):
+        raise AssertionError('stat called')
+
+    monkeypatch.setattr(os, 'stat', no_stat)
+    monkeypatch.setattr(os.path, 'exists', no_stat)
+    assert client.get('/api/daily-images/nasa').status_code == 200
+    assert client.get('/api/daily-images/nasa', headers={'If-None-Match': etag}).status_code == 304
+
+def test_archived_days_past_retention_have_no_image_url(app_dir):
+    kept = app_dir.get_yesterday_date()
+    expired = '2000-01-01'
+    for date in (kept, expired):
+        app_dir.daily_archive.put(date, 'space', {'type': 'space', 'image_url': f"/api/daily-images/nasa/{date}", 'date': date})
+    client = app_dir.app.test_client()
+
+    assert client.get(f"/api/daily-images?date={kept}").json['space']['image_url']
+    assert client.get(f"/api/daily-images?date={expired}").json['space'] == {
+        'type': 'space', 'image_url': None, 'image_expired': True, 'date': expired}
+    days = {day['date']: day['images'] for day in client.get('/api/daily-images?from=2000-01-01').json['days']}
+    assert days[kept]['space']['image_url'] and days[expired]['space']['image_url'] is None
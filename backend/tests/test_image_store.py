@@ -0,0 +1,80 @@
+import asyncio
+import io
+import json
+import os
+import time
+
+from PIL import Image
+
+import image_store
+from image_ingest import MAX_CHUNK_SIZE, MIN_CHUNK_SIZE, aiter_adaptive_chunks
+from image_store import ImageStore
+
+def make_png(color, size=8):
+    buffer = io.BytesIO()
+    Image.new('RGB', (size, size), color).save(buffer, 'PNG')
+    return buffer.getvalue()
+
+def test_other_instance_finds_image_before_flush(tmp_path):
+    a = ImageStore(str(tmp_path))
+    b = ImageStore(str(tmp_path))
+    b.stats()  # b has loaded its (empty) manifest already
+    stored = a.add(make_png('red'))
+
+    assert b.get_path(stored['sha256']) == stored['blob_path']
+    assert b.stats()['images'] == 1
+
+def test_flush_shares_entries_through_manifest(tmp_path):
+    a = ImageStore(str(tmp_path))
+    stored = a.add(make_png('red'))
+    a.flush()
+
+    with open(os.path.join(tmp_path, 'manifest.json')) as f:
+        assert stored['sha256'] in json.load(f)
+    assert ImageStore(str(tmp_path)).stats() == {'images': 1, 'bytes': stored['size']}
+
+def test_missing_image(tmp_path):
+    assert ImageStore(str(tmp_path)).get_path('0' * 64) is None
+
+def test_maintain_evicts_least_recently_used_over_quota(tmp_path):
+    store = ImageStore(str(tmp_path))
+    first = store.add(make_png('red'))
+    second = store.add(make_png('green'))
+    store.touch(first['sha256'])
+    store.max_bytes = first['size']
+    store.maintain()
+
+    assert os.path.exists(first['blob_path'])
+    assert not os.path.exists(second['blob_path'])
+    assert store.get_path(second['sha256']) is None
+
+def test_maintain_removes_old_unlisted_blobs(tmp_path):
+    # Recorded by a worker that died before flushing its manifest entries
+    dead = ImageStore(str(tmp_path)).add(make_png('blue'))
+    recent = ImageStore(str(tmp_path)).add(make_png('green'))
+    old = time.time() - image_store.ORPHAN_GRACE - 60
+    os.utime(dead['blob_path'], (old, old))
+    leftover = os.path.join(tmp_path, '.tmp_partial')
+    open(leftover, 'wb').close()
+    os.utime(leftover, (old, old))
+
+    ImageStore(str(tmp_path)).maintain()
+
+    assert not os.path.exists(dead['blob_path'])
+    assert not os.path.exists(leftover)
+    assert os.path.exists(recent['blob_path'])
+
+def test_async_download_chunks_grow_like_sync_ones():
+    class Response:
+        async def aiter_bytes(self):
+            for _ in range(1024):
+                yield b'x' * 4096
+
+    async def collect():
+        return [chunk async for chunk in aiter_adaptive_chunks(Response())]
+
+    chunks = asyncio.run(collect())
+    sizes = [len(chunk) for chunk in chunks]
+    assert sum(sizes) == 1024 * 4096
+    assert sizes[:4] == [MIN_CHUNK_SIZE, 2 * MIN_CHUNK_SIZE, 4 * MIN_CHUNK_SIZE, 8 * MIN_CHUNK_SIZE]
+    assert max(sizes) == MAX_CHUNK_SIZE
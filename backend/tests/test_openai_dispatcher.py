@@ -0,0 +1,37 @@
+import pytest
+
+from openai_dispatcher import OpenAIDispatcher, OpenAIOverloadedError, TokenBucket
+
+def test_bucket_allows_its_capacity_at_once():
+    bucket = TokenBucket(capacity=3, per_minute=60)
+    for _ in range(3):
+        assert bucket.start_time(1, 100.0) == 100.0
+        bucket.reserve(1, 100.0)
+    # Then one token a second
+    assert bucket.start_time(1, 100.0) == pytest.approx(101.0)
+
+def test_bucket_refills_over_time():
+    bucket = TokenBucket(capacity=2, per_minute=60)
+    bucket.reserve(2, 100.0)
+    assert bucket.start_time(2, 100.0) == pytest.approx(102.0)
+    assert bucket.start_time(1, 101.5) == 101.5
+
+def test_bucket_caps_costs_at_capacity():
+    bucket = TokenBucket(capacity=2, per_minute=60)
+    assert bucket.start_time(10, 100.0) == 100.0
+    bucket.reserve(10, 100.0)
+    assert bucket.full_at == pytest.approx(102.0)
+
+def test_bucket_adjust_corrects_a_reservation():
+    bucket = TokenBucket(capacity=10, per_minute=60)
+    bucket.reserve(10, 100.0)
+    bucket.adjust(-5)
+    assert bucket.start_time(5, 100.0) == pytest.approx(100.0)
+
+def test_dispatcher_rejects_calls_past_their_deadline():
+    dispatcher = OpenAIDispatcher(rpm=6, tpm=1_000_000, deadline=1)
+    # One request of burst, then one every 10 seconds
+    assert dispatcher.reserve(10) == 0
+    with pytest.raises(OpenAIOverloadedError) as rejected:
+        dispatcher.reserve(10)
+    assert rejected.value.retry_after > 1
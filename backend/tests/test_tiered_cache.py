@@ -0,0 +1,77 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import tiered_cache
+from tiered_cache import LocalCache, make_cache
+
+def test_local_cache_expires_and_evicts():
+    cache = LocalCache(max_entries=2)
+    cache.set('a', 1, ttl=0.05)
+    cache.set('b', 2, ttl=10)
+    cache.set('c', 3, ttl=10)
+    assert cache.get('a') is None
+    time.sleep(0.06)
+    assert cache.get('b') == 2
+
+def test_replicas_share_values(fake_cache):
+    a = make_cache(fake_cache.url)
+    b = make_cache(fake_cache.url)
+    a.set('json', {'answer': [1, 2]}, ttl=10)
+    a.set('bytes', b'\0\xffimage', ttl=10, local=False)
+
+    assert b.get('json') == {'answer': [1, 2]}
+    assert b.get('bytes', local=False) == b'\0\xffimage'
+    a.delete('json')
+    assert b.get('json', local=False) is None
+
+def test_lock_is_exclusive_and_only_released_by_its_holder(fake_cache):
+    a = make_cache(fake_cache.url)
+    b = make_cache(fake_cache.url)
+    token = a.acquire('job', ttl=0.05)
+    assert token is not None
+    assert b.acquire('job') is None
+
+    # a's lock expires and b takes it; a's late release must not free b's lock
+    time.sleep(0.1)
+    b_token = b.acquire('job', ttl=10)
+    assert b_token is not None
+    a.release('job', token)
+    assert a.acquire('job') is None
+
+    b.release('job', b_token)
+    assert a.acquire('job') is not None
+
+def test_get_or_set_produces_once_across_replicas(fake_cache):
+    replicas = [make_cache(fake_cache.url) for _ in range(4)]
+    calls = []
+    calls_lock = threading.Lock()
+
+    def produce():
+        with calls_lock:
+            calls.append(1)
+        time.sleep(0.2)
+        return {'value': 42}
+
+    with ThreadPoolExecutor(len(replicas)) as pool:
+        results = list(pool.map(lambda cache: cache.get_or_set('key', produce, ttl=10, wait=5), replicas))
+
+    assert results == [{'value': 42}] * len(replicas)
+    assert len(calls) == 1
+
+def test_works_locally_when_shared_tier_is_down(fake_cache, monkeypatch):
+    cache = make_cache(fake_cache.url)
+    fake_cache.stop()
+    monkeypatch.setattr(tiered_cache, 'SHARED_RETRY', 10)
+
+    cache.set('key', 'value', ttl=10)
+    assert cache.get('key') == 'value'
+    assert cache.acquire('lock') is not None
+    assert cache.get_or_set('other', lambda: 'made', ttl=10) == 'made'
+
+def test_local_only_cache():
+    cache = make_cache(None)
+    assert not cache.shared
+    cache.set('key', [1], ttl=10)
+    assert cache.get('key') == [1]
+    assert cache.get('key', local=False) is None
@@ -0,0 +1,293 @@
+import json
+import logging
+import socket
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from urllib.parse import urlsplit
+
+import telemetry
+
+logger = logging.getLogger(__name__)
+
+# Entries kept by the in-process tier, and the longest (seconds) it keeps a value
+# it read from the shared tier, which bounds how stale a replica can be
+LOCAL_MAX_ENTRIES = 2048
+LOCAL_TTL = 60
+
+# Socket timeout (seconds) and idle connections kept per shared cache client
+RESP_TIMEOUT = 1.0
+RESP_MAX_IDLE = 8
+
+# Seconds the shared tier is skipped after a connection error
+SHARED_RETRY = 10
+
+# How long (seconds) a lock for producing a value is held at most, and how often
+# a replica waiting for another one's value checks for it
+PRODUCE_LOCK_TTL = 60
+PRODUCE_POLL_INTERVAL = 0.1
+
+# Deletes a lock only while it still holds our token, atomically on the server
+RELEASE_SCRIPT = "if redis.call('GET', KEYS[1]) == ARGV[1] then return redis.call('DEL', KEYS[1]) else return 0 end"
+
+class RespError(Exception):
+    """Error reply from a Redis-compatible server"""
+
+class LocalCache:
+    """In-process LRU cache with a per-entry TTL"""
+
+    def __init__(self, max_entries=LOCAL_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if entry[1] < time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return entry[0]
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self.entries[key] = (value, time.monotonic() + ttl)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self.entries.pop(key, None)
+
+class RespClient:
+    """Minimal client for the Redis protocol (RESP2) with a small connection pool"""
+
+    def __init__(self, host='127.0.0.1', port=6379, db=0, password=None, timeout=RESP_TIMEOUT):
+        self.host = host
+        self.port = port
+        self.db = db
+        self.password = password
+        self.timeout = timeout
+        self.idle = []
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_url(cls, url, **kwargs):
+        """Client for a redis://[:password@]host[:port][/db] URL"""
+        parts = urlsplit(url)
+        db = parts.path.strip('/')
+        return cls(parts.hostname or '127.0.0.1', parts.port or 6379, int(db) if db else 0,
+                   parts.password, **kwargs)
+
+    def _connect(self):
+        sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        conn = (sock, sock.makefile('rb'))
+        try:
+            if self.password:
+                self._call(conn, ('AUTH', self.password))
+            if self.db:
+                self._call(conn, ('SELECT', self.db))
+        except Exception:
+            self._close(conn)
+            raise
+        return conn
+
+    def _close(self, conn):
+        try:
+            conn[1].close()
+            conn[0].close()
+        except OSError:
+            pass
+
+    def _call(self, conn, args):
+        message = [f"*{len(args)}\r\n".encode()]
+        for arg in args:
+            if not isinstance(arg, bytes):
+                arg = str(arg).encode('utf-8')
+            message.append(b'$%d\r\n%s\r\n' % (len(arg), arg))
+        conn[0].sendall(b''.join(message))
+        return self._read_reply(conn[1])
+
+    def _read_reply(self, rfile):
+        line = rfile.readline()
+        if not line.endswith(b'\r\n'):
+            raise ConnectionError("Connection closed by the cache server")
+        kind, payload = line[:1], line[1:-2]
+        if kind == b'+':
+            return payload.decode('utf-8')
+        if kind == b'-':
+            raise RespError(payload.decode('utf-8'))
+        if kind == b':':
+            return int(payload)
+        if kind == b'$':
+            length = int(payload)
+            if length < 0:
+                return None
+            data = rfile.read(length + 2)
+            if len(data) != length + 2:
+                raise ConnectionError("Connection closed by the cache server")
+            return data[:-2]
+        if kind == b'*':
+            length = int(payload)
+            return None if length < 0 else [self._read_reply(rfile) for _ in range(length)]
+        raise ConnectionError(f"Unexpected reply from the cache server: {line[:20]!r}")
+
+    def execute(self, *args):
+        """Send one command and return its reply (bytes, str, int, list or None)"""
+        with self._lock:
+            conn = self.idle.pop() if self.idle else None
+        if conn is None:
+            conn = self._connect()
+        try:
+            reply = self._call(conn, args)
+        except RespError:
+            self._release(conn)
+            raise
+        except Exception:
+            # The connection may be out of sync with the server: drop it
+            self._close(conn)
+            raise
+        self._release(conn)
+        return reply
+
+    def _release(self, conn):
+        with self._lock:
+            if len(self.idle) < RESP_MAX_IDLE:
+                self.idle.append(conn)
+                return
+        self._close(conn)
+
+def encode_value(value):
+    """Bytes go to the shared tier as they are (marked by a NUL prefix), anything else as JSON"""
+    if isinstance(value, bytes):
+        return b'\0' + value
+    return json.dumps(value, separators=(',', ':')).encode('utf-8')
+
+def decode_value(data):
+    if data[:1] == b'\0':
+        return data[1:]
+    return json.loads(data)
+
+class TieredCache:
+    """Cache with an in-process LRU tier and an optional shared tier on a
+    Redis-compatible server, which every replica of the backend reads and writes.
+
+    Values are JSON-serializable data or bytes. The shared tier is best effort: when
+    it is unreachable, lookups fall through to the local tier (and then miss) and
+    it is skipped for SHARED_RETRY seconds.
+    """
+
+    def __init__(self, client=None, prefix='federwi:', local=None, local_ttl=LOCAL_TTL):
+        self.client = client
+        self.prefix = prefix
+        self.local = local or LocalCache()
+        self.local_ttl = local_ttl
+        self._shared_down_until = 0
+
+    def _shared(self, *args):
+        """Run a command on the shared tier; returns (ok, reply)"""
+        if self.client is None or time.monotonic() < self._shared_down_until:
+            return False, None
+        with telemetry.span('cache', target='shared') as span:
+            try:
+                return True, self.client.execute(*args)
+            except (OSError, RespError) as e:
+                span['status'] = 'error'
+                if not isinstance(e, RespError):
+                    self._shared_down_until = time.monotonic() + SHARED_RETRY
+                logger.warning("Shared cache error: %s", e)
+                return False, None
+
+    @property
+    def shared(self):
+        """Whether a shared tier is configured"""
+        return self.client is not None
+
+    def get(self, key, local=True):
+        """A cached value, or None. With local=False, only the shared tier is used."""
+        if local:
+            value = self.local.get(key)
+            telemetry.record_cache('local_tier', value is not None)
+            if value is not None:
+                return value
+        ok, data = self._shared('GET', self.prefix + key)
+        if not ok:
+            return None
+        telemetry.record_cache('shared_tier', data is not None)
+        if data is None:
+            return None
+        value = decode_value(data)
+        if local:
+            self.local.set(key, value, self.local_ttl)
+        return value
+
+    def set(self, key, value, ttl, local=True):
+        """Store a value for `ttl` seconds. local=False keeps it out of process memory (e.g. image bytes)."""
+        if local:
+            self.local.set(key, value, min(ttl, self.local_ttl) if self.shared else ttl)
+        self._shared('SET', self.prefix + key, encode_value(value), 'PX', max(1, int(ttl * 1000)))
+
+    def delete(self, key):
+        self.local.delete(key)
+        self._shared('DEL', self.prefix + key)
+
+    def acquire(self, key, ttl=PRODUCE_LOCK_TTL):
+        """Take a lock shared by every replica; returns its token, or None if another
+        replica holds it. Without a (reachable) shared tier, it is always granted."""
+        token = uuid.uuid4().hex
+        ok, reply = self._shared('SET', self.prefix + 'lock:' + key, token, 'NX', 'PX', int(ttl * 1000))
+        if ok and reply is None:
+            return None
+        return token
+
+    def release(self, key, token):
+        """Release a lock taken with acquire() unless it has already expired and passed on"""
+        self._shared('EVAL', RELEASE_SCRIPT, 1, self.prefix + 'lock:' + key, token)
+
+    def wait_for(self, key, timeout):
+        """Wait for another replica to store a value; returns it, or None once its
+        lock is gone without a value or the timeout passes"""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            time.sleep(PRODUCE_POLL_INTERVAL)
+            value = self.get(key)
+            if value is not None:
+                return value
+            ok, exists = self._shared('EXISTS', self.prefix + 'lock:' + key)
+            if not ok or not exists:
+                return self.get(key)
+        return None
+
+    def get_or_set(self, key, producer, ttl, wait=PRODUCE_LOCK_TTL):
+        """Return the cached value, or produce it once across replicas.
+
+        The replica that takes the key's lock calls `producer()` and stores its
+        result (unless None); the others wait up to `wait` seconds for that result
+        and get None if the producer failed.
+        """
+        value = self.get(key)
+        if value is not None:
+            return value
+
+        token = self.acquire(key, ttl=wait)
+        if token is None:
+            return self.wait_for(key, wait)
+        try:
+            value = producer()
+            if value is not None:
+                self.set(key, value, ttl)
+            return value
+        finally:
+            self.release(key, token)
+
+def make_cache(url=None, **kwargs):
+    """Tiered cache sharing values through the server at `url` (redis://...), or a
+    local-only one without a URL"""
+    client = RespClient.from_url(url) if url else None
+    return TieredCache(client, **kwargs)
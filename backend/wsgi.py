@@ -0,0 +1,13 @@
+"""Production WSGI entry point.
+
+Run from the repository root (runtime paths like backend/cache are relative to it):
+    gunicorn -c backend/gunicorn.conf.py
+
+With preload_app, the gunicorn master imports this module, builds the app and
+loads shared state once; workers fork from it warm instead of each paying the
+imports and cache loads themselves.
+"""
+from app import create_app, preload
+
+preload()
+app = create_app()